@@ -22,9 +22,9 @@ void check_nargs(int narg, int keops_nminargs) {
                 + " in formula.");
 }
 
-void check_tag(int tag, std::string msg) {
-  if ((tag < 0) || (tag > 1)) {
-    keops_error("[KeOps] tag" + msg + " should be (0 or 1) but is " + std::to_string(tag));
+void check_tag(int tag, std::string msg, int max_tag) {
+  if ((tag < 0) || (tag > max_tag)) {
+    keops_error("[KeOps] tag" + msg + " should be between 0 and " + std::to_string(max_tag) + " but is " + std::to_string(tag));
   }
 }
 
@@ -32,13 +32,30 @@ template< typename array_t >
 void check_contiguity(array_t &obj_ptr, int i) {
   if (!is_contiguous(obj_ptr)) {
     keops_error("[Keops] Arg at position " + std::to_string(i) + ": is not contiguous. "
-                + "Please provide 'contiguous' dara array, as KeOps does not support strides. "
+                + "Please provide 'contiguous' dara array, as KeOps only supports strides with the dense 'CPU' backend. "
                 + "If you're getting this error in the 'backward' pass of a code using torch.sum() "
                 + "on the output of a KeOps routine, you should consider replacing 'a.sum()' with "
                 + "'torch.dot(a.view(-1), torch.ones_like(a).view(-1))'. ");
   }
 }
 
+template< typename array_t >
+void check_out(array_t &out, int* shape_out, int nbatchdims) {
+  std::string expected = "(", given = "(";
+  bool ok = (get_ndim(out) == nbatchdims + 2);
+  for (int l = 0; l < nbatchdims + 2; l++)
+    expected += std::to_string(shape_out[l]) + ((l < nbatchdims + 1) ? ", " : ")");
+  for (int l = 0; l < get_ndim(out); l++) {
+    given += std::to_string(get_size(out, l)) + ((l < get_ndim(out) - 1) ? ", " : "");
+    ok = ok && (get_size(out, l) == shape_out[l]);
+  }
+  given += ")";
+  if (!ok)
+    keops_error("[KeOps] The 'out' argument should be of shape " + expected + " but is of shape " + given + ".");
+  if (!is_contiguous(out))
+    keops_error("[KeOps] The 'out' argument should be a contiguous array.");
+}
+
 
 template< typename array_t >
 // This class contains get the sizes of the input args of a formula.
@@ -61,7 +78,10 @@ public:
     // [ 1, .., 1, M, 1, D_5  ]  ->      (we'll just ask users to fill in the shapes with *explicit* ones)
     fill_shape(_nargs, args);
 
+    strided = false;
+    _strides.resize(2 * _nargs, 0);
     check_ranges(_nargs, args);
+    strides = &_strides[0];
 
     shapes = &_shapes[0];
    
@@ -104,6 +124,11 @@ public:
   int* shapes;
   std::vector< int > _shape_out;
   int* shape_out;
+
+  // strides of the lines and columns of the args, used if some of them are not contiguous
+  bool strided;
+  std::vector< int > _strides;
+  int* strides;
   
   // methods
 
@@ -113,6 +138,8 @@ private:
   void fill_shape(int nargs, array_t* args);
   
   void check_ranges(int nargs, array_t* args);
+
+  void check_strides(array_t &arg, int i, int line_pos, int col_pos);
   
   std::function< int(array_t, int, int) > get_size_batch;
   int MN_pos, D_pos;
@@ -241,7 +268,7 @@ void Sizes< array_t >::check_ranges(int nargs, array_t* args) {
                     + " but should be " + std::to_string(keops_dimsX[k]));
       }
   
-      check_contiguity(args[i], i);
+      check_strides(args[i], i, MN_pos, D_pos);
     }
       
     // Checks args in all the positions that correspond to "j" variables:
@@ -305,7 +332,7 @@ void Sizes< array_t >::check_ranges(int nargs, array_t* args) {
                     + " but should be " + std::to_string(keops_dimsY[k]));
       }
   
-      check_contiguity(args[i], i);
+      check_strides(args[i], i, MN_pos, D_pos);
     }
     
     for (int k = 0; k < keops_nvarsP; k++) {
@@ -328,13 +355,30 @@ void Sizes< array_t >::check_ranges(int nargs, array_t* args) {
                     + " : is " + std::to_string(dim_param)
                     + " but should be " + std::to_string(keops_dimsP[k]));
       }
-      check_contiguity(args[i], i);
+      check_strides(args[i], i, -1, nbatchdims);
     }
   }
   
   
 }
 
+
+// Non-contiguous arrays without batch dimensions are read in place by the dense Cpu routine,
+// with the strides (in number of elements) of their lines and columns: see load_strided.
+template< typename array_t >
+void Sizes< array_t >::check_strides(array_t &arg, int i, int line_pos, int col_pos) {
+  if (is_contiguous(arg)) {
+    _strides[2 * i] = (line_pos < 0) ? 0 : get_size(arg, col_pos);
+    _strides[2 * i + 1] = 1;
+  } else {
+    if (nbatchdims > 0)
+      check_contiguity(arg, i);
+    strided = true;
+    _strides[2 * i] = (line_pos < 0) ? 0 : get_stride(arg, line_pos);
+    _strides[2 * i + 1] = get_stride(arg, col_pos);
+  }
+}
+
 template< typename array_t >
 void Sizes< array_t >::switch_to_half2_indexing() {
     // special case of float16 inputs : because we use half2 type in Cuda codes, we need to divide by two nx, ny, and M, N, or D
@@ -3,6 +3,7 @@
 #include "binders/keops_cst.h"
 #include "binders/utils.h"
 #include "binders/checks.h"
+#include "binders/threads.h"
 
 extern "C" {
 int GetFormulaConstants(int*);
@@ -17,6 +18,10 @@ int GetDimsP(int*);
 #if !USE_HALF
 extern "C" {
 int CpuReduc(int, int, __TYPE__*, __TYPE__**);
+int CpuReduc_strided(int, int, __TYPE__*, __TYPE__**, int*);
+int CpuReduc_tiled(int, int, __TYPE__*, __TYPE__**);
+int CpuReduc_simd(int, int, __TYPE__*, __TYPE__**);
+int CpuReduc2D(int, int, __TYPE__*, __TYPE__**);
 int CpuReduc_ranges(int, int, int, int*, int, int, __INDEX__**, __TYPE__*, __TYPE__**);
 };
 #endif
@@ -151,9 +156,12 @@ array_t_out launch_keops(int tag1D2D,
                          int nargs,
                          array_t* args,
                          int nranges = 0,
-                         index_t* ranges = {}) {
+                         index_t* ranges = {},
+                         int num_threads = 0,
+                         int pin_threads = 0,
+                         array_t_out* out = nullptr) {
 							 
-  keops_binders::check_tag(tag1D2D, "1D2D");
+  keops_binders::check_tag(tag1D2D, "1D2D", (tagCpuGpu == 0) ? 3 : 1);
   keops_binders::check_tag(tagCpuGpu, "CpuGpu");
   keops_binders::check_tag(tagHostDevice, "HostDevice");
   
@@ -162,7 +170,12 @@ array_t_out launch_keops(int tag1D2D,
 
   Sizes< array_t > SS(nargs, args, nx, ny);
   
-  array_t_out result = (tagHostDevice == 0) ? allocate_result_array< array_t_out, __TYPE__ >(SS.shape_out, SS.nbatchdims)
+  // write the result in the user-provided buffer if any, in a new array otherwise
+  if (out != nullptr)
+    keops_binders::check_out(*out, SS.shape_out, SS.nbatchdims);
+
+  array_t_out result = (out != nullptr) ? *out
+                     : (tagHostDevice == 0) ? allocate_result_array< array_t_out, __TYPE__ >(SS.shape_out, SS.nbatchdims)
                                             : allocate_result_array_gpu< array_t_out, __TYPE__ >(SS.shape_out, SS.nbatchdims, deviceId_casted);
 
   __TYPE__* result_ptr = get_data< array_t_out, __TYPE__ >(result);
@@ -178,14 +191,41 @@ array_t_out launch_keops(int tag1D2D,
   for (int i = 0; i < nargs; i++)
     args_ptr[i] = get_data< array_t, __TYPE__ >(args[i]);
 
+  // number of threads of the Cpu reductions, and their affinity
+  CpuThreads threads((tagCpuGpu == 0) ? num_threads : 0, (tagCpuGpu == 0) ? pin_threads : 0);
+
   // Create a decimal word to avoid nested conditional below
   int decision = 1000 * RR.tagRanges + 100 * tagHostDevice + 10 * tagCpuGpu + tag1D2D;
 
+  // non-contiguous args are only supported by the dense Cpu routine, which reads them in place
+  if (SS.strided && (decision != 0))
+    for (int i = 0; i < nargs; i++)
+      keops_binders::check_contiguity(args[i], i);
+
   switch (decision) {
 
 #if !USE_HALF
     case 0: {
-      CpuReduc(SS.nx, SS.ny, result_ptr, args_ptr.data());
+      if (SS.strided)
+        CpuReduc_strided(SS.nx, SS.ny, result_ptr, args_ptr.data(), SS.strides);
+      else
+        CpuReduc(SS.nx, SS.ny, result_ptr, args_ptr.data());
+      return result;
+    }
+
+    // on the Cpu, tag1D2D selects the tiled (1), vectorized (2) or 2D (3) implementation
+    case 1: {
+      CpuReduc_tiled(SS.nx, SS.ny, result_ptr, args_ptr.data());
+      return result;
+    }
+
+    case 2: {
+      CpuReduc_simd(SS.nx, SS.ny, result_ptr, args_ptr.data());
+      return result;
+    }
+
+    case 3: {
+      CpuReduc2D(SS.nx, SS.ny, result_ptr, args_ptr.data());
       return result;
     }
 #endif
@@ -227,7 +267,10 @@ array_t_out launch_keops(int tag1D2D,
     }
 
 #if !USE_HALF    
-    case 1000: {
+    case 1000:
+    case 1001:
+    case 1002:
+    case 1003: {
       CpuReduc_ranges(SS.nx, SS.ny, SS.nbatchdims, SS.shapes,
                       RR.nranges_x, RR.nranges_y, RR.castedranges,
                       result_ptr, args_ptr.data());
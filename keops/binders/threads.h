@@ -0,0 +1,96 @@
+#pragma once
+
+#include <vector>
+
+#ifdef USE_OPENMP
+#include <omp.h>
+#endif
+
+#if defined(USE_OPENMP) && defined(__linux__)
+#include <sched.h>
+#endif
+
+namespace keops_binders {
+
+/////////////////////////////////////////////////////////////////////////////////
+//                    Threads of the Cpu reductions
+/////////////////////////////////////////////////////////////////////////////////
+
+#if defined(USE_OPENMP) && defined(__linux__)
+// cpus on which the process may run, as given by its affinity mask at the first call
+static const std::vector< int >& allowed_cpus() {
+  static const std::vector< int > cpus = [] {
+    std::vector< int > res;
+    cpu_set_t mask;
+    CPU_ZERO(&mask);
+    if (sched_getaffinity(0, sizeof(mask), &mask) == 0)
+      for (int cpu = 0; cpu < CPU_SETSIZE; cpu++)
+        if (CPU_ISSET(cpu, &mask))
+          res.push_back(cpu);
+    return res;
+  }();
+  return cpus;
+}
+#endif
+
+// Sets the number of OpenMP threads used by the reductions launched from the current thread
+// (num_threads > 0, the OpenMP default otherwise) and, if pin_threads is non zero, binds the k-th
+// OpenMP thread to the k-th cpu allowed for the process (Linux only), until the object is destroyed.
+class CpuThreads {
+public:
+  CpuThreads(int num_threads, int pin_threads) {
+#ifdef USE_OPENMP
+    old_num_threads = omp_get_max_threads();
+    if (num_threads > 0)
+      omp_set_num_threads(num_threads);
+#if defined(__linux__)
+    const std::vector< int >& cpus = allowed_cpus();
+    if (pin_threads && !cpus.empty()) {
+      // each thread of the team saves its own affinity mask, restored by the destructor
+      // (empty masks are not restored: threads that were not pinned, e.g. if the team is smaller)
+      old_masks.resize(omp_get_max_threads());
+      for (cpu_set_t& old_mask : old_masks)
+        CPU_ZERO(&old_mask);
+#pragma omp parallel num_threads(old_masks.size())
+      {
+        int k = omp_get_thread_num();
+        if (sched_getaffinity(0, sizeof(cpu_set_t), &old_masks[k]) == 0) {
+          cpu_set_t mask;
+          CPU_ZERO(&mask);
+          CPU_SET(cpus[k % cpus.size()], &mask);
+          sched_setaffinity(0, sizeof(mask), &mask);
+        }
+      }
+    }
+#endif
+#endif
+  }
+
+  ~CpuThreads() {
+#ifdef USE_OPENMP
+#if defined(__linux__)
+    // OpenMP reuses the same threads for parallel regions of the same size: release them all,
+    // including the calling thread, which is the master thread of the regions
+    if (!old_masks.empty()) {
+#pragma omp parallel num_threads(old_masks.size())
+      {
+        int k = omp_get_thread_num();
+        if (CPU_COUNT(&old_masks[k]) > 0)
+          sched_setaffinity(0, sizeof(cpu_set_t), &old_masks[k]);
+      }
+    }
+#endif
+    omp_set_num_threads(old_num_threads);
+#endif
+  }
+
+private:
+#ifdef USE_OPENMP
+  int old_num_threads;
+#if defined(__linux__)
+  std::vector< cpu_set_t > old_masks;
+#endif
+#endif
+};
+
+}
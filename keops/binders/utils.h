@@ -20,7 +20,16 @@ _T* get_data(array_t obj_ptri);   // raw pointer to "a.data"
 template< typename array_t >
 __INDEX__* get_rangedata(array_t obj_ptri);  // raw pointer to "a.data", casted as integer
 template< typename array_t >
-bool is_contiguous(array_t obj_ptri);  // is "a" ordered properly? KeOps does *not* support strides!
+bool is_contiguous(array_t obj_ptri);  // is "a" ordered properly? Only the dense Cpu routine supports strides.
+
+template< typename array_t >
+int get_stride(array_t obj_ptri, int l) {  // a.stride(l), in number of elements
+  // default implementation for the binders that only handle contiguous arrays
+  int stride = 1;
+  for (int k = l + 1; k < get_ndim(obj_ptri); k++)
+    stride *= get_size(obj_ptri, k);
+  return stride;
+}
 
 
 template< typename array_t, typename _T >
@@ -55,7 +64,7 @@ short int cast_Device_Id(_T Device_Id) {
 const auto Error_msg_no_cuda =
     "[KeOps] This KeOps shared object has been compiled without cuda support: \n 1) to perform computations on CPU, simply set tagHostDevice to 0\n 2) to perform computations on GPU, please recompile the formula with a working version of cuda.";
 
-void check_tag(int tag, std::string msg);
+void check_tag(int tag, std::string msg, int max_tag = 1);
 
 void check_nargs(int nargs);
 
@@ -15,6 +15,44 @@ extern "C" int CpuReduc(int nx, int ny, __TYPE__* gamma, __TYPE__** args) {
   return Eval< F, CpuConv >::Run(nx, ny, gamma, args);
 }
 
+// same, with strided arrays which are read in place
+extern "C" int CpuReduc_strided(int nx, int ny, __TYPE__* gamma, __TYPE__** args, int* strides) {
+  return Eval< F, CpuConv >::Run(nx, ny, gamma, args, strides);
+}
+
+
+////////////////////////////////////////
+// Convolutions on Cpu, tiled version //
+////////////////////////////////////////
+
+#include "core/mapreduce/CpuConv_tiled.cpp"
+
+extern "C" int CpuReduc_tiled(int nx, int ny, __TYPE__* gamma, __TYPE__** args) {
+  return Eval< F, CpuConv_tiled >::Run(nx, ny, gamma, args);
+}
+
+
+/////////////////////////////////////////////
+// Convolutions on Cpu, vectorized along j //
+/////////////////////////////////////////////
+
+#include "core/mapreduce/CpuConv_simd.cpp"
+
+extern "C" int CpuReduc_simd(int nx, int ny, __TYPE__* gamma, __TYPE__** args) {
+  return Eval< F, CpuConv_simd >::Run(nx, ny, gamma, args);
+}
+
+
+/////////////////////////////////////////////////////
+// Convolutions on Cpu, parallelized along i and j //
+/////////////////////////////////////////////////////
+
+#include "core/mapreduce/CpuConv2D.cpp"
+
+extern "C" int CpuReduc2D(int nx, int ny, __TYPE__* gamma, __TYPE__** args) {
+  return Eval< F, CpuConv2D >::Run(nx, ny, gamma, args);
+}
+
 
 //////////////////////////////////////
 // Convolutions on Cpu, with ranges //
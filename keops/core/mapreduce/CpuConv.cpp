@@ -13,6 +13,7 @@
 #include "core/pack/GetInds.h"
 #include "core/pack/Load.h"
 #include "core/pack/Call.h"
+#include "core/mapreduce/CpuConv2D.cpp"
 
 // Host implementation of the convolution, for comparison
 
@@ -20,7 +21,7 @@ namespace keops {
 
 struct CpuConv {
   template < typename TYPE, class FUN >
-  static int CpuConv_(FUN fun, int nx, int ny, TYPE *out, TYPE **args) {
+  static int CpuConv_(FUN fun, int nx, int ny, TYPE *out, TYPE **args, int *strides = nullptr) {
     typedef typename FUN::DIMSX DIMSX; // dimensions of "i" indexed variables
     typedef typename FUN::DIMSY DIMSY; // dimensions of "j" indexed variables
     typedef typename FUN::DIMSP DIMSP; // dimensions of parameters variables
@@ -33,8 +34,13 @@ struct CpuConv {
     const int DIMOUT = FUN::DIM; // dimension of output variable
     const int DIMRED = FUN::DIMRED; // dimension of reduction operation
     const int DIMFOUT = FUN::F::DIM; // dimension of output variable of inner function
+
+    // with few output lines, split the reduction between the threads
+    if (CpuConv2D::Use2D(nx, ny))
+      return CpuConv2D::CpuConv2D_(fun, nx, ny, out, args, strides);
+
     TYPE pp[DIMP];
-    load< DIMSP, INDSP >(0, pp, args);
+    if (strides) load_strided< DIMSP, INDSP >(0, pp, args, strides); else load< DIMSP, INDSP >(0, pp, args);
 
 #pragma omp parallel for 
     for (int i = 0; i < nx; i++) {
@@ -48,7 +54,7 @@ struct CpuConv {
     const int DIM_KAHAN = FUN::template KahanScheme<__TYPEACC__,TYPE>::DIMACC;
     TYPE tmp[DIM_KAHAN];
 #endif
-      load< DIMSX, INDSI >(i, xi, args);
+      if (strides) load_strided< DIMSX, INDSI >(i, xi, args, strides); else load< DIMSX, INDSI >(i, xi, args);
       typename FUN::template InitializeReduction< __TYPEACC__, TYPE >()(acc);   // acc = 0
 #if SUM_SCHEME == BLOCK_SUM
       typename FUN::template InitializeReduction< TYPE, TYPE >()(tmp);   // tmp = 0
@@ -56,7 +62,7 @@ struct CpuConv {
       VectAssign<DIM_KAHAN>(tmp,0.0f);
 #endif
       for (int j = 0; j < ny; j++) {
-        load< DIMSY, INDSJ >(j, yj, args);
+        if (strides) load_strided< DIMSY, INDSJ >(j, yj, args, strides); else load< DIMSY, INDSJ >(j, yj, args);
         call< DIMSX, DIMSY, DIMSP >(fun, fout, xi, yj, pp);
 #if SUM_SCHEME == BLOCK_SUM
         typename FUN::template ReducePairShort< TYPE, TYPE >()(tmp, fout, j); // tmp += fout
@@ -93,5 +99,11 @@ struct CpuConv {
   static int Eval(FUN fun, int nx, int ny, TYPE *out, TYPE **pargs) {
     return CpuConv_(fun, nx, ny, out, pargs);
   }
+
+// Idem, with arrays that are read in place with the strides of their lines and columns (see load_strided).
+  template < typename TYPE, class FUN >
+  static int Eval(FUN fun, int nx, int ny, TYPE *out, TYPE **pargs, int *strides) {
+    return CpuConv_(fun, nx, ny, out, pargs, strides);
+  }
 };
 }
@@ -0,0 +1,176 @@
+#pragma once
+
+#include <stdio.h>
+#include <assert.h>
+#include <vector>
+#include <algorithm>
+
+#include "core/utils/TypesUtils.h"
+
+#ifdef USE_OPENMP
+#include <omp.h>
+#endif
+
+#include "core/pack/GetInds.h"
+#include "core/pack/Load.h"
+#include "core/pack/Call.h"
+
+// Host implementation of the convolution, parallelized along both the i and j indices.
+//
+// CpuConv only distributes the output lines between the threads: when nx is small (e.g. a few
+// queries against a large dataset), most of the threads are idle. As in GpuConv2D, the range of j
+// is here split in blocks: for each block, the threads compute the partial reductions of all the
+// lines, which are then merged with the ReducePair operation of the reduction. The partial
+// reductions are stored with the type of the accumulator, so that a float32 reduction with a float64
+// accumulator is not rounded at each block boundary.
+//
+// N.B.: with the Kahan summation scheme, the compensation term of each block is not carried over to
+// the next one (the blocks are computed in parallel), so that CpuConv does not switch automatically
+// to this scheme when SUM_SCHEME == KAHAN_SCHEME.
+
+// number of blocks of "j" indices per thread, for the load balancing
+#ifndef CPU_2D_BLOCKS_PER_THREAD
+#define CPU_2D_BLOCKS_PER_THREAD 4
+#endif
+
+// minimum number of "j" indices in each block
+#ifndef CPU_2D_MIN_BLOCK_SIZE_J
+#define CPU_2D_MIN_BLOCK_SIZE_J 1024
+#endif
+
+// CpuConv switches to this scheme when there are less than CPU_2D_LINES_PER_THREAD lines per thread
+#ifndef CPU_2D_LINES_PER_THREAD
+#define CPU_2D_LINES_PER_THREAD 4
+#endif
+
+namespace keops {
+
+struct CpuConv2D {
+  // number of blocks of "j" indices used for a reduction of ny values
+  static int NBlocksJ(int ny) {
+#ifdef USE_OPENMP
+    const int nthreads = omp_get_max_threads();
+#else
+    const int nthreads = 1;
+#endif
+    return std::max(1, std::min(nthreads * CPU_2D_BLOCKS_PER_THREAD, ny / CPU_2D_MIN_BLOCK_SIZE_J));
+  }
+
+  // should CpuConv use the 2D scheme for a reduction of size nx * ny ?
+  static bool Use2D(int nx, int ny) {
+#if defined(USE_OPENMP) && (SUM_SCHEME != KAHAN_SCHEME)
+    return (nx < CPU_2D_LINES_PER_THREAD * omp_get_max_threads()) && (NBlocksJ(ny) > 1);
+#else
+    return false;
+#endif
+  }
+
+  template < typename TYPE, class FUN >
+  static int CpuConv2D_(FUN fun, int nx, int ny, TYPE *out, TYPE **args, int *strides = nullptr) {
+    typedef typename FUN::DIMSX DIMSX; // dimensions of "i" indexed variables
+    typedef typename FUN::DIMSY DIMSY; // dimensions of "j" indexed variables
+    typedef typename FUN::DIMSP DIMSP; // dimensions of parameters variables
+    typedef typename FUN::INDSI INDSI;
+    typedef typename FUN::INDSJ INDSJ;
+    typedef typename FUN::INDSP INDSP;
+    const int DIMX = DIMSX::SUM; // total size of "i" indexed variables
+    const int DIMY = DIMSY::SUM; // total size of "j" indexed variables
+    const int DIMP = DIMSP::SUM; // total size of parameters variables
+    const int DIMOUT = FUN::DIM; // dimension of output variable
+    const int DIMRED = FUN::DIMRED; // dimension of reduction operation
+    const int DIMFOUT = FUN::F::DIM; // dimension of output variable of inner function
+    TYPE pp[DIMP];
+    if (strides) load_strided< DIMSP, INDSP >(0, pp, args, strides); else load< DIMSP, INDSP >(0, pp, args);
+
+    const int nblocks_j = NBlocksJ(ny);
+    const int block_size_j = (ny + nblocks_j - 1) / nblocks_j;
+
+    // partial reductions of each block of "j" indices, as in GpuConv2D
+    std::vector< __TYPEACC__ > outB(nblocks_j * nx * DIMRED + 1);
+
+#pragma omp parallel for schedule(static) collapse(2)
+    for (int b = 0; b < nblocks_j; b++) {
+      for (int i = 0; i < nx; i++) {
+        const int jstart = b * block_size_j;
+        const int jend = std::min(ny, jstart + block_size_j);
+        TYPE fout[DIMFOUT], xi[DIMX], yj[DIMY];
+        __TYPEACC__ acc[DIMRED];
+#if SUM_SCHEME == BLOCK_SUM
+        // additional tmp vector to store intermediate results from each block
+        TYPE tmp[DIMRED];
+#elif SUM_SCHEME == KAHAN_SCHEME
+        // additional tmp vector to accumulate errors
+        const int DIM_KAHAN = FUN::template KahanScheme<__TYPEACC__,TYPE>::DIMACC;
+        TYPE tmp[DIM_KAHAN];
+#endif
+        if (strides) load_strided< DIMSX, INDSI >(i, xi, args, strides); else load< DIMSX, INDSI >(i, xi, args);
+        typename FUN::template InitializeReduction< __TYPEACC__, TYPE >()(acc);   // acc = 0
+#if SUM_SCHEME == BLOCK_SUM
+        typename FUN::template InitializeReduction< TYPE, TYPE >()(tmp);   // tmp = 0
+#elif SUM_SCHEME == KAHAN_SCHEME
+        VectAssign<DIM_KAHAN>(tmp,0.0f);
+#endif
+        for (int j = jstart; j < jend; j++) {
+          if (strides) load_strided< DIMSY, INDSJ >(j, yj, args, strides); else load< DIMSY, INDSJ >(j, yj, args);
+          call< DIMSX, DIMSY, DIMSP >(fun, fout, xi, yj, pp);
+#if SUM_SCHEME == BLOCK_SUM
+          typename FUN::template ReducePairShort< TYPE, TYPE >()(tmp, fout, j); // tmp += fout
+          if ((j+1)%200 == 0) {
+            typename FUN::template ReducePair< __TYPEACC__, TYPE >()(acc, tmp); // acc += tmp
+            typename FUN::template InitializeReduction< TYPE, TYPE >()(tmp);   // tmp = 0
+          }
+#elif SUM_SCHEME == KAHAN_SCHEME
+          typename FUN::template KahanScheme<__TYPEACC__,TYPE>()(acc, fout, tmp);
+#else
+          typename FUN::template ReducePairShort< __TYPEACC__, TYPE >()(acc, fout, j); // acc += fout
+#endif
+        }
+#if SUM_SCHEME == BLOCK_SUM
+        typename FUN::template ReducePair< __TYPEACC__, TYPE >()(acc, tmp); // acc += tmp
+#endif
+        for (int k = 0; k < DIMRED; k++)
+          outB[(b * nx + i) * DIMRED + k] = acc[k];
+      }
+    }
+
+    // final pass: reduction of the partial results of the blocks, in the order of the "j" indices
+#pragma omp parallel for schedule(static)
+    for (int i = 0; i < nx; i++) {
+      __TYPEACC__ acc[DIMRED];
+#if SUM_SCHEME == KAHAN_SCHEME
+      // compensated merge of the partial reductions
+      const int DIM_KAHAN = FUN::template KahanScheme<__TYPEACC__,__TYPEACC__>::DIMACC;
+      __TYPEACC__ tmp[DIM_KAHAN];
+      VectAssign<DIM_KAHAN>(tmp,0.0f);
+#endif
+      typename FUN::template InitializeReduction< __TYPEACC__, TYPE >()(acc);   // acc = 0
+      for (int b = 0; b < nblocks_j; b++) {
+#if SUM_SCHEME == KAHAN_SCHEME
+        typename FUN::template KahanScheme< __TYPEACC__, __TYPEACC__ >()(acc, outB.data() + (b * nx + i) * DIMRED, tmp);
+#else
+        typename FUN::template ReducePair< __TYPEACC__, __TYPEACC__ >()(acc, outB.data() + (b * nx + i) * DIMRED); // acc += outB[b, i]
+#endif
+      }
+      typename FUN::template FinalizeOutput< __TYPEACC__, TYPE >()(acc, out + i * DIMOUT, i);
+    }
+
+    return 0;
+  }
+
+// Wrapper with an user-friendly input format for px and py.
+  template < typename TYPE, class FUN, typename... Args >
+  static int Eval(FUN fun, int nx, int ny, TYPE *out, Args... args) {
+    static const int Nargs = sizeof...(Args);
+    TYPE *pargs[Nargs];
+    unpack(pargs, args...);
+    return CpuConv2D_(fun, nx, ny, out, pargs);
+  }
+
+// Idem, but with args given as an array of arrays, instead of an explicit list of arrays.
+  template < typename TYPE, class FUN >
+  static int Eval(FUN fun, int nx, int ny, TYPE *out, TYPE **pargs) {
+    return CpuConv2D_(fun, nx, ny, out, pargs);
+  }
+};
+
+}
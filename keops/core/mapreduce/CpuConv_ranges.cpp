@@ -3,6 +3,7 @@
 #include <stdio.h>
 #include <assert.h>
 #include <vector>
+#include <algorithm>
 
 #ifdef USE_OPENMP
 #include <omp.h>
@@ -17,6 +18,11 @@
 
 // Host implementation of the convolution, for comparison
 
+// number of work items per thread, for the load balancing between the ranges
+#ifndef CPU_RANGES_CHUNKS_PER_THREAD
+#define CPU_RANGES_CHUNKS_PER_THREAD 8
+#endif
+
 namespace keops {
 
 struct CpuConv_ranges {
@@ -76,8 +82,9 @@ struct CpuConv_ranges {
     load< DIMSP, INDSP >(0, pp, args);  // If nbatchdims == 0, the parameters are fixed once and for all
         
     // Set the output to zero, as the ranges may not cover the full output -----
-    __TYPEACC__ acctmp[DIMRED];
+#pragma omp parallel for
     for (int i = 0; i < nx; i++) {
+      __TYPEACC__ acctmp[DIMRED];
       typename FUN::template InitializeReduction< __TYPEACC__, TYPE >()(acctmp);
       typename FUN::template FinalizeOutput< __TYPEACC__, TYPE >()(acctmp, out + i * DIMOUT, i);
     }
@@ -94,18 +101,61 @@ struct CpuConv_ranges {
     __INDEX__* slices_x = FUN::tagJ ? ranges[1] : ranges[4];
     __INDEX__* ranges_y = FUN::tagJ ? ranges[2] : ranges[5];
 
-    int indices_i[SIZEI], indices_j[SIZEJ], indices_p[SIZEP];  // Buffers for the "broadcasted indices"
-    for (int k = 0; k < SIZEI; k++) { indices_i[k] = 0; }  // Fill the "offsets" with zeroes,
-    for (int k = 0; k < SIZEJ; k++) { indices_j[k] = 0; }  // the default value when nbatchdims == 0.
-    for (int k = 0; k < SIZEP; k++) { indices_p[k] = 0; }
-    
+    // Work items: the ranges of "i" lines are cut into chunks of similar costs, i.e. numbers of (i,j) pairs.
+    // All the chunks are processed in a single parallel region, from the most to the least costly one,
+    // and dynamically distributed between the threads: small clusters do not pay for a parallel region each,
+    // and large ones do not leave the other threads idle.
+    struct Chunk {
+      int range_index;
+      __INDEX__ start_i, end_i;
+      long cost;
+    };
+    std::vector< Chunk > chunks;
+    std::vector< long > costs_line(nranges);
+    long total_cost = 0;
+    for (int range_index = 0; range_index < nranges; range_index++) {
+      __INDEX__ start_slice = (range_index < 1) ? 0 : slices_x[range_index - 1];
+      __INDEX__ end_slice = slices_x[range_index];
+      long cost_line = 1;  // also count the loading and finalization of the line
+      for (__INDEX__ slice = start_slice; slice < end_slice; slice++)
+        cost_line += ranges_y[2 * slice + 1] - ranges_y[2 * slice];
+      costs_line[range_index] = cost_line;
+      total_cost += cost_line * (ranges_x[2 * range_index + 1] - ranges_x[2 * range_index]);
+    }
+#ifdef USE_OPENMP
+    const int nthreads = omp_get_max_threads();
+#else
+    const int nthreads = 1;
+#endif
+    const long target_cost = std::max(1L, total_cost / (CPU_RANGES_CHUNKS_PER_THREAD * nthreads));
     for (int range_index = 0; range_index < nranges; range_index++) {
-
       __INDEX__ start_x = ranges_x[2 * range_index];
       __INDEX__ end_x = ranges_x[2 * range_index + 1];
+      long cost_line = costs_line[range_index];
+      __INDEX__ lines_per_chunk = std::max(1L, target_cost / cost_line);
+      for (__INDEX__ start_i = start_x; start_i < end_x; start_i += lines_per_chunk) {
+        __INDEX__ end_i = std::min(end_x, start_i + lines_per_chunk);
+        chunks.push_back({ range_index, start_i, end_i, cost_line * (end_i - start_i) });
+      }
+    }
+    std::stable_sort(chunks.begin(), chunks.end(), [](const Chunk &a, const Chunk &b) { return a.cost > b.cost; });
+    const int nchunks = chunks.size();
+
+#pragma omp parallel for schedule(dynamic, 1)
+    for (int chunk_index = 0; chunk_index < nchunks; chunk_index++) {
+      int range_index = chunks[chunk_index].range_index;
+
+      __INDEX__ start_x = ranges_x[2 * range_index];
   
       __INDEX__ start_slice = (range_index < 1) ? 0 : slices_x[range_index - 1];
       __INDEX__ end_slice = slices_x[range_index];
+
+      TYPE ppr[DIMP];  // parameters of the range
+      int indices_i[SIZEI], indices_j[SIZEJ], indices_p[SIZEP];  // Buffers for the "broadcasted indices"
+      for (int k = 0; k < SIZEI; k++) { indices_i[k] = 0; }  // Fill the "offsets" with zeroes,
+      for (int k = 0; k < SIZEJ; k++) { indices_j[k] = 0; }  // the default value when nbatchdims == 0.
+      for (int k = 0; k < SIZEP; k++) { indices_p[k] = 0; }
+      for (int k = 0; k < DIMP; k++) { ppr[k] = pp[k]; }
   
       // If needed, compute the "true" start indices of the range, turning
       // the "abstract" index start_x into an array of actual "pointers/offsets" stored in indices_i:
@@ -113,11 +163,10 @@ struct CpuConv_ranges {
         vect_broadcast_index(start_x, nbatchdims, SIZEI, shapes, shapes_i, indices_i);
         // And for the parameters, too:
         vect_broadcast_index(range_index, nbatchdims, SIZEP, shapes, shapes_p, indices_p);
-        load< DIMSP, INDSP >(0, pp, args, indices_p); // Load the paramaters, once per tile
+        load< DIMSP, INDSP >(0, ppr, args, indices_p); // Load the paramaters, once per tile
       }
 
-#pragma omp parallel for   
-      for (__INDEX__ i = start_x; i < end_x; i++) {
+      for (__INDEX__ i = chunks[chunk_index].start_i; i < chunks[chunk_index].end_i; i++) {
         TYPE xi[DIMX], yj[DIMY], fout[DIMFOUT];
         __TYPEACC__ acc[DIMRED];
 #if SUM_SCHEME == BLOCK_SUM
@@ -152,7 +201,7 @@ struct CpuConv_ranges {
           if (nbatchdims == 0) {
             for (int j = start_y; j < end_y; j++) {
               load< DIMSY, INDSJ >(j, yj, args);
-              call< DIMSX, DIMSY, DIMSP >(fun, fout, xi, yj, pp);
+              call< DIMSX, DIMSY, DIMSP >(fun, fout, xi, yj, ppr);
 #if SUM_SCHEME == BLOCK_SUM
               typename FUN::template ReducePairShort< TYPE, TYPE >()(tmp, fout, j); // tmp += fout
               if ((j+1)%200) {
@@ -169,7 +218,7 @@ struct CpuConv_ranges {
           else {
             for (int j = start_y; j < end_y; j++) {
               load< DIMSY, INDSJ >(j - start_y, yj, args, indices_j);
-              call< DIMSX, DIMSY, DIMSP >(fun, fout, xi, yj, pp);
+              call< DIMSX, DIMSY, DIMSP >(fun, fout, xi, yj, ppr);
 #if SUM_SCHEME == BLOCK_SUM
               typename FUN::template ReducePairShort< TYPE, TYPE >()(tmp, fout, j - start_y); // tmp += fout
               if ((j+1)%200) {
@@ -0,0 +1,93 @@
+#pragma once
+
+#include <algorithm>
+
+#include "core/mapreduce/CpuConv_tiled.cpp"
+
+// Host implementation of the convolution, vectorized along the j index.
+//
+// This is the tiled scheme of CpuConv_tiled, but the formula is evaluated on packs of CPU_SIMD_BYTES
+// bytes of consecutive "j" indices (e.g. 16 floats, i.e. one AVX-512 register or two AVX2 registers)
+// within an "omp simd" loop, so that the compiler maps the packs to the vector registers of the CPU.
+// The results are then reduced one after the other, in the order of the j indices, as in the scalar
+// version: the vectorization thus pays off for the formulas that are costly with respect to the
+// reduction, e.g. with an exponential, in low dimension.
+//
+// With gcc on x86_64, the evaluation function is compiled for AVX-512, AVX2 and the default
+// instruction set, and the best version is chosen at run time: the compiled modules thus remain
+// usable on any x86_64 machine. Note that the "j" variables are read with a stride of DIMY values:
+// with its generic tuning, gcc only vectorizes such loads in the AVX-512 version. Elsewhere (or
+// without OpenMP), the compiler chooses whether the loop on each pack is vectorized, and falls back
+// to scalar code otherwise.
+
+// size (in bytes) of the packs of "j" indices
+#ifndef CPU_SIMD_BYTES
+#define CPU_SIMD_BYTES 64
+#endif
+
+#if defined(__GNUC__) && !defined(__clang__) && defined(__x86_64__) && defined(__linux__)
+#define CPU_SIMD_TARGETS __attribute__((target_clones("avx512f", "avx2", "default")))
+#else
+#define CPU_SIMD_TARGETS
+#endif
+
+// The vectorized versions of the exponential, logarithm, sine and cosine functions of the GNU C
+// library (libmvec, accurate to a few ulps) are declared, so that the formulas which use them can be
+// vectorized.
+#if defined(__GNUC__) && !defined(__clang__) && defined(__x86_64__) && defined(__GLIBC__) && __GLIBC_PREREQ(2, 22)
+extern "C" {
+#pragma omp declare simd notinbranch
+float expf(float);
+#pragma omp declare simd notinbranch
+double exp(double);
+#pragma omp declare simd notinbranch
+float logf(float);
+#pragma omp declare simd notinbranch
+double log(double);
+#pragma omp declare simd notinbranch
+float sinf(float);
+#pragma omp declare simd notinbranch
+double sin(double);
+#pragma omp declare simd notinbranch
+float cosf(float);
+#pragma omp declare simd notinbranch
+double cos(double);
+}
+#endif
+
+namespace keops {
+
+struct CpuTileEval_simd : CpuTileEval {
+  template < typename TYPE >
+  static constexpr int Pack() { return (CPU_SIMD_BYTES / (int) sizeof(TYPE) > 1) ? CPU_SIMD_BYTES / (int) sizeof(TYPE) : 1; }
+
+  template < typename TYPE, class FUN, class REDUCE >
+  CPU_SIMD_TARGETS
+  static void Eval(FUN fun, int nj, int jstart, TYPE *xi, TYPE *yj, TYPE *pp, REDUCE reduce) {
+    typedef typename FUN::DIMSX DIMSX;
+    typedef typename FUN::DIMSY DIMSY;
+    typedef typename FUN::DIMSP DIMSP;
+    const int DIMY = DIMSY::SUM;
+    const int DIMFOUT = FUN::F::DIM;
+    const int PACK = Pack< TYPE >();
+
+    TYPE fout[PACK * DIMFOUT];
+    int j = 0;
+    for (; j + PACK <= nj; j += PACK) {
+#pragma omp simd
+      for (int k = 0; k < PACK; k++)
+        call< DIMSX, DIMSY, DIMSP >(fun, fout + k * DIMFOUT, xi, yj + (j + k) * DIMY, pp);
+      for (int k = 0; k < PACK; k++)
+        reduce(fout + k * DIMFOUT, jstart + j + k);
+    }
+    // last, incomplete pack
+    for (; j < nj; j++) {
+      call< DIMSX, DIMSY, DIMSP >(fun, fout, xi, yj + j * DIMY, pp);
+      reduce(fout, jstart + j);
+    }
+  }
+};
+
+struct CpuConv_simd : CpuConv_tiled_Impl< CpuTileEval_simd > {};
+
+}
@@ -0,0 +1,180 @@
+#pragma once
+
+#include <stdio.h>
+#include <assert.h>
+#include <vector>
+#include <algorithm>
+
+#include "core/utils/TypesUtils.h"
+
+#ifdef USE_OPENMP
+#include <omp.h>
+#endif
+
+#include "core/pack/GetInds.h"
+#include "core/pack/Load.h"
+#include "core/pack/Call.h"
+
+// Host implementation of the convolution, with a tiling of both the i and j indices.
+//
+// CpuConv sweeps the whole range of j for each i, so that the "j" variables are read again from
+// memory for every output line when they do not fit in the cache. Here, as in the shared memory
+// scheme of GpuConv1D, a tile of "j" variables is copied in a contiguous buffer that stays in
+// the L1/L2 cache while a tile of "i" lines is processed. The "j" variables are thus read
+// from memory nx/CPU_TILE_SIZE_I times instead of nx times.
+
+// size (in bytes) of the buffer holding a tile of "j" variables: it should fit in the L1 cache
+#ifndef CPU_TILE_BYTES_J
+#define CPU_TILE_BYTES_J 16384
+#endif
+
+// maximum number of "i" lines processed for each tile of "j" variables
+#ifndef CPU_TILE_SIZE_I
+#define CPU_TILE_SIZE_I 64
+#endif
+
+namespace keops {
+
+// Evaluation of the formula for a line i and a tile of nj "j" variables, calling reduce(fout, j)
+// on each result. LoadTile copies the "j" variables of the tile in the buffer yj, which holds
+// (nj + Pack()) * DIMY values: here, the variables of each j are stored contiguously.
+struct CpuTileEval {
+  template < typename TYPE >
+  static constexpr int Pack() { return 1; }
+
+  template < class DIMSY, class INDSJ, typename TYPE >
+  static INLINE void LoadTile(int jstart, int nj, TYPE *yj, TYPE **args) {
+    for (int j = 0; j < nj; j++)
+      load< DIMSY, INDSJ >(jstart + j, yj + j * DIMSY::SUM, args);
+  }
+
+  template < typename TYPE, class FUN, class REDUCE >
+  static INLINE void Eval(FUN fun, int nj, int jstart, TYPE *xi, TYPE *yj, TYPE *pp, REDUCE reduce) {
+    typedef typename FUN::DIMSX DIMSX;
+    typedef typename FUN::DIMSY DIMSY;
+    typedef typename FUN::DIMSP DIMSP;
+    TYPE fout[FUN::F::DIM];
+    for (int j = 0; j < nj; j++) {
+      call< DIMSX, DIMSY, DIMSP >(fun, fout, xi, yj + j * DIMSY::SUM, pp);
+      reduce(fout, jstart + j);
+    }
+  }
+};
+
+template < class TILE_EVAL >
+struct CpuConv_tiled_Impl {
+  template < typename TYPE, class FUN >
+  static int CpuConv_tiled_(FUN fun, int nx, int ny, TYPE *out, TYPE **args) {
+    typedef typename FUN::DIMSX DIMSX; // dimensions of "i" indexed variables
+    typedef typename FUN::DIMSY DIMSY; // dimensions of "j" indexed variables
+    typedef typename FUN::DIMSP DIMSP; // dimensions of parameters variables
+    typedef typename FUN::INDSI INDSI;
+    typedef typename FUN::INDSJ INDSJ;
+    typedef typename FUN::INDSP INDSP;
+    const int DIMX = DIMSX::SUM; // total size of "i" indexed variables
+    const int DIMY = DIMSY::SUM; // total size of "j" indexed variables
+    const int DIMP = DIMSP::SUM; // total size of parameters variables
+    const int DIMOUT = FUN::DIM; // dimension of output variable
+    const int DIMRED = FUN::DIMRED; // dimension of reduction operation
+#if SUM_SCHEME == KAHAN_SCHEME
+    const int DIM_KAHAN = FUN::template KahanScheme<__TYPEACC__,TYPE>::DIMACC;
+#endif
+    TYPE pp[DIMP];
+    load< DIMSP, INDSP >(0, pp, args);
+
+    // sizes of the tiles
+    const int tile_j = std::max(1, (int) (CPU_TILE_BYTES_J / (sizeof(TYPE) * std::max(DIMY, 1))));
+#ifdef USE_OPENMP
+    const int nthreads = omp_get_max_threads();
+#else
+    const int nthreads = 1;
+#endif
+    // keep at least one tile of "i" lines per thread
+    const int tile_i = std::max(1, std::min(CPU_TILE_SIZE_I, (nx + nthreads - 1) / nthreads));
+    const int ntiles_i = (nx + tile_i - 1) / tile_i;
+
+#pragma omp parallel
+    {
+    // buffers of the thread: "i" variables and accumulators of a tile of lines, tile of "j" variables
+    std::vector< TYPE > xi(tile_i * DIMX + 1), yj((tile_j + TILE_EVAL::template Pack< TYPE >()) * DIMY + 1);
+    std::vector< __TYPEACC__ > acc(tile_i * DIMRED + 1);
+#if SUM_SCHEME == BLOCK_SUM
+    // additional tmp vectors to store the partial results of each tile of "j" variables
+    std::vector< TYPE > tmp(tile_i * DIMRED + 1);
+#elif SUM_SCHEME == KAHAN_SCHEME
+    // additional tmp vectors to accumulate errors
+    std::vector< TYPE > tmp(tile_i * DIM_KAHAN + 1);
+#endif
+
+#pragma omp for schedule(static)
+    for (int it = 0; it < ntiles_i; it++) {
+      const int istart = it * tile_i;
+      const int ni = std::min(tile_i, nx - istart);
+
+      for (int i = 0; i < ni; i++) {
+        load< DIMSX, INDSI >(istart + i, xi.data() + i * DIMX, args);
+        typename FUN::template InitializeReduction< __TYPEACC__, TYPE >()(acc.data() + i * DIMRED);   // acc = 0
+#if SUM_SCHEME == KAHAN_SCHEME
+        VectAssign<DIM_KAHAN>(tmp.data() + i * DIM_KAHAN, 0.0f);
+#endif
+      }
+
+      for (int jstart = 0; jstart < ny; jstart += tile_j) {
+        const int nj = std::min(tile_j, ny - jstart);
+
+        // copy the tile of "j" variables in the contiguous buffer
+        TILE_EVAL::template LoadTile< DIMSY, INDSJ >(jstart, nj, yj.data(), args);
+
+        for (int i = 0; i < ni; i++) {
+          TYPE *xii = xi.data() + i * DIMX;
+          __TYPEACC__ *acci = acc.data() + i * DIMRED;
+#if SUM_SCHEME == BLOCK_SUM
+          TYPE *tmpi = tmp.data() + i * DIMRED;
+          typename FUN::template InitializeReduction< TYPE, TYPE >()(tmpi);   // tmp = 0
+#elif SUM_SCHEME == KAHAN_SCHEME
+          TYPE *tmpi = tmp.data() + i * DIM_KAHAN;
+#endif
+          auto reduce = [&](TYPE *fout, int j) {
+#if SUM_SCHEME == BLOCK_SUM
+            typename FUN::template ReducePairShort< TYPE, TYPE >()(tmpi, fout, j); // tmp += fout
+#elif SUM_SCHEME == KAHAN_SCHEME
+            typename FUN::template KahanScheme<__TYPEACC__,TYPE>()(acci, fout, tmpi);
+#else
+            typename FUN::template ReducePairShort< __TYPEACC__, TYPE >()(acci, fout, j); // acc += fout
+#endif
+          };
+          TILE_EVAL::Eval(fun, nj, jstart, xii, yj.data(), pp, reduce);
+#if SUM_SCHEME == BLOCK_SUM
+          // the tiles of "j" variables are the blocks of the block sum scheme
+          typename FUN::template ReducePair< __TYPEACC__, TYPE >()(acci, tmpi); // acc += tmp
+#endif
+        }
+      }
+
+      for (int i = 0; i < ni; i++)
+        typename FUN::template FinalizeOutput< __TYPEACC__, TYPE >()(acc.data() + i * DIMRED, out + (istart + i) * DIMOUT, istart + i);
+    }
+    }
+
+    return 0;
+  }
+
+// Wrapper with an user-friendly input format for px and py.
+  template < typename TYPE, class FUN, typename... Args >
+  static int Eval(FUN fun, int nx, int ny, TYPE *out, Args... args) {
+    static const int Nargs = sizeof...(Args);
+    TYPE *pargs[Nargs];
+    unpack(pargs, args...);
+    return CpuConv_tiled_(fun, nx, ny, out, pargs);
+  }
+
+// Idem, but with args given as an array of arrays, instead of an explicit list of arrays.
+  template < typename TYPE, class FUN >
+  static int Eval(FUN fun, int nx, int ny, TYPE *out, TYPE **pargs) {
+    return CpuConv_tiled_(fun, nx, ny, out, pargs);
+  }
+};
+
+struct CpuConv_tiled : CpuConv_tiled_Impl< CpuTileEval > {};
+
+}
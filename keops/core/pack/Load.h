@@ -82,6 +82,45 @@ HOST_DEVICE static void load(int i, TYPE *xi, TYPE **px, int *offsets) {
 }
 
 
+// Version with per-variable strides (used by the Cpu routines to read strided arrays in place)
+// Example:
+//   load_strided< pack<2,3>, pack<7,9> >(5,xi,px,strides);
+// will execute:
+//   xi[0] = px[7][5*strides[14]];
+//   xi[1] = px[7][5*strides[14]+strides[15]];
+//   xi[2] = px[9][5*strides[18]];
+//   xi[3] = px[9][5*strides[18]+strides[19]];
+//   xi[4] = px[9][5*strides[18]+2*strides[19]];
+// i.e. strides[2*k] and strides[2*k+1] are the strides (in number of elements) of the lines
+// and of the columns of the k-th argument.
+
+template < class DIMS, class INDS >
+struct load_strided_Impl {
+  template < typename TYPE >
+  HOST_DEVICE static void Eval(int i, TYPE *xi, TYPE **px, int *strides) {}
+};
+
+template < int FIRSTDIM, int... NEXTDIMS, int FIRSTIND, int... NEXTINDS >
+struct load_strided_Impl < pack<FIRSTDIM,NEXTDIMS...>, pack<FIRSTIND,NEXTINDS...> > {
+  using NEXTDIM = pack<NEXTDIMS...>;
+  using NEXTIND = pack<NEXTINDS...>;
+  template < typename TYPE >
+  HOST_DEVICE static void Eval(int i, TYPE *xi, TYPE **px, int *strides) {
+    const TYPE *line = px[FIRSTIND] + i * strides[2 * FIRSTIND];
+    #pragma unroll
+    for (int k = 0; k < FIRSTDIM; k++) {
+      xi[k] = line[k * strides[2 * FIRSTIND + 1]];
+    }
+    load_strided_Impl<NEXTDIM,NEXTIND>::Eval(i, xi + FIRSTDIM, px, strides);
+  }
+};
+
+template < class DIMS, class INDS, typename TYPE >
+HOST_DEVICE static void load_strided(int i, TYPE *xi, TYPE **px, int *strides) {
+  load_strided_Impl<DIMS,INDS>::Eval(i, xi, px, strides);
+}
+
+
 
 
 
@@ -13,9 +13,18 @@ with open(
 # Utils
 
 import pykeops.config
-from .common.set_path import set_bin_folder, clean_pykeops
+from .common.set_path import (
+    set_bin_folder,
+    set_shared_cache_folders,
+    clean_pykeops,
+    export_cache,
+    import_cache,
+    cache_stats,
+    evict_cache,
+)
 
 set_bin_folder()
+set_shared_cache_folders(pykeops.config.shared_cache_folders)
 
 if pykeops.config.numpy_found:
     from .test.install import test_numpy_bindings
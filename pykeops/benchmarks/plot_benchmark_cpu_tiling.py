@@ -0,0 +1,124 @@
+"""
+Benchmarking the tiled CPU engine
+===========================================================
+
+Let's compare the performances of the CPU implementations of KeOps
+on Gaussian RBF kernel products, as the dimension grows:
+
+- ``backend="CPU"`` loops over the output index :math:`i` and, for each
+  line, over the whole range of :math:`j`: the :math:`y_j`'s are thus read again
+  from the main memory for every line as soon as they do not fit in the cache.
+- ``backend="CPU_tiled"`` processes blocks of lines against tiles of
+  :math:`y_j`'s that stay in the L1/L2 cache.
+- ``backend="CPU_simd"`` also evaluates the formula on packs of consecutive
+  indices :math:`j` with the vector instructions of the CPU.
+
+"""
+
+
+##############################################
+# Setup
+# ---------------------
+
+import time
+
+import numpy as np
+from matplotlib import pyplot as plt
+
+from pykeops.numpy import Genred
+
+##############################################
+# Benchmark specifications:
+#
+
+N = 100000  # number of samples
+M = 10000  # number of output lines
+MAXTIME = 10  # Max number of seconds before we break the loop
+
+# Dimensions to test
+DS = [3, 5, 10, 20, 30, 50, 80, 100]
+
+# Backends to compare
+backends = ["CPU", "CPU_tiled", "CPU_simd"]
+
+##############################################
+# Synthetic dataset.
+
+
+def generate_samples(D):
+    """Create point clouds sampled from uniform distribution."""
+    np.random.seed(1234)
+    x = np.random.rand(M, D).astype("float32")
+    y = np.random.rand(N, D).astype("float32")
+    b = np.random.randn(N, 1).astype("float32")
+    return x, y, b
+
+
+##############################################
+# Define a Gaussian RBF product with the generic syntax:
+#
+
+
+def gaussianconv(D):
+    return Genred(
+        "Exp(-SqDist(X,Y)) * B",
+        ["X = Vi({})".format(D), "Y = Vj({})".format(D), "B = Vj(1)"],
+        reduction_op="Sum",
+        axis=1,
+        dtype="float32",
+    )
+
+
+##############################################
+# Benchmarking loops
+# -----------------------
+
+
+def benchmark(D, backend, loops=3):
+    """Times a convolution on an M-by-N problem in dimension D."""
+    routine = gaussianconv(D)
+    x, y, b = generate_samples(D)
+    routine(x, y, b, backend=backend)  # Warmup run, to compile and load everything
+
+    t_0 = time.perf_counter()  # Actual benchmark --------------------
+    for i in range(loops):
+        routine(x, y, b, backend=backend)
+    elapsed = time.perf_counter() - t_0  # ---------------------------
+
+    print(
+        "{:3} MxN convolution with M ={:7}, N ={:7}, D={:4}, backend={:10}: {:3}x{:3.6f}s".format(
+            loops, M, N, D, backend, loops, elapsed / loops
+        )
+    )
+    return elapsed / loops
+
+
+times = {backend: [] for backend in backends}
+for backend in backends:
+    for D in DS:
+        elapsed = benchmark(D, backend)
+        times[backend].append(elapsed)
+        if elapsed > MAXTIME:
+            break
+    times[backend] += (len(DS) - len(times[backend])) * [np.nan]
+
+
+##############################################
+# Display the results:
+#
+
+plt.figure(figsize=(12, 8))
+for backend, linestyle in zip(backends, ["o-", "s-", "^-"]):
+    plt.plot(DS, times[backend], linestyle, linewidth=2, label=backend)
+
+plt.title("Runtimes of a Gaussian RBF product with M={} and N={}".format(M, N))
+plt.xlabel("Dimension")
+plt.ylabel("Seconds")
+plt.yscale("log")
+plt.xscale("log")
+plt.legend(loc="upper left")
+plt.grid(True, which="major", linestyle="-")
+plt.grid(True, which="minor", linestyle="dotted")
+plt.tight_layout()
+
+plt.show()
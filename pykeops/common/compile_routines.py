@@ -1,11 +1,18 @@
+import functools
 import os
 import pathlib
+import re
+import shlex
 import shutil
+import subprocess
 import sys
+import tempfile
+import sysconfig
 from hashlib import sha256
 
 import pykeops.config
 from pykeops.common.parse_type import check_aliases_list
+from pykeops.common.set_path import get_abi_fingerprint
 from pykeops.common.utils import c_type, replace_strings_in_file, run_and_display
 
 
@@ -23,9 +30,14 @@ def get_pybind11_template_name_and_command(dtype, lang, include_dirs):
         ),
         "-DC_CONTIGUOUS=1",
     ] + include_dirs
+    # as for create_name, the template name does not depend on paths (python executable, torch location...)
     template_name = (
         "libKeOps_template_"
-        + sha256("".join(command_line).encode("utf-8")).hexdigest()[:10]
+        + sha256(
+            ",".join(
+                [get_abi_fingerprint(lang), c_type[dtype], "C_CONTIGUOUS=1"]
+            ).encode("utf-8")
+        ).hexdigest()[:10]
     )
     return template_name, command_line
 
@@ -84,7 +96,7 @@ def get_or_build_pybind11_template(
 
         fname = pykeops.config.shared_obj_name + ".o"
         os.rename(
-            pykeops.config.bin_folder + os.path.sep + fname,
+            build_folder + os.path.sep + fname,
             template_build_folder + os.path.sep + fname,
         )
 
@@ -106,15 +118,16 @@ def get_or_build_pybind11_template(
 
 
 def create_keops_include_file(
-    build_folder, dtype, formula, alias_string, optional_flags
+    build_folder, dtype, formula, alias_string, optional_flags, target_include_file=None
 ):
     # creating KeOps include file for formula
     template_include_file = (
         pykeops.config.script_formula_folder + os.path.sep + "formula.h.in"
     )
-    target_include_file = (
-        build_folder + os.path.sep + pykeops.config.shared_obj_name + ".h"
-    )
+    if target_include_file is None:
+        target_include_file = (
+            build_folder + os.path.sep + pykeops.config.shared_obj_name + ".h"
+        )
     shutil.copyfile(template_include_file, target_include_file)
 
     optional_flags_string = ""
@@ -203,9 +216,7 @@ def build_keops_formula_object_file(
     )
 
 
-def compile_generic_routine(
-    formula, aliases, dllname, dtype, lang, optional_flags, include_dirs, build_folder
-):
+def get_alias_strings(aliases):
     aliases = check_aliases_list(aliases)
 
     def process_alias(alias):
@@ -219,7 +230,10 @@ def compile_generic_routine(
 
     alias_string = "".join([process_alias(alias) for alias in aliases])
     alias_disp_string = "".join([process_disp_alias(alias) for alias in aliases])
+    return alias_string, alias_disp_string
+
 
+def print_compile_message(dllname, formula, alias_disp_string, dtype, build_folder):
     print(
         "[pyKeOps] Compiling "
         + dllname
@@ -238,26 +252,93 @@ def compile_generic_routine(
         flush=True,
     )
 
-    build_keops_formula_object_file(
-        build_folder, dtype, formula, alias_string, optional_flags
-    )
-
-    template_name, is_rebuilt = get_or_build_pybind11_template(
-        dtype, lang, include_dirs, use_prebuilt_formula=True
-    )
 
-    template_build_folder = (
+def get_template_build_folder(template_name):
+    return (
         pykeops.config.bin_folder
         + os.path.sep
         + "build-pybind11_template-"
         + template_name
     )
 
-    if not is_rebuilt:
-        fname = pykeops.config.shared_obj_name + ".o"
+
+def get_template_link_command(template_name):
+    """
+    Return a function that gives the command line used by cmake to link the pybind11 template with a
+    formula object file, as a function of the paths of the object file and of the output module. It is
+    read from the link.txt file written by the Makefile generator of cmake in the template build folder,
+    so that the template object file (compiled once) is reused as is. Return None if it is not available.
+    """
+    template_build_folder = get_template_build_folder(template_name)
+    link_file = os.path.join(
+        template_build_folder, "CMakeFiles", template_name + ".dir", "link.txt"
+    )
+    if not os.path.exists(link_file):
+        return None
+    with open(link_file, "r") as f:
+        lines = [line for line in f.read().splitlines() if line.strip()]
+    if len(lines) != 1:
+        return None
+    command = shlex.split(lines[0])
+
+    object_name = pykeops.config.shared_obj_name + ".o"
+    object_pos = [i for (i, arg) in enumerate(command) if arg.endswith(object_name)]
+    output_pos = [i + 1 for (i, arg) in enumerate(command[:-1]) if arg == "-o"]
+    if len(object_pos) != 1 or len(output_pos) != 1:
+        return None
+
+    # pybind11_add_module strips the modules after linking in Release mode
+    strip = None
+    if pykeops.config.build_type == "Release":
+        with open(os.path.join(template_build_folder, "CMakeCache.txt"), "r") as f:
+            for line in f:
+                if line.startswith("CMAKE_STRIP:") and line.strip().split("=", 1)[1]:
+                    strip = [line.strip().split("=", 1)[1]]
+                    if sys.platform == "darwin":
+                        strip += ["-x"]
+
+    def link_command(object_file, module_file):
+        args = list(command)
+        args[object_pos[0]] = object_file
+        args[output_pos[0]] = module_file
+        return [args] + ([strip + [module_file]] if strip else [])
+
+    return link_command
+
+
+def link_keops_module(dllname, template_name, object_file=None):
+    """
+    Link a formula object file against the pybind11 template and move the resulting shared
+    object to its own folder in bin_folder. If object_file is None, the formula object file
+    is assumed to be in the template build folder already (and the module to be linked).
+    Note: when the template build folder provides its link command (see get_template_link_command),
+    the formula is linked directly in bin_folder and the template build folder is not modified,
+    so that several formulas may be linked at the same time.
+    """
+    template_build_folder = get_template_build_folder(template_name)
+    module_folder = pykeops.config.bin_folder + os.path.sep + dllname
+
+    link_command = (
+        get_template_link_command(template_name) if object_file is not None else None
+    )
+    if link_command is not None:
+        os.makedirs(module_folder, exist_ok=True)
+        module_file = (
+            module_folder
+            + os.path.sep
+            + template_name
+            + sysconfig.get_config_var("EXT_SUFFIX")
+        )
+        for command in link_command(object_file, module_file + ".tmp"):
+            run_and_display(command, template_build_folder, msg="LINK")
+        os.rename(module_file + ".tmp", module_file)
+        os.remove(object_file)
+        return
+
+    if object_file is not None:
         os.rename(
-            pykeops.config.bin_folder + os.path.sep + fname,
-            template_build_folder + os.path.sep + fname,
+            object_file,
+            template_build_folder + os.path.sep + pykeops.config.shared_obj_name + ".o",
         )
         run_and_display(
             ["cmake", "--build", ".", "--target", template_name, "--", "VERBOSE=1"],
@@ -265,14 +346,382 @@ def compile_generic_routine(
             msg="MAKE",
         )
 
-    os.makedirs(pykeops.config.bin_folder + os.path.sep + dllname, exist_ok=True)
+    os.makedirs(module_folder, exist_ok=True)
     fname = list(pathlib.Path(template_build_folder).glob(template_name + "*.so"))[
         0
     ].name
     os.rename(
         template_build_folder + os.path.sep + fname,
-        pykeops.config.bin_folder + os.path.sep + dllname + os.path.sep + fname,
+        module_folder + os.path.sep + fname,
+    )
+    # the formula object file is not needed anymore: the next link brings its own
+    object_file = (
+        template_build_folder + os.path.sep + pykeops.config.shared_obj_name + ".o"
+    )
+    if os.path.exists(object_file):
+        os.remove(object_file)
+
+
+def compile_generic_routine(
+    formula, aliases, dllname, dtype, lang, optional_flags, include_dirs, build_folder
+):
+    alias_string, alias_disp_string = get_alias_strings(aliases)
+
+    print_compile_message(dllname, formula, alias_disp_string, dtype, build_folder)
+
+    build_keops_formula_object_file(
+        build_folder, dtype, formula, alias_string, optional_flags
+    )
+
+    template_name, is_rebuilt = get_or_build_pybind11_template(
+        dtype, lang, include_dirs, use_prebuilt_formula=True
+    )
+
+    link_keops_module(
+        dllname,
+        template_name,
+        None
+        if is_rebuilt
+        else build_folder + os.path.sep + pykeops.config.shared_obj_name + ".o",
+    )
+
+    print("Done.", flush=True)
+
+
+def get_batch_folder(build_folder):
+    return build_folder + os.path.sep + "batch"
+
+
+def configure_batch_routines(build_folder, dtype, routines):
+    """
+    Write one include file per routine in the batch folder of build_folder, and re-run cmake
+    so that each of them gets its own target. routines is a list of (formula, aliases, dllname,
+    optional_flags) tuples.
+    """
+    batch_folder = get_batch_folder(build_folder)
+    os.makedirs(batch_folder, exist_ok=True)
+    for (formula, aliases, dllname, optional_flags) in routines:
+        alias_string, alias_disp_string = get_alias_strings(aliases)
+        print_compile_message(dllname, formula, alias_disp_string, dtype, build_folder)
+        create_keops_include_file(
+            build_folder,
+            dtype,
+            formula,
+            alias_string,
+            optional_flags,
+            target_include_file=batch_folder + os.path.sep + dllname + ".h",
+        )
+    run_and_display(["cmake", "."], build_folder, msg="CMAKE")
+
+
+def build_batch_routines(build_folder, dllnames, jobs=None):
+    """
+    Build the object files of several formulas configured with configure_batch_routines,
+    in a single (parallel) call to make. Return the paths of the object files.
+    """
+    jobs = os.cpu_count() if jobs is None else jobs
+    run_and_display(
+        ["cmake", "--build", ".", "--", "-j" + str(jobs), "VERBOSE=1"] + dllnames,
+        build_folder,
+        msg="MAKE",
+    )
+    return [
+        get_batch_folder(build_folder) + os.path.sep + dllname + ".o"
+        for dllname in dllnames
+    ]
+
+
+def clean_batch_routines(build_folder, dllnames):
+    # remove the include files so that the targets are dropped at the next cmake call,
+    # and the intermediate build trees of the formulas.
+    # N.B.: the (empty) per-formula lock files are not removed, as a process waiting on one of them
+    # would otherwise hold a lock on a file that no other process can see anymore.
+    for dllname in dllnames:
+        for ext in [".h", ".cpp", ".cu", ".o"]:
+            fname = get_batch_folder(build_folder) + os.path.sep + dllname + ext
+            if os.path.exists(fname):
+                os.remove(fname)
+        shutil.rmtree(
+            os.path.join(build_folder, "CMakeFiles", "copy_" + dllname + ".dir"),
+            ignore_errors=True,
+        )
+
+
+def use_direct_compilation(dtype, lang):
+    """
+    Tell whether the formulas are compiled by a direct call to the C++ compiler (see
+    compile_generic_routine_direct) instead of cmake. This is only possible for cpu builds.
+    """
+    return (
+        pykeops.config.direct_compilation
+        and (not pykeops.config.gpu_available)
+        and dtype in ("float32", "float64")
+        and lang in ("numpy", "torch")
+        and shutil.which(pykeops.config.cxx_compiler) is not None
+    )
+
+
+def get_direct_build_folder_name(dtype, lang, include_dirs):
+    template_name = get_pybind11_template_name(dtype, lang, include_dirs)
+    # the template object of the folder depends on the compiler and on its flags (e.g. OpenMP)
+    compiler = sha256(
+        repr(
+            (pykeops.config.cxx_compiler,)
+            + get_cxx_compiler_flags(pykeops.config.cxx_compiler)
+        ).encode("utf-8")
+    ).hexdigest()[:6]
+    return (
+        pykeops.config.bin_folder
+        + os.path.sep
+        + "build-direct-"
+        + template_name
+        + "-"
+        + compiler
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_cxx_standard():
+    """
+    Return the C++ standard used by the cmake builds of keops, as set in keops/headers.cmake,
+    so that the direct compilation of the formulas follows the same standard.
+    """
+    pykeops_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(pykeops_dir, "keops", "headers.cmake")) as f:
+        match = re.search(r"set\(CMAKE_CXX_STANDARD\s+(\d+)\s*\)", f.read())
+    return match.group(1) if match else "14"
+
+
+def check_compiled_file(target, name):
+    """
+    Raise an ImportError if the compiler did not produce the file target: run_and_display only
+    prints the errors of the compiler.
+    """
+    if not os.path.exists(target):
+        raise ImportError(
+            "[pyKeOps]: compilation of {} failed: {} was not created (see the compiler output above).".format(
+                name, target
+            )
+        )
+
+
+def cxx_supports_openmp(cxx_compiler):
+    """
+    Tell whether cxx_compiler can build and link a program with -fopenmp.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "openmp.cpp")
+        with open(source, "w") as f:
+            f.write(
+                "#include <omp.h>\nint main() { return omp_get_max_threads() > 0 ? 0 : 1; }\n"
+            )
+        try:
+            proc = subprocess.run(
+                [cxx_compiler, "-fopenmp", source, "-o", os.path.join(tmp, "openmp")],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError:
+            return False
+    return proc.returncode == 0
+
+
+@functools.lru_cache(maxsize=None)
+def get_cxx_compiler_flags(cxx_compiler):
+    """
+    Return the OpenMP and warning flags that keops/headers.cmake adds for cxx_compiler, as a pair
+    (openmp_flags, warning_flags). As in headers.cmake, OpenMP is not used with the clang of Apple,
+    nor with compilers that cannot build an OpenMP program.
+    """
+    try:
+        version = subprocess.run(
+            [cxx_compiler, "--version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        ).stdout.decode("utf-8", "replace")
+    except OSError:
+        version = ""
+    clang = "clang" in version.lower()
+
+    if clang:
+        warning_flags = ["-Wall", "-ferror-limit=2"]
+    else:
+        warning_flags = ["-Wall", "-Wno-unknown-pragmas", "-fmax-errors=2"]
+    if (clang and sys.platform == "darwin") or not cxx_supports_openmp(cxx_compiler):
+        openmp_flags = []
+    else:
+        openmp_flags = ["-DUSE_OPENMP", "-fopenmp"]
+    return openmp_flags, warning_flags
+
+
+@functools.lru_cache(maxsize=None)
+def get_direct_compile_flags(dtype, lang, include_dirs, build_type, cxx_compiler):
+    """
+    Return the flags used by cmake to compile the keops formulas and the pybind11 template of a
+    given dtype and lang on cpu, as a triple (formula_flags, template_flags, link_flags).
+    The flag sets are computed once per (dtype, lang, compiler).
+    """
+    pykeops_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    openmp_flags, warning_flags = get_cxx_compiler_flags(cxx_compiler)
+
+    formula_flags = [
+        # as cmake, which uses the GNU extensions by default (CMAKE_CXX_EXTENSIONS)
+        "-std=gnu++" + get_cxx_standard(),
+        "-fPIC",
+        *openmp_flags,
+        *warning_flags,
+        "-DUSE_CUDA=0",
+        "-D__TYPE__=" + c_type[dtype],
+        "-DC_CONTIGUOUS=1",
+        "-DUSE_DOUBLE=" + ("1" if dtype == "float64" else "0"),
+        "-DUSE_HALF=0",
+        # N.B.: -iquote, as the "version" file of pykeops would shadow the <version> standard header
+        "-iquote",
+        pykeops_dir,
+        "-I" + os.path.join(pykeops_dir, "keops"),
+    ]
+    formula_flags += ["-O3", "-DNDEBUG"] if build_type == "Release" else ["-O0", "-g"]
+
+    template_flags = formula_flags + [
+        "-fvisibility=hidden",
+        "-DMODULE_NAME=" + get_pybind11_template_name(dtype, lang, list(include_dirs)),
+        "-I" + os.path.join(pykeops_dir, "pybind11", "include"),
+        "-I" + sysconfig.get_paths()["include"],
+    ]
+    link_flags = ["-shared"] + (["-fopenmp"] if openmp_flags else [])
+    if sys.platform == "darwin":
+        link_flags += ["-undefined", "dynamic_lookup"]
+    elif build_type == "Release":
+        link_flags += ["-s"]  # as pybind11_add_module, strip the modules
+
+    if lang == "torch":
+        import torch
+
+        abi_flag = "-D_GLIBCXX_USE_CXX11_ABI=" + str(
+            int(torch._C._GLIBCXX_USE_CXX11_ABI)
+        )
+        formula_flags += [abi_flag]
+        template_flags += [
+            abi_flag,
+            "-I" + os.path.join(torch.__path__[0], "include"),
+            "-I"
+            + os.path.join(
+                torch.__path__[0], "include", "torch", "csrc", "api", "include"
+            ),
+            "-include",
+            os.path.join(pykeops_dir, "torch_headers.h.in"),
+        ]
+        if sys.platform.startswith("linux"):
+            link_flags += [os.path.join(torch.__path__[0], "lib", "libtorch_python.so")]
+
+    return formula_flags, template_flags, link_flags
+
+
+def get_or_build_direct_template_object(dtype, lang, include_dirs, build_folder):
+    """
+    Compile (once per dtype and lang) the generic_red.cpp file of the pybind11 template
+    in the direct build folder and return the path of the object file.
+    """
+    template_object = build_folder + os.path.sep + "generic_red.o"
+    if not os.path.exists(template_object):
+        print(
+            "[pyKeOps] Compiling pybind11 template "
+            + get_pybind11_template_name(dtype, lang, include_dirs)
+            + " in "
+            + os.path.realpath(pykeops.config.bin_folder)
+            + " ... ",
+            end="",
+            flush=True,
+        )
+        _, template_flags, _ = get_direct_compile_flags(
+            dtype,
+            lang,
+            tuple(include_dirs),
+            pykeops.config.build_type,
+            pykeops.config.cxx_compiler,
+        )
+        pykeops_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        run_and_display(
+            [pykeops.config.cxx_compiler]
+            + template_flags
+            + [
+                "-c",
+                os.path.join(pykeops_dir, lang, "generic", "generic_red.cpp"),
+                "-o",
+                template_object + ".tmp",
+            ],
+            build_folder,
+            msg="CXX",
+        )
+        check_compiled_file(
+            template_object + ".tmp",
+            "pybind11 template "
+            + get_pybind11_template_name(dtype, lang, include_dirs),
+        )
+        os.rename(template_object + ".tmp", template_object)
+        print("done.", flush=True)
+    return template_object
+
+
+def compile_generic_routine_direct(
+    formula, aliases, dllname, dtype, lang, optional_flags, include_dirs, build_folder
+):
+    """
+    Compile a formula with a single call to the C++ compiler, linking it against the
+    precompiled pybind11 template object: cmake is not needed.
+    """
+    alias_string, alias_disp_string = get_alias_strings(aliases)
+    print_compile_message(dllname, formula, alias_disp_string, dtype, build_folder)
+
+    os.makedirs(build_folder, exist_ok=True)
+    template_object = get_or_build_direct_template_object(
+        dtype, lang, include_dirs, build_folder
+    )
+
+    include_file = build_folder + os.path.sep + dllname + ".h"
+    create_keops_include_file(
+        build_folder,
+        dtype,
+        formula,
+        alias_string,
+        optional_flags,
+        target_include_file=include_file,
+    )
+
+    formula_flags, _, link_flags = get_direct_compile_flags(
+        dtype,
+        lang,
+        tuple(include_dirs),
+        pykeops.config.build_type,
+        pykeops.config.cxx_compiler,
+    )
+    pykeops_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    module_folder = pykeops.config.bin_folder + os.path.sep + dllname
+    os.makedirs(module_folder, exist_ok=True)
+    module_file = (
+        module_folder
+        + os.path.sep
+        + get_pybind11_template_name(dtype, lang, include_dirs)
+        + sysconfig.get_config_var("EXT_SUFFIX")
+    )
+    run_and_display(
+        [pykeops.config.cxx_compiler]
+        + formula_flags
+        + [
+            "-include",
+            include_file,
+            os.path.join(pykeops_dir, "keops", "core", "link_autodiff.cpp"),
+            template_object,
+            "-o",
+            module_file + ".tmp",
+        ]
+        + link_flags,
+        build_folder,
+        msg="CXX",
     )
+    check_compiled_file(module_file + ".tmp", dllname)
+    os.rename(module_file + ".tmp", module_file)
+    os.remove(include_file)
 
     print("Done.", flush=True)
 
@@ -0,0 +1,563 @@
+from collections import namedtuple
+
+from pykeops.common.parse_type import get_type
+from pykeops.common.utils import get_tools
+
+# Dense evaluation of keops formulas with NumPy or PyTorch, used to serve the calls made while a
+# formula is compiled in the background (see pykeops.config.async_compilation). The kernel matrix
+# is computed by blocks of whole lines, of about block_size coefficients each. This is much slower
+# than the compiled kernels: larger problems, and the formulas or options that are not supported
+# here, raise a NotImplementedError and the caller waits for the compiled module instead.
+
+block_size = 2 ** 20
+max_size = 10 ** 8
+
+_Env = namedtuple("_Env", ["tools", "vars", "one", "block"])
+
+
+class _Formula:
+    r"""
+    Node of a formula: dim is the dimension of its output and fun(env) returns its value on the
+    current block of the kernel matrix, as an array of shape (..., dim) that broadcasts against env.block.
+    """
+
+    def __init__(self, dim, fun):
+        self.dim = dim
+        self.fun = fun
+
+    def __call__(self, env):
+        return self.fun(env)
+
+    def __add__(self, other):
+        return _broadcast(lambda T, a, b: a + b, self, other)
+
+    def __sub__(self, other):
+        return _broadcast(lambda T, a, b: a - b, self, other)
+
+    def __mul__(self, other):
+        return _broadcast(lambda T, a, b: a * b, self, other)
+
+    def __truediv__(self, other):
+        return _broadcast(lambda T, a, b: a / b, self, other)
+
+    def __or__(self, other):
+        return _Sum(self * other)
+
+    def __neg__(self):
+        return _Formula(self.dim, lambda env: -self(env))
+
+
+def _check(*formulas):
+    if not all(isinstance(f, _Formula) for f in formulas):
+        raise NotImplementedError
+
+
+def _broadcast(op, f, g):
+    _check(f, g)
+    if f.dim != g.dim and 1 not in (f.dim, g.dim):
+        raise NotImplementedError
+    return _Formula(max(f.dim, g.dim), lambda env: op(env.tools, f(env), g(env)))
+
+
+def _elementwise(op):
+    def formula(f):
+        _check(f)
+        return _Formula(f.dim, lambda env: op(env.tools, f(env)))
+
+    return formula
+
+
+def _rsqrt(T, x):
+    # N.B.: KeOps defines Rsqrt(0) = 0
+    zero = x == 0
+    return T.where(zero, T.zeros_like(x), 1 / T.sqrt(T.where(zero, T.ones_like(x), x)))
+
+
+def _xlogx(T, x):
+    zero = x == 0
+    return T.where(zero, T.zeros_like(x), x * T.log(T.where(zero, T.ones_like(x), x)))
+
+
+def _Sum(f):
+    _check(f)
+    return _Formula(1, lambda env: f(env).sum(-1)[..., None])
+
+
+def _Max(f):
+    _check(f)
+    return _Formula(1, lambda env: env.tools.amax(f(env), -1)[..., None])
+
+
+def _Min(f):
+    _check(f)
+    return _Formula(1, lambda env: env.tools.amin(f(env), -1)[..., None])
+
+
+def _ArgMax(f):
+    _check(f)
+
+    def fun(env):
+        x = f(env)
+        return env.tools.astype(x.argmax(-1)[..., None], x)
+
+    return _Formula(1, fun)
+
+
+def _ArgMin(f):
+    _check(f)
+
+    def fun(env):
+        x = f(env)
+        return env.tools.astype(x.argmin(-1)[..., None], x)
+
+    return _Formula(1, fun)
+
+
+def _SqNorm2(f):
+    return _Sum(_Square(f))
+
+
+def _Square(f):
+    return f * f
+
+
+def _Pow(f, m):
+    _check(f)
+    return _Formula(f.dim, lambda env: f(env) ** m)
+
+
+def _Powf(f, g):
+    return _Exp(g * _Log(f))
+
+
+def _Elem(f, m):
+    return _Extract(f, m, 1)
+
+
+def _Extract(f, m, d):
+    _check(f)
+    if m + d > f.dim:
+        raise NotImplementedError
+    return _Formula(d, lambda env: f(env)[..., m : m + d])
+
+
+def _Concat(f, g):
+    _check(f, g)
+
+    def fun(env):
+        x, y = f(env), g(env)
+        x, y = x + 0 * y[..., :1], y + 0 * x[..., :1]  # broadcast to a common shape
+        return env.tools.concat([x, y])
+
+    return _Formula(f.dim + g.dim, fun)
+
+
+def _OneHot(f, d):
+    _check(f)
+    if f.dim != 1:
+        raise NotImplementedError
+
+    def fun(env):
+        T, x = env.tools, f(env)
+        ones, zeros = T.ones_like(x), T.zeros_like(x)
+        return T.concat([T.where(T.abs(x - k) < 0.5, ones, zeros) for k in range(d)])
+
+    return _Formula(d, fun)
+
+
+def _Clamp(f, g, h):
+    _check(f, g, h)
+
+    def fun(env):
+        T, x, a, b = env.tools, f(env), g(env), h(env)
+        x = x + 0 * a + 0 * b  # broadcast to a common shape
+        return T.where(x < a, a + 0 * x, T.where(x > b, b + 0 * x, x))
+
+    return _Formula(max(f.dim, g.dim, h.dim), fun)
+
+
+def _ClampInt(f, a, b):
+    return _Clamp(f, _IntCst(a), _IntCst(b))
+
+
+def _MatVecMult(f, g):
+    _check(f, g)
+    if f.dim % g.dim:
+        raise NotImplementedError
+    n, p = f.dim // g.dim, g.dim
+
+    def fun(env):
+        # N.B.: matrices are stored in row-major order (C_CONTIGUOUS)
+        x, y = f(env), g(env)
+        return (x.reshape(x.shape[:-1] + (n, p)) * y[..., None, :]).sum(-1)
+
+    return _Formula(n, fun)
+
+
+def _VecMatMult(f, g):
+    _check(f, g)
+    if g.dim % f.dim:
+        raise NotImplementedError
+    n, p = f.dim, g.dim // f.dim
+
+    def fun(env):
+        x, y = f(env), g(env)
+        return (x[..., :, None] * y.reshape(y.shape[:-1] + (n, p))).sum(-2)
+
+    return _Formula(p, fun)
+
+
+def _TensorProd(f, g):
+    _check(f, g)
+    n, p = f.dim, g.dim
+
+    def fun(env):
+        xy = f(env)[..., :, None] * g(env)[..., None, :]
+        return xy.reshape(xy.shape[:-2] + (n * p,))
+
+    return _Formula(n * p, fun)
+
+
+def _WeightedSqNorm(s, f):
+    _check(s, f)
+    if s.dim == 1 or s.dim == f.dim:
+        return _Sum(s * _Square(f))
+    elif s.dim == f.dim * f.dim:
+        return _Sum(f * _MatVecMult(s, f))
+    raise NotImplementedError
+
+
+def _IntCst(n):
+    return _Formula(1, lambda env: n * env.one)
+
+
+def _IntInv(n):
+    return _Formula(1, lambda env: env.one / n)
+
+
+def _Zero(d):
+    return _Formula(d, lambda env: env.tools.concat([0 * env.one] * d))
+
+
+def _Var(ind, dim, cat):
+    def fun(env):
+        if env.vars[ind].shape[-1] != dim:
+            raise NotImplementedError
+        return env.vars[ind]
+
+    return _Formula(dim, fun)
+
+
+_Exp = _elementwise(lambda T, x: T.exp(x))
+_Log = _elementwise(lambda T, x: T.log(x))
+
+
+class _Reduction:
+    r"""
+    Root of a formula: reduce(env) returns the reduction of the current block of the kernel
+    matrix along its second axis, as an array of shape (lines, dim).
+    """
+
+    def __init__(self, dim, tagIJ, reduce):
+        self.dim = dim
+        self.tagIJ = tagIJ
+        self.reduce = reduce
+
+
+def _values(f, env):
+    # value of f on the whole block, including the formulas that do not depend on i or j
+    return f(env) + env.block
+
+
+def _Sum_Reduction(f, tagIJ):
+    _check(f)
+    return _Reduction(f.dim, tagIJ, lambda env: _values(f, env).sum(1))
+
+
+def _Max_Reduction(f, tagIJ):
+    _check(f)
+    return _Reduction(f.dim, tagIJ, lambda env: env.tools.amax(_values(f, env), 1))
+
+
+def _Min_Reduction(f, tagIJ):
+    _check(f)
+    return _Reduction(f.dim, tagIJ, lambda env: env.tools.amin(_values(f, env), 1))
+
+
+def _ArgMax_Reduction(f, tagIJ):
+    _check(f)
+    return _Reduction(
+        f.dim,
+        tagIJ,
+        lambda env: env.tools.astype(_values(f, env).argmax(1), env.one),
+    )
+
+
+def _ArgMin_Reduction(f, tagIJ):
+    _check(f)
+    return _Reduction(
+        f.dim,
+        tagIJ,
+        lambda env: env.tools.astype(_values(f, env).argmin(1), env.one),
+    )
+
+
+def _Max_ArgMax_Reduction(f, tagIJ):
+    _check(f)
+
+    def reduce(env):
+        T, x = env.tools, _values(f, env)
+        return T.concat([T.amax(x, 1), T.astype(x.argmax(1), x)])
+
+    return _Reduction(2 * f.dim, tagIJ, reduce)
+
+
+def _Min_ArgMin_Reduction(f, tagIJ):
+    _check(f)
+
+    def reduce(env):
+        T, x = env.tools, _values(f, env)
+        return T.concat([T.amin(x, 1), T.astype(x.argmin(1), x)])
+
+    return _Reduction(2 * f.dim, tagIJ, reduce)
+
+
+def _Max_SumShiftExpWeight_Reduction(f, tagIJ, g):
+    _check(f, g)
+    if f.dim != 1:
+        raise NotImplementedError
+
+    def reduce(env):
+        # output is (m, s) with m = max_j f_ij and s = sum_j exp(f_ij - m) g_ij
+        T, x = env.tools, _values(f, env)
+        m = T.amax(x, 1)
+        s = (T.exp(x - m[:, None, :]) * _values(g, env)).sum(1)
+        return T.concat([m, s])
+
+    return _Reduction(1 + g.dim, tagIJ, reduce)
+
+
+def _Max_SumShiftExp_Reduction(f, tagIJ):
+    return _Max_SumShiftExpWeight_Reduction(f, tagIJ, _IntCst(1))
+
+
+def _kmin_reduction(f, k, tagIJ, with_values, with_indices):
+    _check(f)
+
+    def reduce(env):
+        T, x = env.tools, _values(f, env)
+        if x.shape[1] < k:
+            raise NotImplementedError
+        values, ind = T.sort(x, 1)
+        # output is of size K*D (or K*2D), viewed as an array (K,D) (or (K,2,D)) in row-major order
+        res = []
+        if with_values:
+            res.append(values[:, :k, :])
+        if with_indices:
+            res.append(T.astype(ind[:, :k, :], x))
+        res = T.concat(res)
+        return res.reshape(res.shape[:1] + (-1,))
+
+    return _Reduction((with_values + with_indices) * k * f.dim, tagIJ, reduce)
+
+
+def _KMin_Reduction(f, k, tagIJ):
+    return _kmin_reduction(f, k, tagIJ, True, False)
+
+
+def _ArgKMin_Reduction(f, k, tagIJ):
+    return _kmin_reduction(f, k, tagIJ, False, True)
+
+
+def _KMin_ArgKMin_Reduction(f, k, tagIJ):
+    return _kmin_reduction(f, k, tagIJ, True, True)
+
+
+# the keops operations (see keops/core/formulas) that are supported by FallbackModule
+operations = {
+    "Var": _Var,
+    "Vi": lambda ind, dim: _Var(ind, dim, 0),
+    "Vj": lambda ind, dim: _Var(ind, dim, 1),
+    "Pm": lambda ind, dim: _Var(ind, dim, 2),
+    "IntCst": _IntCst,
+    "IntInv": _IntInv,
+    "Zero": _Zero,
+    "Add": lambda f, g: f + g,
+    "Subtract": lambda f, g: f - g,
+    "Mult": lambda f, g: f * g,
+    "ScalOrMult": lambda f, g: f * g,
+    "Divide": lambda f, g: f / g,
+    "Minus": lambda f: -f,
+    "Exp": _Exp,
+    "Log": _Log,
+    "Sqrt": _elementwise(lambda T, x: T.sqrt(x)),
+    "Rsqrt": _elementwise(_rsqrt),
+    "Inv": _elementwise(lambda T, x: 1 / x),
+    "Sin": _elementwise(lambda T, x: T.sin(x)),
+    "Cos": _elementwise(lambda T, x: T.cos(x)),
+    "Atan": _elementwise(lambda T, x: T.atan(x)),
+    "Asin": _elementwise(lambda T, x: T.asin(x)),
+    "Acos": _elementwise(lambda T, x: T.acos(x)),
+    "Abs": _elementwise(lambda T, x: T.abs(x)),
+    "Sign": _elementwise(lambda T, x: T.sign(x)),
+    "Step": _elementwise(lambda T, x: T.where(x < 0, T.zeros_like(x), T.ones_like(x))),
+    "ReLU": _elementwise(lambda T, x: T.where(x < 0, T.zeros_like(x), x)),
+    "XLogX": _elementwise(_xlogx),
+    "Square": _Square,
+    "Pow": _Pow,
+    "Powf": _Powf,
+    "Sum": _Sum,
+    "Max": _Max,
+    "Min": _Min,
+    "ArgMax": _ArgMax,
+    "ArgMin": _ArgMin,
+    "Elem": _Elem,
+    "Extract": _Extract,
+    "Concat": _Concat,
+    "OneHot": _OneHot,
+    "Clamp": _Clamp,
+    "ClampInt": _ClampInt,
+    "MatVecMult": _MatVecMult,
+    "VecMatMult": _VecMatMult,
+    "TensorProd": _TensorProd,
+    "Scalprod": lambda f, g: f | g,
+    "SqNorm2": _SqNorm2,
+    "Norm2": lambda f: operations["Sqrt"](_SqNorm2(f)),
+    "Normalize": lambda f: f * operations["Rsqrt"](_SqNorm2(f)),
+    "SqDist": lambda f, g: _SqNorm2(f - g),
+    "WeightedSqNorm": _WeightedSqNorm,
+    "WeightedSqDist": lambda s, f, g: _WeightedSqNorm(s, f - g),
+    "Sum_Reduction": _Sum_Reduction,
+    "Max_Reduction": _Max_Reduction,
+    "Min_Reduction": _Min_Reduction,
+    "ArgMax_Reduction": _ArgMax_Reduction,
+    "ArgMin_Reduction": _ArgMin_Reduction,
+    "Max_ArgMax_Reduction": _Max_ArgMax_Reduction,
+    "Min_ArgMin_Reduction": _Min_ArgMin_Reduction,
+    "Max_SumShiftExp_Reduction": _Max_SumShiftExp_Reduction,
+    "Max_SumShiftExpWeight_Reduction": _Max_SumShiftExpWeight_Reduction,
+    "KMin_Reduction": _KMin_Reduction,
+    "ArgKMin_Reduction": _ArgKMin_Reduction,
+    "KMin_ArgKMin_Reduction": _KMin_ArgKMin_Reduction,
+}
+
+
+def parse_formula(formula, aliases):
+    r"""
+    Return the _Reduction object that evaluates a keops formula (e.g. "Sum_Reduction(Exp(-SqDist(x,y))*b,0)")
+    and the list of the (category, dimension) of its variables. Raise NotImplementedError if the formula
+    involves operations that are not supported.
+    """
+    namespace = dict(operations)
+    variables = {}
+    for (var_ind, sig) in enumerate(aliases):
+        name, cat, dim, pos = get_type(sig, position_in_list=var_ind)
+        variables[pos] = (cat, dim)
+        if name is not None:
+            namespace[name] = _Var(pos, dim, cat)
+    try:
+        # N.B.: C++ and Python give the same precedences to the operators +, -, *, / and | of keops formulas
+        reduction = eval(formula, {"__builtins__": {}}, namespace)
+    except (NameError, SyntaxError, TypeError, AttributeError, KeyError):
+        raise NotImplementedError
+    if not isinstance(reduction, _Reduction):
+        raise NotImplementedError
+    return reduction, [variables[pos] for pos in range(len(variables))]
+
+
+class FallbackModule:
+    r"""
+    Dense NumPy/PyTorch implementation of the interface of a compiled keops module
+    (genred_numpy or genred_pytorch, tagIJ, dimout and formula).
+    Raise NotImplementedError if the formula is not supported.
+    """
+
+    def __init__(self, formula, aliases, lang):
+        self.formula = formula
+        self.lang = lang
+        self.reduction, self.variables = parse_formula(formula, aliases)
+        self.tagIJ = self.reduction.tagIJ
+        self.dimout = self.reduction.dim
+
+    def genred_numpy(
+        self,
+        tagCpuGpu,
+        tag1D2D,
+        tagHostDevice,
+        device_id,
+        num_threads,
+        pin_threads,
+        out,
+        ranges,
+        nx,
+        ny,
+        *args
+    ):
+        return self.genred(out, ranges, nx, ny, *args)
+
+    def genred_pytorch(
+        self,
+        tagCpuGpu,
+        tag1D2D,
+        tagHostDevice,
+        device_id,
+        num_threads,
+        pin_threads,
+        out,
+        ranges,
+        nx,
+        ny,
+        *args
+    ):
+        return self.genred(out, ranges, nx, ny, *args)
+
+    def genred(self, res, ranges, nx, ny, *args):
+        # block-sparse reductions and batch dimensions are not supported
+        if ranges or len(args) != len(self.variables):
+            raise NotImplementedError
+        for (arg, (cat, dim)) in zip(args, self.variables):
+            if arg.shape[-1:] != (dim,) or len(arg.shape) != (1 if cat == 2 else 2):
+                raise NotImplementedError
+
+        nout, nred = (nx, ny) if self.tagIJ == 0 else (ny, nx)
+        out_args = [
+            arg for (arg, (cat, _)) in zip(args, self.variables) if cat == self.tagIJ
+        ]
+        red_args = [
+            arg
+            for (arg, (cat, _)) in zip(args, self.variables)
+            if cat == 1 - self.tagIJ
+        ]
+        if not out_args or not red_args or nout == 0 or nout * nred > max_size:
+            raise NotImplementedError
+
+        tools = get_tools(self.lang)
+        one = tools.ones_like(args[0].reshape(-1)[:1]).reshape(1, 1, 1)
+        lines = max(1, block_size // max(nred, 1))
+        out = []
+        for start in range(0, nout, lines):
+            # variables indexed by the output are cut in blocks of lines, the other ones are broadcasted
+            block_vars = [
+                arg[start : start + lines, None, :]
+                if cat == self.tagIJ
+                else arg[None, :, :]
+                if cat == 1 - self.tagIJ
+                else arg[None, None, :]
+                for (arg, (cat, _)) in zip(args, self.variables)
+            ]
+            block = tools.zeros_like(
+                out_args[0][start : start + lines, None, :1]
+            ) + tools.zeros_like(red_args[0][None, :, :1])
+            out.append(self.reduction.reduce(_Env(tools, block_vars, one, block)))
+        out = tools.concat(out, axis=0)
+        if res is None:
+            return out
+        # as the compiled modules, write the result in the pre-allocated output buffer
+        if tuple(res.shape) != tuple(out.shape):
+            raise ValueError(
+                "[KeOps] The 'out' argument should be of shape {} but is of shape {}.".format(
+                    tuple(out.shape), tuple(res.shape)
+                )
+            )
+        res[...] = out
+        return res
@@ -0,0 +1,197 @@
+r"""
+Symbolic representation of the formulas encoded by the :class:`LazyTensor`.
+
+Every operation on a :class:`LazyTensor` adds a node on top of the (immutable) nodes
+of its operands, so that building an expression takes a constant time per operation and
+that sub-expressions are shared between the :class:`LazyTensor` that use them.
+The KeOps formula string is only produced when needed, e.g. at reduction time,
+by a single traversal of the graph.
+
+Nodes are hashable and compared structurally, so that they may be used as keys of caches.
+"""
+
+
+class FormulaNode:
+    r"""Abstract node of a formula graph.
+
+    The attribute **args** is a tuple whose items are either children nodes
+    or plain Python values (integers, strings), which are written "as is" in the formula.
+    """
+
+    __slots__ = ("args", "_hash")
+
+    def __init__(self, *args):
+        self.args = args
+        self._hash = hash((type(self).__name__,) + args)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        # iterative comparison, to support arbitrarily deep formulas
+        stack = [(self, other)]
+        while stack:
+            a, b = stack.pop()
+            if a is b:
+                continue
+            if type(a) is not type(b) or a._hash != b._hash:
+                return False
+            if len(a.args) != len(b.args):
+                return False
+            for u, v in zip(a.args, b.args):
+                if isinstance(u, FormulaNode):
+                    stack.append((u, v))
+                elif u != v:
+                    return False
+        return True
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, to_string(self))
+
+    def children(self):
+        return [a for a in self.args if isinstance(a, FormulaNode)]
+
+    def with_args(self, args):
+        r"""Returns a node of the same type, with new arguments."""
+        res = object.__new__(type(self))
+        FormulaNode.__init__(res, *args)
+        return res
+
+    def tokens(self, labels):
+        r"""Writes the node as a list of strings and children nodes, which are written in place."""
+        raise NotImplementedError
+
+
+class Variable(FormulaNode):
+    r"""Variable of a formula: ``Var(key,dim,cat)``.
+
+    For variables that hold some data, **key** is the temporary identifier ``id(x)`` of the array,
+    which is replaced by the final position of the variable in the list of arguments
+    at serialization time. For symbolic variables (``VarSymb``), **key** is already the final position.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, key, dim, cat, symbolic=False):
+        super().__init__(key, dim, cat, symbolic)
+
+    @property
+    def key(self):
+        return self.args[0]
+
+    @property
+    def cat(self):
+        return self.args[2]
+
+    @property
+    def symbolic(self):
+        return self.args[3]
+
+    def tokens(self, labels):
+        key, dim, cat, symbolic = self.args
+        if labels is None:  # Raw formula, before the labelling of the variables
+            return [
+                "{}({},{},{})".format("VarSymb" if symbolic else "Var", key, dim, cat)
+            ]
+        if not symbolic:
+            key = labels.get(key, key)
+        return ["Var({},{},{})".format(key, dim, cat)]
+
+
+class Operation(FormulaNode):
+    r"""Call to a KeOps operation: ``name(arg1<sep>arg2<sep>...)``."""
+
+    __slots__ = ()
+
+    def __init__(self, name, *operands, sep=", "):
+        super().__init__(name, sep, *operands)
+
+    def tokens(self, labels):
+        name, sep, *operands = self.args
+        res = [name, "("]
+        for (k, operand) in enumerate(operands):
+            res += [operand] if k == 0 else [sep, operand]
+        return res + [")"]
+
+
+class Operator(FormulaNode):
+    r"""Infix operator: ``(left op right)``."""
+
+    __slots__ = ()
+
+    def __init__(self, op, left, right):
+        super().__init__(op, left, right)
+
+    def tokens(self, labels):
+        op, left, right = self.args
+        return ["(", left, " " + op + " ", right, ")"]
+
+
+def _post_order(node):
+    r"""Iterates over the distinct nodes of a graph, children first."""
+    visited = set()
+    stack = [(node, False)]
+    while stack:
+        n, expanded = stack.pop()
+        if expanded:
+            yield n
+        elif id(n) not in visited:
+            visited.add(id(n))
+            stack.append((n, True))
+            stack.extend((c, False) for c in reversed(n.children()))
+
+
+def to_string(node, labels=None):
+    r"""Serializes a formula graph as a KeOps formula string.
+
+    Args:
+        node (FormulaNode): root of the formula.
+        labels (dict, optional): final positions of the variables, indexed by their temporary keys.
+            If **None**, the raw formula is returned, with ``Var(id(x),...)`` and ``VarSymb(...)`` symbols.
+    """
+    if node is None:
+        return None
+    # Iterative depth-first traversal, which writes the tokens in a single output list:
+    # the memory footprint is linear in the size of the formula, even for deep graphs.
+    out = []
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, FormulaNode):
+            stack.extend(reversed(item.tokens(labels)))
+        else:
+            out.append(str(item))
+    return "".join(out)
+
+
+def variables_categories(*nodes):
+    r"""Returns a dict ``{key: cat}`` of the (non symbolic) variables of some formula graphs."""
+    cats = {}
+    for node in nodes:
+        if node is not None:
+            for n in _post_order(node):
+                if isinstance(n, Variable) and not n.symbolic:
+                    cats.setdefault(n.key, n.cat)
+    return cats
+
+
+def swap_categories(node):
+    r"""Returns a copy of a formula graph where the :math:`i`- and :math:`j`-variables are switched."""
+    if node is None:
+        return None
+    new_nodes = {}
+    for n in _post_order(node):
+        if isinstance(n, Variable):
+            key, dim, cat, symbolic = n.args
+            new_nodes[id(n)] = (
+                Variable(key, dim, 1 - cat, symbolic) if cat in (0, 1) else n
+            )
+        else:
+            args = tuple(
+                new_nodes[id(a)] if isinstance(a, FormulaNode) else a for a in n.args
+            )
+            new_nodes[id(n)] = n.with_args(args)
+    return new_nodes[id(node)]
@@ -17,10 +17,16 @@ class SetBackend:
     dev = OrderedDict([("CPU", 0), ("GPU", 1)])
     grid = OrderedDict([("1D", 0), ("2D", 1)])
     memtype = OrderedDict([("host", 0), ("device", 1)])
+    # on the CPU, the "grid" tag selects the implementation of the reduction
+    cpu_scheme = OrderedDict([("1D", 0), ("tiled", 1), ("simd", 2), ("2D", 3)])
 
     possible_options_list = [
         "auto",
         "CPU",
+        "CPU_1D",
+        "CPU_tiled",
+        "CPU_simd",
+        "CPU_2D",
         "GPU",
         "GPU_1D",
         "GPU_1D_device",
@@ -33,7 +39,10 @@ class SetBackend:
     def define_tag_backend(self, backend, variables):
         """
         Try to make a good guess for the backend...  available methods are: (host means Cpu, device means Gpu)
-           CPU : computations performed with the host from host arrays
+           CPU : computations performed with the host from host arrays (with the 2D scheme if there are few output lines)
+           CPU_tiled : computations performed with the host from host arrays, using tiles of i and j indices
+           CPU_simd : same as CPU_tiled, with the formula evaluated on packs of j indices with SIMD instructions
+           CPU_2D : computations performed with the host from host arrays, splitting the reduction between the threads
            GPU_1D_device : computations performed on the device from device arrays, using the 1D scheme
            GPU_2D_device : computations performed on the device from device arrays, using the 2D scheme
            GPU_1D_host : computations performed on the device from host arrays, using the 1D scheme
@@ -65,6 +74,12 @@ class SetBackend:
                 self._find_grid(),
                 self._find_mem(variables),
             )
+        elif split_backend[0] == "CPU":  # CPU_1D, CPU_tiled, CPU_simd or CPU_2D
+            return (
+                self.dev["CPU"],
+                self.cpu_scheme[split_backend[1]],
+                self._find_mem(variables),
+            )
         elif len(split_backend) == 2:  # GPU_1D or GPU_2D
             return (
                 self.dev[split_backend[0]],
@@ -136,3 +151,27 @@ def get_tag_backend(backend, variables, str=False):
         return res.define_tag_backend(backend, variables)
     else:
         return res.define_backend(backend, variables)
+
+
+############################################################
+#     threads of the cpu reductions
+############################################################
+
+
+def get_cpu_threads(num_threads=None):
+    """
+    Return the (num_threads, pin_threads) integers passed to the keops modules, from the
+    num_threads option of a call (None means pykeops.config.num_threads) and pykeops.config.pin_threads.
+    num_threads=0 lets OpenMP choose the number of threads.
+    """
+    if num_threads is None:
+        num_threads = pykeops.config.num_threads
+    if num_threads is None:
+        num_threads = 0
+    elif not isinstance(num_threads, (int, np.integer)) or num_threads < 1:
+        raise ValueError(
+            "[pyKeOps] num_threads should be None or a positive integer, but is {}.".format(
+                num_threads
+            )
+        )
+    return int(num_threads), int(bool(pykeops.config.pin_threads))
@@ -14,6 +14,9 @@ array_t generic_red(
         int tag1D2D,          // tag1D2D=0       means 1D Gpu scheme,      tag1D2D=1       means 2D Gpu scheme
         int tagHostDevice,    // tagHostDevice=1 means _fromDevice suffix. tagHostDevice=0 means _fromHost suffix
         int Device_Id,        // id of GPU device
+        int num_threads,      // number of threads of the Cpu reductions (0 means the OpenMP default)
+        int pin_threads,      // pin_threads=1 binds the threads of the Cpu reductions to the cpus of the process
+        py::object py_out,    // None, or a pre-allocated array_t in which the result is written
         py::tuple py_ranges,  // () if no "sparsity" ranges are given (default behavior)
                               // Otherwise, ranges is a 6-uple of (integer) array_t
                               // ranges = (ranges_i, slices_i, redranges_j, ranges_j, slices_j, redranges_i)
@@ -44,6 +47,12 @@ array_t generic_red(
   for (int i = 0; i < nranges; i++)
     ranges[i] = py::cast< index_t >(py_ranges[i]);
 
+  // Cast the output buffer, if any. The Python binders ensure that this is not a copy.
+  bool has_out = !py_out.is_none();
+  array_t out;
+  if (has_out)
+    out = py::cast< array_t >(py_out);
+
 //////////////////////////////////////////////////////////////
 // Call Cuda codes                                          //
 //////////////////////////////////////////////////////////////
@@ -58,7 +67,10 @@ array_t generic_red(
            nargs,
            &args[0],
            nranges,
-           &ranges[0]);
+           &ranges[0],
+           num_threads,
+           pin_threads,
+           has_out ? &out : nullptr);
   py::gil_scoped_acquire acquire;
   return result;
 }
@@ -1,15 +1,53 @@
+import fcntl
 import importlib.util
 import os
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 
 import pykeops.config
 from pykeops.common.compile_routines import (
     compile_generic_routine,
+    compile_generic_routine_direct,
+    use_direct_compilation,
+    get_direct_build_folder_name,
+    get_or_build_direct_template_object,
     get_pybind11_template_name,
     get_build_folder_name,
+    get_template_build_folder,
+    get_template_link_command,
+    get_or_build_pybind11_template,
     check_or_prebuild,
+    link_keops_module,
+    get_batch_folder,
+    configure_batch_routines,
+    build_batch_routines,
+    clean_batch_routines,
 )
-from pykeops.common.utils import module_exists, create_and_lock_build_folder
-from pykeops.common.set_path import create_name
+from pykeops.common.utils import (
+    module_exists,
+    create_and_lock_build_folder,
+    FileLock,
+)
+from pykeops.common.set_path import (
+    create_name,
+    touch_module,
+    open_module_lock,
+    evict_cache,
+)
+from pykeops.common.fallback import FallbackModule
+
+
+def check_compilation_allowed(dll_name, formula):
+    if not pykeops.config.allow_compilation:
+        raise ImportError(
+            "[pyKeOps]: keops module {} for formula {} is not in {} and on-the-fly compilation is disabled "
+            "(pykeops.config.allow_compilation is False). Please precompile it with "
+            "'python -m pykeops.precompile'.".format(
+                dll_name, formula, pykeops.config.bin_folder
+            )
+        )
 
 
 class LoadKeOps:
@@ -31,8 +69,14 @@ class LoadKeOps:
         self.optional_flags = optional_flags
         self.include_dirs = include_dirs
 
+        # on cpu, formulas may be compiled without cmake (see compile_generic_routine_direct)
+        self.direct = use_direct_compilation(dtype, lang)
+
         # get build folder name for dtype
-        self.build_folder = get_build_folder_name(dtype, lang, include_dirs)
+        if self.direct:
+            self.build_folder = get_direct_build_folder_name(dtype, lang, include_dirs)
+        else:
+            self.build_folder = get_build_folder_name(dtype, lang, include_dirs)
 
         # get template name for dtype
         self.template_name = get_pybind11_template_name(dtype, lang, include_dirs)
@@ -45,10 +89,24 @@ class LoadKeOps:
         if (not module_exists(self.dll_name, self.template_name)) or (
             pykeops.config.build_type == "Debug"
         ):
+            check_compilation_allowed(self.dll_name, self.formula)
             self._safe_compile()
+            evict_cache(keep=[self.dll_name])
 
     @create_and_lock_build_folder()
     def _safe_compile(self):
+        if self.direct:
+            compile_generic_routine_direct(
+                self.formula,
+                self.aliases,
+                self.dll_name,
+                self.dtype,
+                self.lang,
+                self.optional_flags,
+                self.include_dirs,
+                self.build_folder,
+            )
+            return
         # if needed, safely run cmake in build folder to prepare for building
         check_or_prebuild(self.dtype, self.lang, self.include_dirs)
         # launch compilation and linking of required KeOps formula
@@ -64,21 +122,388 @@ class LoadKeOps:
         )
 
     def import_module(self):
-        full_dll_name = self.dll_name + "." + self.template_name
-        module_bin_folder = os.path.dirname(
-            os.path.dirname(importlib.util.find_spec(full_dll_name).origin)
+        # N.B.: module names are content-addressed (see create_name), so a module found in another
+        # folder of the python path (or already imported from an older bin_folder) is the very same.
+        # The shared lock prevents evict_cache from removing the module while it is imported.
+        lock = open_module_lock(self.dll_name)
+        with ExitStack() as stack:
+            if lock is not None:
+                stack.enter_context(lock)
+                stack.enter_context(FileLock(lock, fcntl.LOCK_SH))
+            if not module_exists(self.dll_name, self.template_name):
+                # the module has been evicted by another process in the meantime
+                check_compilation_allowed(self.dll_name, self.formula)
+                self._safe_compile()
+            touch_module(self.dll_name)
+            return importlib.import_module(self.dll_name + "." + self.template_name)
+
+
+ModuleCacheInfo = namedtuple(
+    "ModuleCacheInfo", ["hits", "misses", "maxsize", "currsize"]
+)
+
+
+class ModuleCache:
+    """
+    Process-wide LRU cache of the keops modules that have already been imported.
+    Instantiating a LoadKeOps object hashes the formula, looks for the module on disk and
+    re-imports it: the cache skips all of this when the very same routine is requested twice.
+    Note: This class is thread safe.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._modules = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            module = self._modules.get(key)
+            if module is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._modules.move_to_end(key)
+            return module
+
+    def put(self, key, module):
+        with self._lock:
+            self._modules[key] = module
+            self._modules.move_to_end(key)
+            while len(self._modules) > max(self.maxsize, 0):
+                self._modules.popitem(last=False)
+
+    def remove(self, key):
+        with self._lock:
+            self._modules.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._modules.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return ModuleCacheInfo(
+                self.hits, self.misses, self.maxsize, len(self._modules)
+            )
+
+    def __len__(self):
+        return len(self._modules)
+
+
+module_cache = ModuleCache(pykeops.config.module_cache_size)
+
+
+def load_keops_module(
+    formula, aliases, dtype, lang, optional_flags=[], include_dirs=[]
+):
+    """
+    Return the keops module that corresponds to the given formula, aliases, dtype and lang,
+    using the in-process module_cache if possible. The module is loaded (and compiled if needed)
+    with LoadKeOps otherwise.
+    """
+    # the bin_folder is part of the key, as modules are not shared between cache directories
+    key = (
+        formula,
+        tuple(aliases),
+        dtype,
+        lang,
+        tuple(optional_flags),
+        tuple(include_dirs),
+        pykeops.config.bin_folder,
+    )
+
+    if pykeops.config.build_type == "Debug":  # always recompile in Debug mode
+        return LoadKeOps(
+            formula, aliases, dtype, lang, optional_flags, include_dirs
+        ).import_module()
+
+    module = module_cache.get(key)
+    if module is not None:
+        # keep the module up to date for the eviction of the least recently used modules,
+        # at most once a minute (AsyncKeOpsModule objects have no name)
+        name = getattr(module, "__name__", None)
+        if name is not None:
+            touch_module(name.split(".")[0], min_interval=60)
+    else:
+        if pykeops.config.async_compilation:
+            return load_keops_module_async(
+                key, formula, aliases, dtype, lang, optional_flags, include_dirs
+            )
+        module = LoadKeOps(
+            formula, aliases, dtype, lang, optional_flags, include_dirs
+        ).import_module()
+        module_cache.put(key, module)
+    return module
+
+
+class AsyncKeOpsModule:
+    """
+    Stand-in for a keops module that is compiled in a background thread (see pykeops.config.async_compilation).
+    Until the compilation is over, the calls are computed by a FallbackModule: the calls that it does not
+    support wait for the compiled module, which is used for all the calls afterwards.
+    """
+
+    def __init__(self, future, fallback):
+        self.future = future
+        self.fallback = fallback
+        self.tagIJ = fallback.tagIJ
+        self.dimout = fallback.dimout
+        self.formula = fallback.formula
+
+    def ready(self):
+        return self.future.done()
+
+    def wait(self):
+        return self.future.result()
+
+    def genred_numpy(self, *args):
+        if not self.ready():
+            try:
+                return self.fallback.genred_numpy(*args)
+            except NotImplementedError:
+                pass
+        return self.wait().genred_numpy(*args)
+
+    def genred_pytorch(self, *args):
+        if not self.ready():
+            try:
+                return self.fallback.genred_pytorch(*args)
+            except NotImplementedError:
+                pass
+        return self.wait().genred_pytorch(*args)
+
+
+# background compilations of load_keops_module_async
+_async_executor = ThreadPoolExecutor(thread_name_prefix="pykeops-compile")
+
+
+def load_keops_module_async(
+    key, formula, aliases, dtype, lang, optional_flags, include_dirs
+):
+    """
+    Return the keops module of load_keops_module if it is already compiled, or an AsyncKeOpsModule that
+    compiles it in a background thread otherwise. Formulas that are not supported by FallbackModule
+    are compiled synchronously.
+    """
+    dll_name = create_name(formula, aliases, dtype, lang, optional_flags)
+    template_name = get_pybind11_template_name(dtype, lang, include_dirs)
+    fallback = None
+    if not module_exists(dll_name, template_name):
+        try:
+            fallback = FallbackModule(formula, aliases, lang)
+        except NotImplementedError:
+            pass
+    if fallback is None:
+        module = LoadKeOps(
+            formula, aliases, dtype, lang, optional_flags, include_dirs
+        ).import_module()
+        module_cache.put(key, module)
+        return module
+
+    check_compilation_allowed(dll_name, formula)
+    future = _async_executor.submit(
+        lambda: LoadKeOps(
+            formula, aliases, dtype, lang, optional_flags, include_dirs
+        ).import_module()
+    )
+    module = AsyncKeOpsModule(future, fallback)
+    module_cache.put(key, module)
+
+    def compiled(future):
+        # the compiled module replaces the AsyncKeOpsModule in the cache
+        if future.exception() is None:
+            module_cache.put(key, future.result())
+        else:
+            module_cache.remove(key)
+
+    future.add_done_callback(compiled)
+    return module
+
+
+def compile_keops_modules(specs, jobs=None):
+    """
+    Compile the keops shared libraries of several formulas at once. specs is a list of dicts
+    holding the arguments of LoadKeOps (formula, aliases, dtype, lang and optionally
+    optional_flags and include_dirs). Formulas that share a build folder (i.e. the same dtype,
+    lang and include_dirs) are compiled by a single call to make with at most jobs
+    parallel jobs, then linked one after the other against the shared pybind11 template.
+    Note: This function is thread/process safe: each formula is protected by its own file lock,
+    and the build folder is only locked exclusively while cmake files are (re)generated and while
+    linking.
+
+    :return: The list of the names of the compiled shared libraries.
+    """
+    groups = OrderedDict()
+    for spec in specs:
+        formula, aliases, dtype, lang = (
+            spec["formula"],
+            spec["aliases"],
+            spec["dtype"],
+            spec["lang"],
         )
-        if not os.path.samefile(
-            module_bin_folder,
-            pykeops.config.bin_folder,
+        optional_flags = spec.get("optional_flags", [])
+        include_dirs = spec.get("include_dirs", [])
+        dll_name = create_name(formula, aliases, dtype, lang, optional_flags)
+        template_name = get_pybind11_template_name(dtype, lang, include_dirs)
+        if module_exists(dll_name, template_name) and (
+            pykeops.config.build_type != "Debug"
         ):
-            raise ImportError(
-                "[pyKeOps]: Current pykeops.config.bin_folder is {} but keops module {} is loaded from {} folder. "
-                "This may happened when changing bin_folder **after** loading a keops module. Please check everything "
-                "is fine.".format(
-                    pykeops.config.bin_folder,
-                    self.dll_name,
-                    module_bin_folder,
+            continue
+        check_compilation_allowed(dll_name, formula)
+        group = groups.setdefault((dtype, lang, tuple(include_dirs)), OrderedDict())
+        group[dll_name] = (formula, aliases, dll_name, optional_flags)
+
+    compiled = []
+    for ((dtype, lang, include_dirs), routines) in groups.items():
+        compiled += _compile_batch(dtype, lang, list(include_dirs), routines, jobs)
+    if compiled:
+        evict_cache(keep=compiled)
+    return compiled
+
+
+def _compile_batch(dtype, lang, include_dirs, routines, jobs):
+    if use_direct_compilation(dtype, lang):
+        return _compile_batch_direct(dtype, lang, include_dirs, routines, jobs)
+
+    build_folder = get_build_folder_name(dtype, lang, include_dirs)
+    template_name = get_pybind11_template_name(dtype, lang, include_dirs)
+    os.makedirs(get_batch_folder(build_folder), exist_ok=True)
+
+    with ExitStack() as stack:
+        # per-formula locks, acquired in a fixed order to avoid deadlocks between concurrent batches
+        dll_names = []
+        for dll_name in sorted(routines):
+            f = stack.enter_context(
+                open(
+                    get_batch_folder(build_folder) + os.path.sep + dll_name + ".lock",
+                    "w",
                 )
             )
-        return importlib.import_module(full_dll_name)
+            stack.enter_context(FileLock(f))
+            # the formula may have been compiled by another process in the meantime
+            if (not module_exists(dll_name, template_name)) or (
+                pykeops.config.build_type == "Debug"
+            ):
+                dll_names.append(dll_name)
+        if not dll_names:
+            return []
+
+        with open(os.path.join(build_folder, "pykeops_build2.lock"), "w") as f:
+            with FileLock(f):
+                check_or_prebuild(dtype, lang, include_dirs)
+                configure_batch_routines(
+                    build_folder, dtype, [routines[dll_name] for dll_name in dll_names]
+                )
+
+            # the object files of other batches may be built concurrently in the same folder
+            with FileLock(f, fcntl.LOCK_SH):
+                object_files = build_batch_routines(build_folder, dll_names, jobs)
+            # formulas that remain to be linked; dll_names is kept whole for the cleanup
+            to_link = list(zip(dll_names, object_files))
+
+            with FileLock(f):
+                if not os.path.exists(
+                    get_template_build_folder(template_name)
+                    + os.path.sep
+                    + "CMakeCache.txt"
+                ):
+                    # the first formula is used to build the pybind11 template
+                    os.rename(
+                        object_files[0],
+                        build_folder
+                        + os.path.sep
+                        + pykeops.config.shared_obj_name
+                        + ".o",
+                    )
+                    get_or_build_pybind11_template(
+                        dtype, lang, include_dirs, use_prebuilt_formula=True
+                    )
+                    link_keops_module(dll_names[0], template_name)
+                    to_link = to_link[1:]
+
+            # when the link command of the template is known, formulas are linked in parallel
+            # against the precompiled template object (see link_keops_module)
+            parallel_link = get_template_link_command(template_name) is not None
+            with FileLock(f, fcntl.LOCK_SH if parallel_link else fcntl.LOCK_EX):
+                with ThreadPoolExecutor(
+                    max_workers=(os.cpu_count() if jobs is None else jobs)
+                    if parallel_link
+                    else 1
+                ) as executor:
+                    list(
+                        executor.map(
+                            lambda args: link_keops_module(
+                                args[0], template_name, args[1]
+                            ),
+                            to_link,
+                        )
+                    )
+                clean_batch_routines(build_folder, dll_names)
+
+    print("Done.", flush=True)
+    return dll_names
+
+
+def _compile_batch_direct(dtype, lang, include_dirs, routines, jobs):
+    build_folder = get_direct_build_folder_name(dtype, lang, include_dirs)
+    template_name = get_pybind11_template_name(dtype, lang, include_dirs)
+    os.makedirs(build_folder, exist_ok=True)
+
+    with ExitStack() as stack:
+        # per-formula locks, acquired in a fixed order to avoid deadlocks between concurrent batches
+        dll_names = []
+        for dll_name in sorted(routines):
+            f = stack.enter_context(
+                open(build_folder + os.path.sep + dll_name + ".lock", "w")
+            )
+            stack.enter_context(FileLock(f))
+            # the formula may have been compiled by another process in the meantime
+            if (not module_exists(dll_name, template_name)) or (
+                pykeops.config.build_type == "Debug"
+            ):
+                dll_names.append(dll_name)
+        if not dll_names:
+            return []
+
+        with open(os.path.join(build_folder, "pykeops_build2.lock"), "w") as f:
+            with FileLock(f):
+                get_or_build_direct_template_object(
+                    dtype, lang, include_dirs, build_folder
+                )
+
+            # each formula is compiled by its own compiler process
+            with FileLock(f, fcntl.LOCK_SH):
+
+                def compile_routine(dll_name):
+                    formula, aliases, _, optional_flags = routines[dll_name]
+                    compile_generic_routine_direct(
+                        formula,
+                        aliases,
+                        dll_name,
+                        dtype,
+                        lang,
+                        optional_flags,
+                        include_dirs,
+                        build_folder,
+                    )
+
+                with ThreadPoolExecutor(
+                    max_workers=os.cpu_count() if jobs is None else jobs
+                ) as executor:
+                    list(executor.map(compile_routine, dll_names))
+
+    return dll_names
+
+
+def load_keops_modules(specs, jobs=None):
+    """
+    Return the keops modules of a list of specs (see compile_keops_modules), compiling all the
+    missing ones at once.
+    """
+    compile_keops_modules(specs, jobs)
+    return [load_keops_module(**spec) for spec in specs]
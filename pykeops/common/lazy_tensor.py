@@ -1,8 +1,17 @@
 import copy
-import re
+import functools
 
 import numpy as np
 
+from pykeops.common.formula_tree import (
+    Operation,
+    Operator,
+    Variable,
+    swap_categories,
+    to_string,
+    variables_categories,
+)
+from pykeops.common.operations import LOBPCGSolver
 from pykeops.common.utils import check_broadcasting
 
 
@@ -20,6 +29,21 @@ def is_scalar_and_equals(x, val):
         return False
 
 
+@functools.lru_cache(maxsize=1024)
+def _cached_routine(routine, *args, **kwargs):
+    return routine(*args, **kwargs)
+
+
+def get_routine(routine, *args, **kwargs):
+    r"""Instantiates a :mod:`Genred` or :mod:`KernelSolve` routine, re-using the instances
+    created with the same (hashable) arguments."""
+    try:
+        hash((args, tuple(kwargs.items())))
+    except TypeError:  # e.g. lists of optional_flags
+        return routine(*args, **kwargs)
+    return _cached_routine(routine, *args, **kwargs)
+
+
 class GenericLazyTensor:
     r"""Symbolic wrapper for NumPy arrays and PyTorch tensors. This is the abstract class,
     end user should use :class:`pykeops.numpy.LazyTensor` or :class:`pykeops.torch.LazyTensor`.
@@ -36,12 +60,17 @@ class GenericLazyTensor:
     back to NumPy arrays or PyTorch tensors with
     efficient reduction routines, which outperform
     standard tensorized implementations by two orders of magnitude.
+
+    The formula is stored as a graph of :mod:`FormulaNode <pykeops.common.formula_tree>` objects
+    (attributes **tree** and **tree2**), which is only written as a KeOps formula string
+    (attributes **formula** and **formula2**) when needed.
     """
 
     variables = ()
     symbolic_variables = ()
-    formula = None
-    formula2 = None
+    tree = None
+    tree2 = None
+    labels = None  # Final positions of the variables, set by fixvariables()
     ndim = None
     tools = None
     Genred = None
@@ -124,12 +153,12 @@ class GenericLazyTensor:
                 self.symbolic_variables = (x,)
                 self.ndim = x[1]
                 self.axis = x[2]
-                self.formula = "VarSymb({},{},{})".format(x[0], self.ndim, self.axis)
+                self.tree = Variable(x[0], self.ndim, self.axis, symbolic=True)
                 return  # That's it!
 
             # Integer constants are best handled directly by the compiler
             elif typex == int:
-                self.formula = "IntCst(" + str(x) + ")"
+                self.tree = Operation("IntCst", x)
                 self.ndim = 1
                 self.axis = 2
                 return  # That's it!
@@ -152,7 +181,7 @@ class GenericLazyTensor:
                 self.variables = (x,)
                 self.ndim = len(x)
                 self.axis = 2
-                self.formula = "Var({},{},2)".format(id(x), self.ndim)
+                self.tree = Variable(id(x), self.ndim, 2)
                 return  # That's it!
             else:
                 self.dtype = self.tools.dtypename(self.tools.dtype(x))
@@ -205,7 +234,7 @@ class GenericLazyTensor:
                 )
 
             # id(x) is used as temporary identifier for KeOps "Var",
-            # this identifier will be changed when calling method "fixvariables"
+            # this identifier will be replaced by a label when calling method "fixvariables"
             # But first we do a small hack, in order to distinguish same array involved twice in a formula but with
             # different axis (e.g. Vi(x)-Vj(x) formula): we do a dummy reshape in order to get a different id
             if axis == 1:
@@ -214,7 +243,7 @@ class GenericLazyTensor:
             self.variables = (x,)
             self.ndim = x.shape[-1]
             self.axis = axis
-            self.formula = "Var({},{},{})".format(id(x), self.ndim, self.axis)
+            self.tree = Variable(id(x), self.ndim, self.axis)
 
             if axis == 0:
                 self.ni = x.shape[-2]
@@ -231,7 +260,7 @@ class GenericLazyTensor:
             self.variables = (x,)
             self.ndim = x.shape[-1]
             self.axis = 2
-            self.formula = "Var({},{},2)".format(id(x), self.ndim)
+            self.tree = Variable(id(x), self.ndim, 2)
 
         else:
             raise ValueError(
@@ -241,9 +270,9 @@ class GenericLazyTensor:
 
     def fixvariables(self):
         r"""If needed, assigns final labels to each variable and pads their batch dimensions prior to a :mod:`Genred()` call."""
+        if self.labels is not None:  # The variables have already been labelled
+            return
         newvars = ()
-        if self.formula2 is None:
-            self.formula2 = ""  # We don't want to get regexp errors...
         device = None  # Useful to load lists (and float constants) on the proper device
         for v in self.variables:
             device = self.tools.device(v)
@@ -251,22 +280,20 @@ class GenericLazyTensor:
                 break
         i = len(self.symbolic_variables)  # The first few labels are already taken...
 
+        # Categories of the variables that actually appear in the formulas,
+        # indexed by the temporary identifiers id(x):
+        cats = variables_categories(self.tree, self.tree2)
+        labels = {}
+
         # So let's loop over our tensors, and give them labels:
         for v in self.variables:
             idv = id(v)
-            if type(v) == list:
-                v = self.tools.array(v, self.dtype, device)
-
-            # Replace "Var(idv," by "Var(i," and increment 'i':
-            tag = "Var({},".format(idv)
-            if tag in self.formula + self.formula2:
-                self.formula = self.formula.replace(tag, "Var({},".format(i))
-                self.formula2 = self.formula2.replace(tag, "Var({},".format(i))
+            if idv in cats and idv not in labels:
+                if type(v) == list:
+                    v = self.tools.array(v, self.dtype, device)
+                labels[idv] = i
                 # Detect if v is meant to be used as a variable or as a parameter:
-                str_cat_v = re.search(
-                    r"Var\({},\d+,([012])\)".format(i), self.formula + self.formula2
-                ).group(1)
-                is_variable = 1 if str_cat_v in ("0", "1") else 0
+                is_variable = 1 if cats[idv] in (0, 1) else 0
                 dims_to_pad = self.nbatchdims + 1 + is_variable - len(v.shape)
                 padded_v = self.tools.view(v, (1,) * dims_to_pad + v.shape)
                 newvars += (padded_v,)
@@ -277,18 +304,21 @@ class GenericLazyTensor:
                     self.rec_multVar_highdim = i
                 i += 1
 
-        # "VarSymb(..)" appear when users rely on the "LazyTensor(Ind,Dim,Cat)" syntax,
-        # for the sake of disambiguation:
-        self.formula = self.formula.replace(
-            "VarSymb(", "Var("
-        )  # We can now replace them with
-        self.formula2 = self.formula2.replace(
-            "VarSymb(", "Var("
-        )  # actual "Var" symbols
-        if self.formula2 == "":
-            self.formula2 = None  # The pre-processing step is now over
+        # The formula strings will now be written with "Var(i,...)" symbols,
+        # including for the "VarSymb(..)" that come from the "LazyTensor(Ind,Dim,Cat)" syntax:
+        self.labels = labels
         self.variables = newvars
 
+    @property
+    def formula(self):
+        r"""KeOps formula string, written from the graph **tree**."""
+        return to_string(self.tree, self.labels)
+
+    @property
+    def formula2(self):
+        r"""KeOps formula string of the optional second argument of the reduction, written from the graph **tree2**."""
+        return to_string(self.tree2, self.labels)
+
     def separate_kwargs(self, kwargs):
         # separating keyword arguments for Genred init vs Genred call...
         # Currently the only four additional optional keyword arguments that are passed to Genred init
@@ -407,13 +437,11 @@ class GenericLazyTensor:
 
         res = self.init()  # Copy of self, without a formula
         if opt_arg2 is not None:
-            res.formula = "{}({},{},{})".format(
-                operation, self.formula, opt_arg, opt_arg2
-            )
+            res.tree = Operation(operation, self.tree, opt_arg, opt_arg2, sep=",")
         elif opt_arg is not None:
-            res.formula = "{}({},{})".format(operation, self.formula, opt_arg)
+            res.tree = Operation(operation, self.tree, opt_arg, sep=",")
         else:
-            res.formula = "{}({})".format(operation, self.formula)
+            res.tree = Operation(operation, self.tree, sep=",")
         res.ndim = dimres
         return res
 
@@ -478,31 +506,27 @@ class GenericLazyTensor:
         res.ndim = dimres
 
         if not rversion:
-            lformula, rformula = self.formula, other.formula
+            ltree, rtree = self.tree, other.tree
         else:
-            rformula, lformula = self.formula, other.formula
+            rtree, ltree = self.tree, other.tree
 
         if is_operator:
-            res.formula = "({} {} {})".format(lformula, operation, rformula)
+            res.tree = Operator(operation, ltree, rtree)
         elif opt_arg is not None:
             if hasattr(opt_arg, "__GenericLazyTensor__"):
-                opt_arg = opt_arg.formula
+                opt_arg = opt_arg.tree
             if opt_pos == "last":
-                res.formula = "{}({}, {}, {})".format(
-                    operation, lformula, rformula, opt_arg
-                )
+                res.tree = Operation(operation, ltree, rtree, opt_arg)
             elif opt_pos == "middle":
-                res.formula = "{}({}, {}, {})".format(
-                    operation, lformula, opt_arg, rformula
-                )
+                res.tree = Operation(operation, ltree, opt_arg, rtree)
         else:
-            res.formula = "{}({}, {})".format(operation, lformula, rformula)
+            res.tree = Operation(operation, ltree, rtree)
 
         # special case of multiplication with a variable V : we define a special tag to enable factorization in case
         # the user requires a sum reduction over the opposite index (or any index if V is a parameter):
         # for example sum_i V_j k(x_i,y_j) = V_j sum_i k(x_i,y_j), so we will use KeOps reduction for the kernel
         # k(x_i,y_j) only, then multiply the result with V.
-        if operation == "*" and other.formula[:3] == "Var" and other.ndim > 100:
+        if operation == "*" and isinstance(other.tree, Variable) and other.ndim > 100:
             res.rec_multVar_highdim = (self, other)
 
         return res
@@ -573,14 +597,12 @@ class GenericLazyTensor:
 
         if opt_arg is not None:
             if hasattr(opt_arg, "__GenericLazyTensor__"):
-                opt_arg = opt_arg.formula
-            res.formula = "{}({}, {}, {}, {})".format(
-                operation, self.formula, other1.formula, other2.formula, opt_arg
+                opt_arg = opt_arg.tree
+            res.tree = Operation(
+                operation, self.tree, other1.tree, other2.tree, opt_arg
             )
         else:
-            res.formula = "{}({}, {}, {})".format(
-                operation, self.formula, other1.formula, other2.formula
-            )
+            res.tree = Operation(operation, self.tree, other1.tree, other2.tree)
 
         return res
 
@@ -619,6 +641,10 @@ class GenericLazyTensor:
             to perform the computation; a negative value lets your system
             choose the default GPU. This parameter is only useful if your
             system has access to several GPUs.
+          num_threads (int, default=None): Number of threads used by the CPU backends,
+            as detailed in the documentation of the :mod:`Genred <pykeops.torch.Genred>` module.
+          out (array or Tensor, default=None): Pre-allocated output buffer in which the result is written,
+            as detailed in the documentation of the :mod:`Genred <pykeops.torch.Genred>` module.
           ranges (6-uple of IntTensors, None by default):
             Ranges of integers that specify a
             :doc:`block-sparse reduction scheme <../../sparsity>`
@@ -657,12 +683,12 @@ class GenericLazyTensor:
 
         if other is None:
             res = self.init()  # ~ self.copy()
-            res.formula2 = None
+            res.tree2 = None
         else:
             res = self.join(other)
-            res.formula2 = other.formula
+            res.tree2 = other.tree
 
-        res.formula = self.formula
+        res.tree = self.tree
         res.reduction_op = reduction_op
         res.axis = axis - self.nbatchdims
         res.opt_arg = opt_arg
@@ -683,9 +709,10 @@ class GenericLazyTensor:
         if res.dtype is not None:
             res.fixvariables()  # Turn the "id(x)" numbers into consecutive labels
             # "res" now becomes a callable object:
-            res.callfun = res.Genred(
+            res.callfun = get_routine(
+                res.Genred,
                 res.formula,
-                [],
+                (),
                 res.reduction_op,
                 res.axis,
                 res.dtype,
@@ -716,6 +743,25 @@ class GenericLazyTensor:
             with respect to **var** and solve the equation ``self(var) = other``
             with respect to **var**.
           alpha (float, default=1e-10): Non-negative **ridge regularization** parameter.
+          method (string, default ``"vector"``): Specifies how a second member with several columns
+            is handled by the conjugate gradient solver: as a single vector (``"vector"``),
+            as independent systems that share the kernel reductions (``"columns"``),
+            with a block conjugate gradient (``"block"``) or as a single vector, with reductions
+            that also compute the scalar products of the iterations (``"fused"``),
+            as detailed in the documentation of the :mod:`KernelSolve <pykeops.torch.KernelSolve>` module.
+          eps (float, default=1e-6): Absolute tolerance of the conjugate gradient solver.
+          rtol (float, default=0): Relative tolerance of the solver, with respect to the norm of **other**.
+          x0 (array or Tensor, default=None): Starting point of the iterations, e.g. the solution
+            of a similar system. If **None**, we start from zero.
+          max_iter (int, default=None): Maximum number of iterations. If **None**, we iterate until convergence.
+          return_info (bool, default=False): If **True**, the solution is returned along with a
+            :class:`ConjugateGradientInfo <pykeops.common.operations.ConjugateGradientInfo>` object
+            that reports the iterations, the history of the residuals and the number of kernel evaluations,
+            as detailed in the documentation of the :mod:`KernelSolve <pykeops.torch.KernelSolve>` module.
+          precond (string, Preconditioner or function, default=None): Preconditioner of the solver:
+            ``"jacobi"`` (diagonal of the kernel matrix), ``"nystrom"`` (low-rank approximation of the kernel matrix),
+            a :class:`Preconditioner <pykeops.common.operations.Preconditioner>` object or a function ``r -> P^{-1} r``,
+            as detailed in the documentation of the :mod:`KernelSolve <pykeops.torch.KernelSolve>` module.
           call (bool): If **True** and if no other symbolic variable than
             **var** is contained in **self**, **solve** will return a tensor
             solution of our linear system. Otherwise **solve** will return
@@ -726,6 +772,8 @@ class GenericLazyTensor:
             to perform the computation; a negative value lets your system
             choose the default GPU. This parameter is only useful if your
             system has access to several GPUs.
+          num_threads (int, default=None): Number of threads used by the CPU backends,
+            as detailed in the documentation of the :mod:`Genred <pykeops.torch.Genred>` module.
           ranges (6-uple of IntTensors, None by default):
             Ranges of integers that specify a
             :doc:`block-sparse reduction scheme <../../sparsity>`
@@ -785,12 +833,12 @@ class GenericLazyTensor:
             # var is given and must be a symbolic variable which is already inside self
             varindex = var.symbolic_variables[0][0]
             res = self.init()
-            res.formula = self.formula
+            res.tree = self.tree
 
-        res.formula2 = None
+        res.tree2 = None
         res.reduction_op = "Solve"
         res.varindex = varindex
-        res.varformula = var.formula.replace("VarSymb", "Var")
+        res.varformula = to_string(var.tree, {})  # "VarSymb(...)" -> "Var(...)"
         res.other = other
         res.axis = axis
 
@@ -805,9 +853,10 @@ class GenericLazyTensor:
 
         if res.dtype is not None:
             res.fixvariables()
-            res.callfun = res.KernelSolve(
+            res.callfun = get_routine(
+                res.KernelSolve,
                 res.formula,
-                [],
+                (),
                 res.varformula,
                 res.axis,
                 res.dtype,
@@ -821,6 +870,95 @@ class GenericLazyTensor:
         else:
             return res
 
+    def eigsh(
+        self, k=6, which="LA", X0=None, tol=None, max_iter=200, seed=None, **kwargs
+    ):
+        r"""
+        Computes a few eigenvalues and eigenvectors of a symmetric matrix, using a matrix-free LOBPCG solver.
+
+        If ``K`` is a symmetric :class:`LazyTensor` of shape ``(N,N)`` (or ``(N,N,1)``),
+        ``K.eigsh(k)`` computes its **k** largest (or smallest) eigenvalues and the associated
+        eigenvectors with the locally optimal block preconditioned conjugate gradient method.
+        The matrix is never stored in memory: each iteration performs a single ``K @ V``
+        reduction on a ``(N,k)`` block of vectors.
+
+        Example:
+            >>> x = torch.randn(100000, 3)
+            >>> x_i, x_j = LazyTensor( x[:,None,:] ), LazyTensor( x[None,:,:] )
+            >>> K = (- ((x_i - x_j)**2).sum(2) ).exp()  # Symbolic (100000,100000) Gaussian kernel matrix
+            >>> eigenvalues, eigenvectors = K.eigsh(k=10)
+            >>> print(eigenvalues.shape, eigenvectors.shape)
+            torch.Size([10]) torch.Size([100000, 10])
+
+        Args:
+          k (int, default=6): Number of eigenpairs to compute. It should be smaller than :math:`N/3`.
+
+        Keyword args:
+          which (string, default ``"LA"``): ``"LA"`` for the largest (algebraic) eigenvalues,
+            ``"SA"`` for the smallest ones.
+          X0 (array or Tensor, default=None): ``(N,k)`` initial guess of the eigenvectors.
+            If **None**, we start from a random block of vectors.
+          tol (float, default=None): The iterations stop when the residual
+            :math:`\|Kx - \lambda x\|` of every (normalized) eigenpair is smaller than **tol** times
+            :math:`|\lambda|`. If **None**, **tol** is the square root of the machine precision of the data type.
+          max_iter (int, default=200): Maximum number of iterations.
+          seed (int, default=None): Seed of the random initial guess.
+          backend (string), device_id (int), num_threads (int), ranges (6-uple of IntTensors), ...:
+            Options of the ``K @ V`` reductions, as detailed in the documentation
+            of the :mod:`Genred <pykeops.torch.Genred>` module.
+
+        Returns:
+          A pair ``(eigenvalues, eigenvectors)``, where **eigenvalues** is a vector of size **k**,
+          sorted in decreasing (``"LA"``) or increasing (``"SA"``) order, and **eigenvectors**
+          is a ``(N,k)`` array or tensor whose columns are the associated orthonormal eigenvectors.
+
+        .. warning::
+
+            Please note that **no check** of symmetry will be performed: the result is
+            meaningless if ``K`` is not symmetric. The computation is not differentiable.
+        """
+        if which not in ("LA", "SA"):
+            raise ValueError(
+                "The 'which' argument of eigsh should be 'LA' or 'SA', but is {}.".format(
+                    which
+                )
+            )
+        if (
+            self.nbatchdims > 0
+            or self._shape[-1] != 1
+            or self._shape[-3] != self._shape[-2]
+            or len(self.symbolic_variables) > 0
+        ):
+            raise ValueError(
+                "eigsh is only supported for square LazyTensors without batch dimensions, "
+                + "symbolic variables and whose trailing dimension is equal to 1. "
+                + "Here, K.shape = {}.".format(self.shape)
+            )
+        N = self._shape[-2]
+        if not 0 < 3 * k < N:
+            raise ValueError(
+                "The number of eigenpairs k={} of eigsh should be positive and smaller than N/3 = {}: ".format(
+                    k, N / 3
+                )
+                + "please use a dense eigensolver for such small matrices."
+            )
+
+        if X0 is None:
+            device = None
+            for v in self.variables:
+                device = self.tools.device(v)
+                if device is not None:
+                    break
+            X0 = np.random.RandomState(seed).randn(N, k)
+            X0 = self.tools.array(X0, self.dtype, device)
+
+        def linop(V):
+            return self.__matmul__(V, **kwargs)
+
+        return LOBPCGSolver(
+            self.tools, linop, X0, largest=(which == "LA"), tol=tol, max_iter=max_iter
+        )
+
     def __call__(self, *args, **kwargs):
         r"""
         Executes a :mod:`Genred <pykeops.torch.Genred>` or :mod:`KernelSolve <pykeops.torch.KernelSolve>` call on the input data, as specified by **self.formula** .
@@ -851,19 +989,21 @@ class GenericLazyTensor:
             kwargs_init, self.kwargs = self.separate_kwargs(self.kwargs)
 
             if self.reduction_op == "Solve":
-                self.callfun = self.KernelSolve(
+                self.callfun = get_routine(
+                    self.KernelSolve,
                     self.formula,
-                    [],
-                    self.formula2,
+                    (),
+                    self.varformula,
                     self.axis,
                     self.dtype,
                     **kwargs_init,
                     rec_multVar_highdim=self.rec_multVar_highdim
                 )
             else:
-                self.callfun = self.Genred(
+                self.callfun = get_routine(
+                    self.Genred,
                     self.formula,
-                    [],
+                    (),
                     self.reduction_op,
                     self.axis,
                     self.dtype,
@@ -887,12 +1027,13 @@ class GenericLazyTensor:
         Returns a verbose string identifier.
         """
         tmp = self.init()  # ~ self.copy()
-        tmp.formula = self.formula
-        tmp.formula2 = None if not hasattr(self, "formula2") else self.formula2
+        tmp.tree, tmp.tree2, tmp.labels = self.tree, self.tree2, self.labels
 
         tmp.fixvariables()  # Replace Var(id(x),...) with consecutive labels
 
-        string = "KeOps LazyTensor\n    formula: {}".format(tmp.formula)
+        # The formulas are written only once
+        formula, formula2 = tmp.formula, tmp.formula2
+        string = "KeOps LazyTensor\n    formula: {}".format(formula)
         if len(self.symbolic_variables) > 0:
             string += "\n    symbolic variables: Var{}".format(
                 self.symbolic_variables[0]
@@ -906,8 +1047,8 @@ class GenericLazyTensor:
             string += "\n    reduction: {} (axis={})".format(
                 self.reduction_op, self.axis
             )
-            if tmp.formula2 is not None:
-                string += "\n        formula2: {}".format(tmp.formula2)
+            if formula2 is not None:
+                string += "\n        formula2: {}".format(formula2)
             if hasattr(self, "opt_arg") and self.opt_arg is not None:
                 string += "\n        opt_arg: {}".format(self.opt_arg)
         return string
@@ -2099,27 +2240,9 @@ class GenericLazyTensor:
         elif res.axis == 1:
             res.axis = 0
 
-        if res.formula is not None:  # Switch variables with CAT=0 and CAT=1
-            res.formula = re.sub(
-                r"(Var|VarSymb)\((\d+),(\d+),0\)", r"\1(\2,\3,i)", res.formula
-            )
-            res.formula = re.sub(
-                r"(Var|VarSymb)\((\d+),(\d+),1\)", r"\1(\2,\3,0)", res.formula
-            )
-            res.formula = re.sub(
-                r"(Var|VarSymb)\((\d+),(\d+),i\)", r"\1(\2,\3,1)", res.formula
-            )
-
-        if res.formula2 is not None:  # Switch variables with CAT=0 and CAT=1
-            res.formula2 = re.sub(
-                r"(Var|VarSymb)\((\d+),(\d+),0\)", r"\1(\2,\3,i)", res.formula2
-            )
-            res.formula2 = re.sub(
-                r"(Var|VarSymb)\((\d+),(\d+),1\)", r"\1(\2,\3,0)", res.formula2
-            )
-            res.formula2 = re.sub(
-                r"(Var|VarSymb)\((\d+),(\d+),i\)", r"\1(\2,\3,1)", res.formula2
-            )
+        # Switch variables with CAT=0 and CAT=1
+        res.tree = swap_categories(res.tree)
+        res.tree2 = swap_categories(res.tree2)
 
         return res
 
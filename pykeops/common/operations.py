@@ -1,6 +1,9 @@
+import re
+
 import numpy as np
 
-from pykeops.common.utils import get_tools
+from pykeops.common.parse_type import Alias, get_signature
+from pykeops.common.utils import axis2cat, get_tools
 
 
 # Some advance operations defined at user level use in fact other reductions.
@@ -80,33 +83,566 @@ def postprocess(out, binding, reduction_op, nout, opt_arg, dtype):
     return out
 
 
-def ConjugateGradientSolver(binding, linop, b, eps=1e-6):
+def check_arg_size(reduction_op, nred, dtype):
+    if "Arg" in reduction_op:
+        # when using Arg type reductions,
+        # if nred is greater than 16 millions and dtype=float32, the result is not reliable
+        # because we encode indices as floats, so we raise an exception ;
+        # same with float16 type and nred>2048
+        if nred > 1.6e7 and dtype in ("float32", "float"):
+            raise ValueError(
+                "size of input array is too large for Arg type reduction with single precision. Use double precision."
+            )
+        elif nred > 2048 and dtype in ("float16", "half"):
+            raise ValueError(
+                "size of input array is too large for Arg type reduction with float16 dtype.."
+            )
+
+
+# Reductions whose KeOps output is modified by postprocess: they cannot be written in place.
+postprocessed_reductions = (
+    "SumSoftMaxWeight",
+    "SoftMax",
+    "ArgMin",
+    "ArgMax",
+    "Min_ArgMin",
+    "MinArgMin",
+    "Max_ArgMax",
+    "MaxArgMax",
+    "KMin",
+    "ArgKMin",
+    "KMin_ArgKMin",
+    "KMinArgKMin",
+    "LogSumExp",
+)
+
+
+def check_out(out, binding, reduction_op, dtype):
+    # Sanity checks on a pre-allocated output buffer, before it is given to the KeOps routine.
+    # Its shape is checked by the C++ binder, which writes the result directly in its memory.
+    tools = get_tools(binding)
+    if reduction_op in postprocessed_reductions:
+        raise ValueError(
+            "[pyKeOps] The 'out' argument is not supported with the {} reduction, "
+            "whose output is post-processed.".format(reduction_op)
+        )
+    if dtype in ("float16", "half"):
+        raise ValueError(
+            "[pyKeOps] The 'out' argument is not supported with float16 computations."
+        )
+    dtype = {"float": "float32", "double": "float64"}.get(dtype, dtype)
+    if tools.dtypename(tools.dtype(out)) != dtype:
+        raise ValueError(
+            "[pyKeOps] The 'out' argument should be of dtype {}, but is of dtype {}.".format(
+                dtype, tools.dtypename(tools.dtype(out))
+            )
+        )
+    if not tools.is_contiguous(out):
+        raise ValueError("[pyKeOps] The 'out' argument should be a contiguous array.")
+
+
+class ConjugateGradientInfo:
+    r"""
+    Convergence report of a conjugate gradient solve, as returned by
+    :class:`KernelSolve` and :meth:`LazyTensor.solve` with **return_info** = True.
+
+    Attributes:
+        converged (bool): **True** if the stopping criterion was met before **max_iter** iterations.
+        iterations (int): Number of iterations of the solver.
+        kernel_evaluations (int): Number of calls to the kernel reduction, including
+            the evaluation of the initial residual when a starting point **x0** is given.
+        residuals (list): Euclidean norms of the successive residuals :math:`b - (\alpha\operatorname{Id}+K_{xx})a`,
+            starting with the initial one. With the ``"columns"`` and ``"block"`` methods,
+            each item is the list of the norms of the columns.
+    """
+
+    def __init__(self):
+        self.converged = False
+        self.iterations = 0
+        self.kernel_evaluations = 0
+        self.residuals = []
+
+    def __repr__(self):
+        return "ConjugateGradientInfo(converged={}, iterations={}, kernel_evaluations={}, residual={})".format(
+            self.converged,
+            self.iterations,
+            self.kernel_evaluations,
+            self.residuals[-1] if self.residuals else None,
+        )
+
+
+def ConjugateGradientSolver(
+    binding,
+    linop,
+    b,
+    eps=1e-6,
+    method="vector",
+    x0=None,
+    max_iter=None,
+    rtol=0,
+    info=None,
+    precond=None,
+):
     # Conjugate gradient algorithm to solve linear system of the form
     # Ma=b where linop is a linear operation corresponding
-    # to a symmetric and positive definite matrix
+    # to a symmetric and positive definite matrix.
+    # With method="vector", a (N,D) second member b is handled as a single vector of size N*D.
+    # With method="columns" or "block", the D systems M a[:,k] = b[:,k] share the calls to linop,
+    # but have their own step sizes and stopping criteria.
+    # With method="fused", b is handled as a single vector and linop(p) returns the pair (Mp, <p,Mp>),
+    # computed with a single pass on the data (see fused_reduction).
+    # The iterations start from x0 (or zero) and stop when |r|^2 < max(size(b) * eps^2, rtol^2 * |b|^2),
+    # or after max_iter iterations. If given, the ConjugateGradientInfo object info is filled
+    # with a report on the convergence.
+    # If given, precond is a function r -> P^{-1} r, where P is a symmetric positive definite
+    # approximation of M, and the iterations are those of the preconditioned conjugate gradient.
     tools = get_tools(binding)
-    delta = tools.size(b) * eps ** 2
-    a = 0
-    r = tools.copy(b)
+    if info is None:
+        info = ConjugateGradientInfo()
+
+    def counted_linop(x):
+        info.kernel_evaluations += 1
+        return linop(x)
+
+    if method in ("columns", "block"):
+        if len(b.shape) == 2:
+            return BlockConjugateGradientSolver(
+                tools,
+                counted_linop,
+                b,
+                eps=eps,
+                block=(method == "block"),
+                x0=x0,
+                max_iter=max_iter,
+                rtol=rtol,
+                info=info,
+                precond=precond,
+            )
+    elif method not in ("vector", "fused"):
+        raise ValueError(
+            "[pyKeOps] The 'method' of the conjugate gradient solver should be "
+            + "'vector', 'columns', 'block' or 'fused', but is {}.".format(method)
+        )
+    fused = method == "fused"
+    delta = max(tools.size(b) * eps ** 2, rtol ** 2 * float((b ** 2).sum()))
+    if x0 is None:
+        a = 0 * b
+        r = tools.copy(b)
+    else:
+        a = tools.copy(x0)
+        r = b - (counted_linop(a)[0] if fused else counted_linop(a))
     nr2 = (r ** 2).sum()
+    info.residuals.append(float(nr2) ** 0.5)
     if nr2 < delta:
-        return 0 * r
-    p = tools.copy(r)
+        info.converged = True
+        return a
+    z = r if precond is None else precond(r)
+    rz = (r * z).sum()
+    p = tools.copy(z)
     k = 0
-    while True:
-        Mp = linop(p)
-        alp = nr2 / (p * Mp).sum()
+    while max_iter is None or k < max_iter:
+        if fused:
+            Mp, pMp = counted_linop(p)
+        else:
+            Mp = counted_linop(p)
+            pMp = (p * Mp).sum()
+        alp = rz / pMp
         a += alp * p
         r -= alp * Mp
-        nr2new = (r ** 2).sum()
-        if nr2new < delta:
+        nr2 = (r ** 2).sum()
+        k += 1
+        info.residuals.append(float(nr2) ** 0.5)
+        if nr2 < delta:
+            info.converged = True
+            break
+        z = r if precond is None else precond(r)
+        rznew = (r * z).sum()
+        p = z + (rznew / rz) * p
+        rz = rznew
+    info.iterations = k
+    return a
+
+
+def BlockConjugateGradientSolver(
+    tools,
+    linop,
+    b,
+    eps=1e-6,
+    block=False,
+    x0=None,
+    max_iter=None,
+    rtol=0,
+    info=None,
+    precond=None,
+):
+    # Conjugate gradient algorithm for the D systems M a[:,k] = b[:,k], where b is a (N,D) array.
+    # Each iteration performs a single call to linop on a (N,D) array of search directions.
+    # If block=False, the columns follow independent CG iterations, with their own step sizes.
+    # If block=True, we use the block CG algorithm of O'Leary (1980): the step of each column
+    # is computed in the span of all the current search directions, which usually saves iterations
+    # when the columns of b are correlated.
+    # In both cases, the columns that have converged are frozen and removed from the search directions.
+    # The stopping criteria, x0, max_iter, rtol, info and precond are those of ConjugateGradientSolver,
+    # column-wise.
+    if info is None:
+        info = ConjugateGradientInfo()
+    nb2 = (b ** 2).sum(0)
+    delta_abs = b.shape[0] * eps ** 2
+    delta = rtol ** 2 * nb2
+    delta = delta + (delta < delta_abs) * (delta_abs - delta)  # column-wise maximum
+    if x0 is None:
+        a = 0 * b
+        r = tools.copy(b)
+    else:
+        a = tools.copy(x0)
+        r = b - linop(a)
+    z = r if precond is None else precond(r)
+    rz = (r * z).sum(0)
+    p = tools.copy(z)
+    nr2 = (r ** 2).sum(0)
+    info.residuals.append((nr2 ** 0.5).tolist())
+    # relative threshold on the eigenvalues of the Gram matrix of the search directions
+    tol_dep = np.finfo(tools.dtypename(tools.dtype(b))).eps
+    k = 0
+    while True:
+        active = tools.astype(
+            nr2 >= delta, b
+        )  # 1 for the columns that have not converged
+        if active.sum() == 0:
+            info.converged = True
+            break
+        if max_iter is not None and k >= max_iter:
             break
-        p = r + (nr2new / nr2) * p
-        nr2 = nr2new
+        p = p * active
+        if block:
+            # The block iterations only depend on the span of the search directions:
+            # we replace them by an orthonormal basis of this span, computed from the
+            # (D,D) Gram matrix, and drop the (numerically) dependent directions -
+            # including the frozen ones. Otherwise, the small systems below become
+            # singular as soon as two search directions get colinear.
+            # The columns are normalized first, so that the Gram matrix only reflects their angles.
+            p = p / ((p ** 2).sum(0) ** 0.5 + (1 - active))
+            s, V = tools.eigh(tools.transpose(p) @ p)
+            indep = tools.astype(s > tol_dep * s.max(), b)
+            p = p @ (V * (indep / (s + (1 - indep)) ** 0.5))
+        Mp = linop(p)
+        if block:
+            # Small (D,D) systems, made invertible on the dropped directions:
+            pMp = tools.transpose(p) @ Mp + tools.diag(1 - indep)
+            alp = tools.solve(pMp, tools.transpose(p) @ r) * active
+            a += p @ alp
+            r -= Mp @ alp
+            nr2 = (r ** 2).sum(0)
+            z = r if precond is None else precond(r)
+            bet = -tools.solve(pMp, tools.transpose(Mp) @ z)
+            p = z + p @ bet
+        else:
+            # The step sizes of the frozen columns are set to zero:
+            alp = active * rz / ((p * Mp).sum(0) + (1 - active))
+            a += alp * p
+            r -= alp * Mp
+            nr2 = (r ** 2).sum(0)
+            z = r if precond is None else precond(r)
+            rznew = (r * z).sum(0)
+            p = z + (rznew / (rz + (1 - active))) * p
+            rz = rznew
         k += 1
+        info.residuals.append((nr2 ** 0.5).tolist())
+    info.iterations = k
     return a
 
 
+def LOBPCGSolver(tools, linop, X, largest=True, tol=None, max_iter=200):
+    # Locally optimal block preconditioned conjugate gradient (Knyazev, 2001) for the k extreme
+    # eigenpairs of a symmetric matrix M, given by linop, starting from the (N,k) array X.
+    # Each iteration performs a single call to linop on a (N,k) array: the Rayleigh-Ritz step is
+    # done in the span of the current eigenvectors X, of the residuals W and of the previous
+    # search directions P, with the products MX and MP updated by linear combinations.
+    # As in Hetmaniuk and Lehoucq (2006), the bases of W and P are kept orthonormal, so that
+    # the Rayleigh-Ritz step is a standard (3k,3k) symmetric eigenproblem.
+    # The iterations stop when |M x - lambda x| <= tol * |lambda| for every eigenpair, or after
+    # max_iter iterations. Returns the (k,) eigenvalues, sorted by decreasing (largest=True) or
+    # increasing (largest=False) order, and the (N,k) array of the associated eigenvectors.
+    k = X.shape[1]
+    if tol is None:
+        tol = np.finfo(tools.dtypename(tools.dtype(X))).eps ** 0.5
+    sign = 1 if largest else -1
+
+    def signed_linop(x):
+        return sign * linop(x)
+
+    def orthonormalize(W, *bases):
+        # two passes of Gram-Schmidt against the bases, followed by a QR decomposition
+        for _ in range(2):
+            for V in bases:
+                W = W - V @ (tools.transpose(V) @ W)
+            W = tools.qr(W)[0]
+        return W
+
+    def rayleigh_ritz(S, MS):
+        G = tools.transpose(S) @ MS
+        theta, Y = tools.eigh((G + tools.transpose(G)) / 2)
+        idx = list(range(len(theta) - 1, len(theta) - k - 1, -1))  # k largest values
+        return theta[idx], Y[:, idx]
+
+    X = orthonormalize(X)
+    MX = signed_linop(X)
+    theta, Y = rayleigh_ritz(X, MX)
+    X, MX = X @ Y, MX @ Y
+    P, MP = None, None
+    for _ in range(max_iter):
+        R = MX - X * theta
+        if ((R ** 2).sum(0) ** 0.5 <= tol * abs(theta)).all():
+            break
+        bases = (X,) if P is None else (X, P)
+        W = orthonormalize(R, *bases)
+        MW = signed_linop(W)
+        S = tools.concat(bases[:1] + (W,) + bases[1:], axis=1)
+        MS = tools.concat((MX, MW) if P is None else (MX, MW, MP), axis=1)
+        theta, Y = rayleigh_ritz(S, MS)
+        # The new search directions are the components of the new eigenvectors along W and P,
+        # orthonormalized against them in the coordinates of the orthonormal basis S:
+        Z = tools.copy(Y)
+        Z[:k] = 0
+        Z = orthonormalize(Z, Y)
+        X, MX = S @ Y, MS @ Y
+        P, MP = S @ Z, MS @ Z
+    return sign * theta, X
+
+
+def fused_reduction(formula, aliases, varinvpos, axis):
+    r"""
+    Formula and aliases of the reduction used by the ``"fused"`` conjugate gradient solver.
+
+    With :math:`F_{ij}` the formula of a :class:`KernelSolve` routine, which is linear with respect
+    to the variable :math:`p_j` at position **varinvpos**, the reduction computes
+    :math:`\sum_j F_{ij} + c\, p_i` and :math:`\sum_j \langle p_i, F_{ij} \rangle + c\, |p_i|^2`,
+    concatenated in an array with :math:`D+1` columns. The vector :math:`p` is given twice,
+    with the two categories, followed by the scalar parameter :math:`c`: with :math:`c = \alpha / N`,
+    where :math:`N` is the number of reduced indices, the reduction computes the products with
+    :math:`\alpha \operatorname{Id} + K_{xx}`. :math:`F_{ij}` is only evaluated once.
+    """
+    cat = axis2cat(axis)
+    dim = get_signature(aliases)[varinvpos].dim
+    dotvar = "Var({},{},{})".format(len(aliases), dim, cat)
+    ridge = "Var({},1,2)".format(len(aliases) + 1)
+    return (
+        "Sum_Reduction(Factorize(Concat(({F}) + {c} * {v}, ({v} | ({F})) + {c} * SqNorm2({v})), {F}),{cat})".format(
+            F=formula, v=dotvar, c=ridge, cat=cat
+        ),
+        list(aliases) + [dotvar, ridge],
+    )
+
+
+class KernelOperator:
+    r"""
+    Entries of the matrix :math:`\alpha \operatorname{Id} + K_{xx}` of a :class:`KernelSolve` routine,
+    applied to a given list of arguments. This is the object that preconditioners are built from.
+
+    The variable with respect to which we solve the system is seen as a flat vector of size
+    :math:`n = N \cdot D`, where :math:`(N,D)` is its shape: the :math:`p`-th entry of the vector
+    is ``a[p // D, p % D]``.
+    """
+
+    def __init__(self, binding, routine, args, alpha, **options):
+        self.tools = get_tools(binding)
+        self.routine = routine
+        self.args = args
+        self.alpha = alpha
+        self.options = options  # backend, device_id, num_threads of the reductions
+        self.shape = args[routine.varinvpos].shape
+        self.size = self.shape[0] * self.shape[1]
+        # Category of the variables indexed by the reduction index, e.g. "j" if axis = 1
+        self.redcat = 1 - axis2cat(routine.axis)
+
+    def unit(self, nlines, k):
+        # (nlines, D) array of zeros, with ones in the k-th column
+        e = 0 * self.args[self.routine.varinvpos][:nlines]
+        e[:, k] = 1
+        return e
+
+    def diagonal(self):
+        r"""Returns the diagonal of the matrix, as a :math:`(N,D)` array.
+
+        The diagonal is extracted symbolically from the formula: the variables indexed
+        by the reduction index are turned into variables indexed by the output index,
+        and the formula is evaluated once per column of the unknown variable.
+        """
+        routine, outcat = self.routine, 1 - self.redcat
+        formula = re.sub(
+            r"Var\(\s*(\d+)\s*,\s*(\d+)\s*,\s*{}\s*\)".format(self.redcat),
+            r"Var(\1,\2,{})".format(outcat),
+            routine.kernel_formula,
+        )
+        aliases = [
+            str(Alias(name, outcat if cat == self.redcat else cat, dim, pos))
+            for (name, cat, dim, pos) in routine.signature
+        ]
+        # A dummy variable indexed by the reduction index, with a single line, sets the size of the reduction:
+        dummy = "Var({},1,{})".format(len(aliases), self.redcat)
+        diag_routine = self.tools.Genred(
+            "(" + formula + ") * " + dummy,
+            aliases + [dummy],
+            reduction_op="Sum",
+            axis=routine.axis,
+            dtype=routine.dtype,
+        )
+        one = 0 * self.args[routine.varinvpos][:1, :1] + 1
+        diag = 0 * self.args[routine.varinvpos]
+        for k in range(self.shape[1]):
+            args = list(self.args)
+            args[routine.varinvpos] = self.unit(self.shape[0], k)
+            diag[:, k] = diag_routine(*args, one, **self.options)[:, k]
+        return diag + self.alpha
+
+    def column(self, p):
+        r"""Returns the :math:`p`-th column of the matrix, as a :math:`(N,D)` array."""
+        routine = self.routine
+        i, k = p // self.shape[1], p % self.shape[1]
+        if not hasattr(self, "column_routine"):
+            self.column_routine = self.tools.Genred(
+                routine.kernel_formula,
+                routine.aliases,
+                reduction_op="Sum",
+                axis=routine.axis,
+                dtype=routine.dtype,
+            )
+        # The variables indexed by the reduction index are restricted to their i-th line:
+        args = [
+            arg[i : i + 1] if sig.cat == self.redcat else arg
+            for (arg, sig) in zip(self.args, routine.signature)
+        ]
+        args[routine.varinvpos] = self.unit(1, k)
+        col = self.column_routine(*args, **self.options)
+        col[i, k] += self.alpha
+        return col
+
+
+class Preconditioner:
+    r"""
+    Base class of the preconditioners of :class:`KernelSolve` and :meth:`LazyTensor.solve`.
+
+    The method :meth:`build` takes as input a :class:`KernelOperator` and returns
+    a function ``r -> P^{-1} r``, where :math:`P` is a symmetric positive definite
+    approximation of the matrix :math:`\alpha \operatorname{Id} + K_{xx}`.
+    """
+
+    def build(self, op):
+        raise NotImplementedError
+
+
+class JacobiPreconditioner(Preconditioner):
+    r"""
+    Jacobi preconditioner: :math:`P` is the diagonal of :math:`\alpha \operatorname{Id} + K_{xx}`,
+    which is extracted symbolically from the formula.
+    """
+
+    def build(self, op):
+        diag = op.diagonal()
+        return lambda r: r / diag
+
+
+class NystromPreconditioner(Preconditioner):
+    r"""
+    Nyström preconditioner, built from a partial pivoted Cholesky decomposition
+    :math:`K_{xx} \simeq L L^\top` of rank **rank**: :math:`P = L L^\top + \mu \operatorname{Id}`,
+    where :math:`\mu` is the sum of :math:`\alpha` and of the mean of the residual diagonal
+    :math:`\operatorname{diag}(K_{xx} - L L^\top)`.
+
+    Each step of the decomposition computes a single column of :math:`K_{xx}`, with a reduction whose
+    cost is linear in the number of points, so that the preconditioner can be built for arbitrary formulas.
+
+    Args:
+        rank (int, default=100): Maximal rank of the low-rank approximation.
+        pivoting (string, default ``"random"``): Choice of the pivots, i.e. of the columns of :math:`K_{xx}`
+            that are computed: ``"random"`` samples them with probabilities that are proportional
+            to the residual diagonal (randomly pivoted Cholesky, which is robust to redundant points),
+            ``"greedy"`` picks the largest entry of the residual diagonal.
+        tol (float, default=0): The decomposition stops early when the trace of the residual diagonal
+            is smaller than **tol** times the trace of :math:`K_{xx}`.
+        seed (int, default=None): Seed of the random pivoting.
+    """
+
+    def __init__(self, rank=100, pivoting="random", tol=0, seed=None):
+        if pivoting not in ("random", "greedy"):
+            raise ValueError(
+                "[pyKeOps] The pivoting of the Nystrom preconditioner should be "
+                + "'random' or 'greedy', but is {}.".format(pivoting)
+            )
+        self.rank = rank
+        self.pivoting = pivoting
+        self.tol = tol
+        self.seed = seed
+
+    def build(self, op):
+        tools = op.tools
+        d = tools.view(op.diagonal() - op.alpha, (-1,))  # diagonal of K_xx
+        d = d * (d > 0)
+        trace = float(d.sum())
+        rng = np.random.RandomState(self.seed)
+        L = None
+        for t in range(min(self.rank, op.size)):
+            if float(d.sum()) <= self.tol * trace or float(d.max()) <= 0:
+                break
+            if self.pivoting == "greedy":
+                p = int(d.argmax())
+            else:
+                prob = tools.numpy(d).astype("float64")
+                p = int(rng.choice(op.size, p=prob / prob.sum()))
+            col = tools.view(op.column(p), (-1,))
+            col[p] -= op.alpha
+            if L is not None:
+                col = col - L @ L[p]
+            if float(col[p]) <= 0:
+                break
+            col = col / float(col[p]) ** 0.5
+            L = col[:, None] if L is None else tools.concat((L, col[:, None]), axis=1)
+            d = d - col ** 2
+            d = d * (d > 0)
+
+        mu = op.alpha + float(d.sum()) / op.size
+        if L is None or mu <= 0:
+            return None if mu <= 0 else (lambda r: r / mu)
+
+        # Woodbury formula: (L L^T + mu Id)^{-1} = (Id - L (L^T L + mu Id)^{-1} L^T) / mu
+        S = tools.transpose(L) @ L + tools.diag(0 * L[0] + mu)
+
+        def invprecondop(r):
+            v = tools.view(r, (-1, 1))
+            v = (v - L @ tools.solve(S, tools.transpose(L) @ v)) / mu
+            return tools.view(v, r.shape)
+
+        return invprecondop
+
+
+def get_preconditioner(binding, precond, routine, args, alpha, **kwargs):
+    r"""
+    Turns the **precond** argument of :class:`KernelSolve` into a function ``r -> P^{-1} r``
+    (or **None**, without preconditioning). **precond** may be **None**, ``"jacobi"``,
+    ``"nystrom"``, a :class:`Preconditioner` object or an arbitrary function.
+    """
+    if precond is None:
+        return None
+    if isinstance(precond, str):
+        if precond == "jacobi":
+            precond = JacobiPreconditioner()
+        elif precond == "nystrom":
+            precond = NystromPreconditioner()
+        else:
+            raise ValueError(
+                "[pyKeOps] The preconditioner should be 'jacobi', 'nystrom', "
+                + "a Preconditioner object or a function, but is {}.".format(precond)
+            )
+    if isinstance(precond, Preconditioner):
+        return precond.build(KernelOperator(binding, routine, args, alpha, **kwargs))
+    if callable(precond):
+        return precond
+    raise ValueError(
+        "[pyKeOps] The preconditioner should be 'jacobi', 'nystrom', "
+        + "a Preconditioner object or a function."
+    )
+
+
 def KernelLinearSolver(
     binding, K, x, b, alpha=0, eps=1e-6, precond=False, precondKernel=None
 ):
@@ -1,14 +1,79 @@
+import functools
 import re
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 
 categories = OrderedDict([("Vi", 0), ("Vj", 1), ("Pm", 2)])
 
+# regular expressions of the alias strings, compiled once
+named_alias_regex = re.compile(
+    r"([a-zA-Z_][a-zA-Z_0-9]*)=(Vi|Vj|Pm)\(([0-9]*?),?([0-9]*)\)"
+)
+alias_regex = re.compile(r"(Vi|Vj|Pm)\(([0-9]*?),?([0-9]*)\)")
+var_regex = re.compile(r"Var\(([0-9]*?),?([0-9]*),?([0-9]*)\)")
+
+
+class Alias(namedtuple("Alias", ["name", "cat", "dim", "pos"])):
+    r"""
+    Parsed, immutable signature of a variable of a KeOps formula.
+
+    Aliases may be given to :class:`Genred <pykeops.numpy.Genred>` and :class:`KernelSolve <pykeops.numpy.KernelSolve>`
+    either as strings such as ``"x = Vi(3)"``, or directly as signature objects such as ``Alias("x", "Vi", 3)``.
+    They are parsed once, when the routine is created.
+
+    Args:
+        name (string or None): The name of the variable in the formula, or **None** for a ``Var(pos,dim,cat)`` variable.
+        cat (int or string): The category of the variable: 0 or ``"Vi"``, 1 or ``"Vj"``, 2 or ``"Pm"``.
+        dim (int): The dimension of the variable.
+        pos (int or None): The position of the variable in the list of arguments,
+            or **None** if it is given by the position of the alias in the list of aliases.
+
+    Example:
+        >>> Alias("x", "Vi", 3)
+        Alias(name='x', cat=0, dim=3, pos=None)
+        >>> str(Alias("x", "Vi", 3, 1))
+        'x = Vi(1,3)'
+        >>> Alias.parse("y = Vj(2)")
+        Alias(name='y', cat=1, dim=2, pos=None)
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, name, cat, dim, pos=None):
+        cat = categories.get(cat, cat)
+        if cat not in categories.values():
+            raise ValueError(
+                "[pyKeOps] The category of an alias should be 'Vi', 'Vj', 'Pm' (or 0, 1, 2), but is "
+                + str(cat)
+            )
+        return super().__new__(
+            cls, name, int(cat), int(dim), None if pos is None else int(pos)
+        )
+
+    @classmethod
+    def parse(cls, type_str, position_in_list=None):
+        r"""
+        Parse an alias string, such as ``"x = Vi(3)"``, ``"Vj(1,3)"`` or ``"Var(0,3,2)"``.
+        """
+        return get_type(type_str, position_in_list=position_in_list)
+
+    def __str__(self):
+        if self.name is None and self.pos is not None:
+            return (
+                "Var(" + str(self.pos) + "," + str(self.dim) + "," + str(self.cat) + ")"
+            )
+        pos = "" if self.pos is None else str(self.pos) + ","
+        cat = list(categories.keys())[self.cat]
+        name = "" if self.name is None else self.name + " = "
+        return name + cat + "(" + pos + str(self.dim) + ")"
+
 
 def complete_aliases(formula, aliases):
     """
     This function parse formula (a string) to find pattern like 'Var(x,x,x)'.
-    It then append to aliases (list of strings), the extra 'Var(x,x,x)'.
+    It then returns aliases (list of strings or Alias objects) as a list of strings, with the extra 'Var(x,x,x)'.
     """
+    # signature objects are turned into strings, which are used to compile the formula
+    aliases = [str(alias) if isinstance(alias, Alias) else alias for alias in aliases]
     # first we detect all instances of Var(*,*,*) in formula.
     # These may be extra variables that are not listed in the aliases
     extravars = re.findall(r"Var\([0-9]+,[0-9]+,[0-9]+\)", formula.replace(" ", ""))
@@ -53,7 +118,17 @@ def parse_aliases(aliases):
     return tuple(categories), tuple(dimensions)
 
 
+def get_signature(aliases):
+    """
+    Parse a list of aliases once and for all, as a tuple of Alias objects with explicit positions.
+    """
+    return tuple(
+        get_type(alias, position_in_list=i) for (i, alias) in enumerate(aliases)
+    )
+
+
 def get_sizes(aliases, *args):
+    # N.B.: aliases is typically the signature of a routine, see get_signature
     nx, ny = None, None
     for (var_ind, sig) in enumerate(aliases):
         _, cat, dim, pos = get_type(sig, position_in_list=var_ind)
@@ -77,6 +152,16 @@ def get_sizes(aliases, *args):
 
 
 def get_type(type_str, position_in_list=None):
+    # signature objects are already parsed
+    if isinstance(type_str, Alias):
+        if type_str.pos is None and position_in_list is not None:
+            return type_str._replace(pos=int(position_in_list))
+        return type_str
+    return parse_type_str(type_str, position_in_list)
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_type_str(type_str, position_in_list=None):
     """
     Get the type of the variable declared in type_str.
 
@@ -86,7 +171,7 @@ def get_type(type_str, position_in_list=None):
     :param position_in_list: an optional integer used if the position is not given
                              in type_str (ie is of the form "var = Xy(dim)" or "Xy(dim)")
 
-    :return: name : a string (here "var"), cat : an int (0,1 or 2), dim : an int
+    :return: an Alias (name, cat, dim, pos) with name : a string (here "var"), cat : an int (0,1 or 2), dim : an int
     """
 
     # switch old Vx Vy syntax to Vi Vj
@@ -97,17 +182,12 @@ def get_type(type_str, position_in_list=None):
 
         warnings.warn("'Vx' and 'Vy' variables types are now renamed 'Vi' and 'Vj'")
 
-    m = re.match(
-        "([a-zA-Z_][a-zA-Z_0-9]*)=(Vi|Vj|Pm)\(([0-9]*?),?([0-9]*)\)",
-        type_str.replace(" ", ""),
-    )
+    m = named_alias_regex.match(type_str.replace(" ", ""))
 
     if m is None:
-        m = re.match("(Vi|Vj|Pm)\(([0-9]*?),?([0-9]*)\)", type_str.replace(" ", ""))
+        m = alias_regex.match(type_str.replace(" ", ""))
         if m is None:
-            m = re.match(
-                "Var\(([0-9]*?),?([0-9]*),?([0-9]*)\)", type_str.replace(" ", "")
-            )
+            m = var_regex.match(type_str.replace(" ", ""))
             if m is None:
                 raise ValueError(
                     type_str
@@ -116,7 +196,7 @@ def get_type(type_str, position_in_list=None):
                 )
             else:
                 # output: varname,          cat          ,     dim        , pos
-                return None, int(m.group(3)), int(m.group(2)), int(m.group(1))
+                return Alias(None, int(m.group(3)), int(m.group(2)), int(m.group(1)))
         else:
             # Try to infer position
             if m.group(2):
@@ -126,7 +206,7 @@ def get_type(type_str, position_in_list=None):
             else:
                 pos = None
             # output: varname,          cat          ,     dim        , pos
-            return None, categories[m.group(1)], int(m.group(3)), pos
+            return Alias(None, categories[m.group(1)], int(m.group(3)), pos)
     else:
         # Try to infer position
         if m.group(3):
@@ -136,28 +216,11 @@ def get_type(type_str, position_in_list=None):
         else:
             pos = None
         # output: varname,          cat          ,     dim        , pos
-        return m.group(1), categories[m.group(2)], int(m.group(4)), pos
+        return Alias(m.group(1), categories[m.group(2)], int(m.group(4)), pos)
 
 
 def check_aliases_list(types_list):
-    aliases = []
-    for (i, t) in enumerate(types_list):
-        name, cat, dim, pos = get_type(t, position_in_list=i)
-        if name == None:
-            aliases.append("Var(" + str(pos) + "," + str(dim) + "," + str(cat) + ")")
-        else:
-            aliases.append(
-                name
-                + " = "
-                + list(categories.keys())[cat]
-                + "("
-                + str(pos)
-                + ","
-                + str(dim)
-                + ")"
-            )
-
-    return aliases
+    return [str(get_type(t, position_in_list=i)) for (i, t) in enumerate(types_list)]
 
 
 def get_optional_flags(
@@ -1,6 +1,13 @@
+import fcntl
+import io
+import json
 import os
+import platform
 import shutil
 import sys
+import sysconfig
+import tarfile
+import time
 import warnings
 from hashlib import sha256
 
@@ -57,9 +64,73 @@ def set_bin_folder(bf_user=None, append_to_python_path=True):
     pykeops.config.bin_folder = bin_folder
 
 
+def set_shared_cache_folders(folders, append_to_python_path=True):
+    """
+    This function sets the list of read-only cache directories that are searched for keops modules
+    before pykeops.config.bin_folder. Missing modules are still compiled in bin_folder. It populates
+    the pykeops.config.shared_cache_folders variable (list of str) and adds the folders to the python
+    path, just before bin_folder.
+    """
+    shared_cache_folders = [
+        os.path.realpath(os.path.expanduser(folder)) + os.path.sep for folder in folders
+    ]
+
+    if append_to_python_path:
+        for folder in pykeops.config.shared_cache_folders + shared_cache_folders:
+            while folder in sys.path:
+                sys.path.remove(folder)
+        # modules are imported from the first folder of the python path that contains them
+        pos = (
+            sys.path.index(pykeops.config.bin_folder)
+            if pykeops.config.bin_folder in sys.path
+            else len(sys.path)
+        )
+        sys.path[pos:pos] = shared_cache_folders
+
+    pykeops.config.shared_cache_folders = shared_cache_folders
+
+
+def get_cache_search_path():
+    """
+    Return the list of the directories where keops modules are looked for: the shared
+    cache directories first, then pykeops.config.bin_folder.
+    """
+    return pykeops.config.shared_cache_folders + [pykeops.config.bin_folder]
+
+
+def get_abi_fingerprint(lang):
+    """
+    Return a string identifying the binary interface of the keops modules built for lang.
+    Two modules compiled from the same formula with the same fingerprint are interchangeable,
+    whatever the machine or the bin_folder they were built in.
+    The fingerprint must not read pykeops.config.gpu_available, which would probe the GPUs
+    each time a module name is computed: the build target only enters it when it is configured
+    with the environment variable PYKEOPS_GPU_AVAILABLE.
+    """
+    fingerprint = [
+        version,
+        sys.implementation.cache_tag,
+        str(sysconfig.get_config_var("EXT_SUFFIX")),
+        platform.system(),
+        platform.machine(),
+        pykeops.config.build_type,
+    ]
+    if "PYKEOPS_GPU_AVAILABLE" in os.environ:
+        fingerprint.append("gpu" if int(os.environ["PYKEOPS_GPU_AVAILABLE"]) else "cpu")
+    if lang == "torch":
+        import torch
+
+        fingerprint += [
+            torch.__version__,
+            "cxx11abi=" + str(int(torch._C._GLIBCXX_USE_CXX11_ABI)),
+        ]
+    return ",".join(fingerprint)
+
+
 def create_name(formula, aliases, dtype, lang, optional_flags):
     """
-    Compose the shared object name
+    Compose the shared object name. The name only depends on the content of the module (and not
+    on pykeops.config.bin_folder), so that caches can be shared between machines: see export_cache().
     """
     formula = formula.replace(" ", "")  # Remove spaces
     aliases = [alias.replace(" ", "") for alias in aliases]
@@ -70,9 +141,9 @@ def create_name(formula, aliases, dtype, lang, optional_flags):
     dll_name = (
         "libKeOps"
         + lang
-        + sha256((pykeops.config.bin_folder + dll_name).encode("utf-8")).hexdigest()[
-            :10
-        ]
+        + sha256(
+            (get_abi_fingerprint(lang) + ";" + dll_name).encode("utf-8")
+        ).hexdigest()[:10]
     )
     return dll_name
 
@@ -112,3 +183,244 @@ def clean_pykeops(path="", lang=""):
             continue
 
         print("    - " + f.path + " has been removed.")
+
+
+bundle_manifest_name = "keops_bundle.json"
+bundle_prefixes = ("libKeOpsnumpy", "libKeOpstorch")
+
+
+def get_module_lang(dll_name):
+    """
+    Return the language ("numpy" or "torch") of a keops module, as encoded in its name by create_name.
+    """
+    for prefix in bundle_prefixes:
+        if dll_name.startswith(prefix):
+            return prefix[len("libKeOps") :]
+
+
+def export_cache(path, dll_names=None):
+    """
+    Write the keops modules of pykeops.config.bin_folder (or only the ones listed in dll_names)
+    to the gzipped tarball path. The bundle can then be loaded in the cache of another machine
+    with import_cache(): since module names only depend on their content, the imported modules
+    are used as soon as the same formulas are requested, without any compilation.
+    """
+    bin_folder = pykeops.config.bin_folder
+    if dll_names is None:
+        dll_names = sorted(
+            f.name
+            for f in os.scandir(bin_folder)
+            if f.is_dir() and f.name.startswith(bundle_prefixes)
+        )
+
+    manifest = json.dumps(
+        {
+            "pykeops": version,
+            "python": sys.implementation.cache_tag,
+            "abi": {
+                lang: get_abi_fingerprint(lang)
+                for lang in sorted(set(get_module_lang(name) for name in dll_names))
+            },
+            "modules": dll_names,
+        },
+        indent=2,
+    ).encode("utf-8")
+
+    with tarfile.open(path, "w:gz") as tar:
+        info = tarfile.TarInfo(bundle_manifest_name)
+        info.size = len(manifest)
+        tar.addfile(info, io.BytesIO(manifest))
+        for dll_name in dll_names:
+            tar.add(os.path.join(bin_folder, dll_name), arcname=dll_name)
+
+    return dll_names
+
+
+def import_cache(path):
+    """
+    Extract a bundle written by export_cache() in pykeops.config.bin_folder and return the names
+    of the imported modules. The modules built for another binary interface than the local one
+    (see get_abi_fingerprint), which could never be used here, are skipped with a warning.
+    """
+    with tarfile.open(path, "r:gz") as tar:
+        try:
+            manifest = json.load(tar.extractfile(bundle_manifest_name))
+        except KeyError:
+            manifest = {}
+        abi = manifest.get("abi", {})
+        if isinstance(abi, str):  # bundles of numpy modules only
+            abi = {"numpy": abi}
+        local_abi = {}
+        for lang in abi:
+            try:
+                local_abi[lang] = get_abi_fingerprint(lang)
+            except ImportError:  # torch is not installed
+                pass
+
+        members, skipped = [], set()
+        for member in tar.getmembers():
+            if member.name == bundle_manifest_name:
+                continue
+            parts = member.name.split("/")
+            if (
+                not (member.isfile() or member.isdir())
+                or os.path.isabs(member.name)
+                or ".." in parts
+                or not parts[0].startswith(bundle_prefixes)
+            ):
+                raise ValueError(
+                    "[pyKeOps] Unexpected file in keops cache bundle "
+                    + path
+                    + ": "
+                    + member.name
+                )
+            lang = get_module_lang(parts[0])
+            if lang not in abi or abi[lang] != local_abi.get(lang):
+                skipped.add(parts[0])
+                continue
+            members.append(member)
+        if skipped:
+            warnings.warn(
+                "[pyKeOps] The keops modules {} of the cache bundle {} were built for another "
+                "binary interface and are not imported.".format(sorted(skipped), path)
+            )
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(pykeops.config.bin_folder, members=members, filter="data")
+        else:
+            tar.extractall(pykeops.config.bin_folder, members=members)
+
+    return sorted(set(member.name.split("/")[0] for member in members))
+
+
+def get_folder_size(path):
+    size = 0
+    for (root, _, files) in os.walk(path):
+        for f in files:
+            try:
+                size += os.lstat(os.path.join(root, f)).st_size
+            except OSError:  # removed in the meantime
+                pass
+    return size
+
+
+# last calls of touch_module with min_interval > 0, by module name
+_last_touch = {}
+
+
+def touch_module(dll_name, min_interval=0):
+    """
+    Record that the keops module dll_name of pykeops.config.bin_folder has just been used: the
+    last-use timestamp of a module is the modification time of its folder (see get_cache_entries).
+    The timestamp is left unchanged if it has been updated by this process less than min_interval
+    seconds ago.
+    """
+    now = time.time()
+    if (
+        min_interval > 0
+        and now - _last_touch.get(dll_name, -min_interval) < min_interval
+    ):
+        return
+    _last_touch[dll_name] = now
+    try:
+        os.utime(os.path.join(pykeops.config.bin_folder, dll_name))
+    except OSError:  # module found in a (read-only) shared cache folder
+        pass
+
+
+def open_module_lock(dll_name, path=None):
+    """
+    Open the lock file of the keops module dll_name of path (default: pykeops.config.bin_folder).
+    It is locked in shared mode while the module is imported, and in exclusive mode by evict_cache
+    while the module is removed. Return None if the module folder does not exist or is read-only.
+    """
+    path = pykeops.config.bin_folder if path is None else path
+    try:
+        return open(os.path.join(path, dll_name, "pykeops_module.lock"), "a")
+    except OSError:
+        return None
+
+
+def get_cache_entries(path=None):
+    """
+    Return the list of the keops modules of path (default: pykeops.config.bin_folder), from the least
+    to the most recently used. Each entry is a dict with keys "name", "size" (in bytes) and "last_use"
+    (a timestamp).
+    """
+    path = pykeops.config.bin_folder if path is None else path
+    entries = []
+    for f in os.scandir(path):
+        if f.is_dir(follow_symlinks=False) and f.name.startswith(bundle_prefixes):
+            entries.append(
+                {
+                    "name": f.name,
+                    "size": get_folder_size(f.path),
+                    "last_use": f.stat(follow_symlinks=False).st_mtime,
+                }
+            )
+    return sorted(entries, key=lambda entry: entry["last_use"])
+
+
+def cache_stats(path=None):
+    """
+    Return a dict describing the cache directory path (default: pykeops.config.bin_folder): the number
+    and total size (in bytes) of the compiled keops modules, the size of the build folders, the size
+    limit (pykeops.config.cache_size_limit) and the oldest and latest last-use timestamps of the modules.
+    """
+    path = pykeops.config.bin_folder if path is None else path
+    entries = get_cache_entries(path)
+    build_size = sum(
+        get_folder_size(f.path)
+        for f in os.scandir(path)
+        if f.is_dir(follow_symlinks=False) and f.name.startswith("build-")
+    )
+    return {
+        "bin_folder": path,
+        "modules": len(entries),
+        "modules_size": sum(entry["size"] for entry in entries),
+        "build_size": build_size,
+        "size_limit": pykeops.config.cache_size_limit,
+        "oldest_use": entries[0]["last_use"] if entries else None,
+        "latest_use": entries[-1]["last_use"] if entries else None,
+    }
+
+
+def evict_cache(size_limit=None, path=None, keep=()):
+    """
+    Remove the least recently used keops modules of path (default: pykeops.config.bin_folder) until
+    their total size is below size_limit bytes (default: pykeops.config.cache_size_limit, no limit if
+    None). The modules imported by the current process and the ones listed in keep are never removed,
+    nor the modules that are being imported by other processes. Return the names of the removed modules.
+    """
+    size_limit = pykeops.config.cache_size_limit if size_limit is None else size_limit
+    if size_limit is None:
+        return []
+    path = pykeops.config.bin_folder if path is None else path
+
+    entries = get_cache_entries(path)
+    size = sum(entry["size"] for entry in entries)
+    imported = set(name.split(".")[0] for name in sys.modules).union(keep)
+    removed = []
+    for entry in entries:
+        if size <= size_limit:
+            break
+        if entry["name"] in imported:
+            continue
+        lock = open_module_lock(entry["name"], path)
+        if lock is None:
+            continue
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:  # the module is being imported by another process
+                continue
+            shutil.rmtree(os.path.join(path, entry["name"]), ignore_errors=True)
+        size -= entry["size"]
+        removed.append(entry["name"])
+
+    if removed and pykeops.config.verbose:
+        print(
+            "[pyKeOps] Removed {} least recently used modules from {} ({} bytes left).".format(
+                len(removed), path, size
+            )
+        )
+    return removed
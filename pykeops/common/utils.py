@@ -5,12 +5,16 @@ import os
 import subprocess
 
 import pykeops.config
+from pykeops.common.set_path import get_cache_search_path
 
 c_type = dict(float16="half2", float32="float", float64="double")
 
 
 def module_exists(dllname, template_name):
-    if not os.path.exists(pykeops.config.bin_folder + os.path.sep + dllname):
+    if not any(
+        os.path.exists(folder + os.path.sep + dllname)
+        for folder in get_cache_search_path()
+    ):
         return False
     spec = importlib.util.find_spec(dllname + "." + template_name)
     return spec is not None
@@ -77,7 +81,8 @@ def create_and_lock_build_folder():
             # clean
             # if (pykeops.config.build_type == 'Release'): # and (module_exists(args[0].dll_name,template_name)):
             #    shutil.rmtree(bf)
-            os.remove(os.path.join(bf, "pykeops_build2.lock"))
+            # N.B.: the lock file is not removed, as a process waiting on it would otherwise
+            # hold a lock on a file that no other process can see anymore.
 
             return func_res
 
@@ -8,8 +8,26 @@ from pykeops.common.gpu_utils import get_gpu_number
 
 ##########################################################
 # Update config module: Search for GPU
+#
+# GPU detection loads the cuda driver, which is slow: it is only performed the first time
+# gpu_available is read (see __getattr__ below), i.e. when a backend is chosen, and the result is
+# stored in the module. It may be forced with the environment variable PYKEOPS_GPU_AVAILABLE (0 or 1)
+# or by setting pykeops.config.gpu_available directly.
+
+if "PYKEOPS_GPU_AVAILABLE" in os.environ:
+    gpu_available = bool(int(os.environ["PYKEOPS_GPU_AVAILABLE"]))
+
+# function used to detect GPUs. It is redefined by pykeops.torch to rely on torch.cuda.
+gpu_probe = lambda: get_gpu_number() > 0
+
+
+def __getattr__(name):
+    if name == "gpu_available":
+        global gpu_available
+        gpu_available = gpu_probe()
+        return gpu_available
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
 
-gpu_available = get_gpu_number() > 0
 
 numpy_found = importlib.util.find_spec("numpy") is not None
 torch_found = importlib.util.find_spec("torch") is not None
@@ -36,6 +54,15 @@ bin_folder = (
     ""  # init bin_folder... should be populated with the set_bin_folder() function
 )
 
+# Read-only cache directories (e.g. populated by "python -m pykeops.precompile" on a shared file system),
+# searched for keops modules before bin_folder. This is a list of paths, set with the environment variable
+# PYKEOPS_SHARED_CACHE (paths separated by os.pathsep) or the pykeops.set_shared_cache_folders() function.
+shared_cache_folders = (
+    [f for f in os.environ["PYKEOPS_SHARED_CACHE"].split(os.pathsep) if f]
+    if "PYKEOPS_SHARED_CACHE" in os.environ
+    else []
+)
+
 # Set the verbosity option: display output of compilations. This is a boolean: False or True
 verbose = (
     bool(int(os.environ["PYKEOPS_VERBOSE"]))
@@ -49,3 +76,60 @@ build_type = (
     if ("PYKEOPS_BUILD_TYPE" in os.environ)
     else "Release"
 )
+
+# Maximum number of imported keops modules kept in memory by pykeops.common.keops_io.module_cache
+module_cache_size = (
+    int(os.environ["PYKEOPS_MODULE_CACHE_SIZE"])
+    if "PYKEOPS_MODULE_CACHE_SIZE" in os.environ
+    else 128
+)
+
+# Allow on-the-fly compilation of missing keops modules. When set to False (e.g. in a deployment image
+# populated with "python -m pykeops.precompile"), requesting a module that is not in the cache raises an error.
+allow_compilation = (
+    bool(int(os.environ["PYKEOPS_ALLOW_COMPILATION"]))
+    if "PYKEOPS_ALLOW_COMPILATION" in os.environ
+    else True
+)
+
+# On cpu-only machines, compile the formulas with a direct call to the C++ compiler (cxx_compiler) instead
+# of cmake. This is faster and cmake is then only needed for gpu builds. Off by default: the compiler flags
+# only mimic the ones of cmake (see pykeops.common.compile_routines.get_direct_compile_flags).
+direct_compilation = (
+    bool(int(os.environ["PYKEOPS_DIRECT_COMPILATION"]))
+    if "PYKEOPS_DIRECT_COMPILATION" in os.environ
+    else False
+)
+cxx_compiler = os.environ["CXX"] if "CXX" in os.environ else "c++"
+
+# Compile missing keops modules in a background thread. Meanwhile, the reductions are computed by a (much slower)
+# dense NumPy/PyTorch evaluation of the formula, see pykeops.common.fallback.
+async_compilation = (
+    bool(int(os.environ["PYKEOPS_ASYNC_COMPILATION"]))
+    if "PYKEOPS_ASYNC_COMPILATION" in os.environ
+    else False
+)
+
+# Maximum total size (in bytes) of the compiled modules of bin_folder. When it is exceeded after a compilation,
+# the least recently used modules are removed (see pykeops.common.set_path.evict_cache). None means no limit.
+cache_size_limit = (
+    int(os.environ["PYKEOPS_CACHE_SIZE_LIMIT"])
+    if "PYKEOPS_CACHE_SIZE_LIMIT" in os.environ
+    else None
+)
+
+# Number of threads of the cpu reductions (None means the OpenMP default, e.g. given by OMP_NUM_THREADS).
+# It may also be set for a single call with the num_threads option of the Genred and KernelSolve routines.
+num_threads = (
+    int(os.environ["PYKEOPS_NUM_THREADS"])
+    if "PYKEOPS_NUM_THREADS" in os.environ
+    else None
+)
+
+# Bind the k-th thread of the cpu reductions to the k-th cpu allowed for the process (Linux only), e.g. to
+# share a node between several processes started with disjoint cpu sets (taskset, numactl...).
+pin_threads = (
+    bool(int(os.environ["PYKEOPS_PIN_THREADS"]))
+    if "PYKEOPS_PIN_THREADS" in os.environ
+    else False
+)
@@ -16,6 +16,7 @@ from .generic.generic_ops import (
     generic_argkmin,
 )
 from .lazytensor.LazyTensor import LazyTensor, Vi, Vj, Pm
+from pykeops.common.parse_type import Alias
 
 __all__ = sorted(
     [
@@ -29,5 +30,6 @@ __all__ = sorted(
         "Vi",
         "Vj",
         "Pm",
+        "Alias",
     ]
 )
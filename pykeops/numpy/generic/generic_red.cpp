@@ -8,7 +8,7 @@
 
 #include "common/keops_io.h"
 
-using __NUMPYARRAY__ = pybind11::array_t< __TYPE__, pybind11::array::c_style >;
+using __NUMPYARRAY__ = pybind11::array_t< __TYPE__, pybind11::array::forcecast >;
 using __RANGEARRAY__ = pybind11::array_t< __INDEX__, pybind11::array::c_style >;
 
 
@@ -17,10 +17,10 @@ namespace keops_binders {
 //                  Template specialization (NumPy Arrays)                     //
 /////////////////////////////////////////////////////////////////////////////////
 
-// <__TYPE__, pybind11::array::c_style>  ensures 2 things whatever is the arguments:
-//  1) the precision used is __TYPE__ (float or double typically) on the device,
-//  2) everything is convert as contiguous before being loaded in memory
-// this is maybe not the best in term of performance... but at least it is safe.
+// <__TYPE__, pybind11::array::forcecast> ensures that the precision used is __TYPE__ (float or double
+// typically) on the device, whatever is the arguments. Arrays of the right dtype are not copied, even
+// if they are not contiguous: strided arrays are read in place by the dense Cpu routine, and the
+// Python binder makes them contiguous for the other ones.
 
 template<>
 int get_ndim(__NUMPYARRAY__ obj_ptri) {
@@ -39,7 +39,12 @@ __TYPE__* get_data(__NUMPYARRAY__ obj_ptri) {
 
 template<>
 bool is_contiguous(__NUMPYARRAY__ obj_ptri) {
-  return obj_ptri.c_style;  // always true because of pybind11::array::c_style
+  return obj_ptri.flags() & pybind11::array::c_style;
+}
+
+template<>
+int get_stride(__NUMPYARRAY__ obj_ptri, int l) {
+  return obj_ptri.strides(l) / (int) sizeof(__TYPE__);
 }
 
 template<>
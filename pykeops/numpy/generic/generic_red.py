@@ -1,13 +1,104 @@
 import numpy as np
 
-from pykeops.common.get_options import get_tag_backend
-from pykeops.common.keops_io import LoadKeOps
-from pykeops.common.operations import preprocess, postprocess
-from pykeops.common.parse_type import get_sizes, complete_aliases, get_optional_flags
+from pykeops.common.get_options import get_tag_backend, get_cpu_threads
+from pykeops.common.keops_io import load_keops_module
+from pykeops.common.operations import (
+    preprocess,
+    postprocess,
+    check_out,
+    check_arg_size,
+    postprocessed_reductions,
+)
+from pykeops.common.parse_type import (
+    get_sizes,
+    get_signature,
+    complete_aliases,
+    get_optional_flags,
+)
 from pykeops.common.utils import axis2cat
 from pykeops.numpy import default_dtype
 
 
+def contiguous_args(args, tagCpuGpu, tag1D2D, ranges):
+    r"""
+    Makes the input arrays of a KeOps routine contiguous, without copying those that may be read in place.
+
+    The dense ``"CPU"`` scheme reads variables with arbitrary strides of their lines
+    and columns, such as ``x[:, :3]`` or ``x.T``, as long as these are multiples
+    of the item size and there are no batch dimensions.
+    All the other schemes expect C-contiguous arrays.
+    """
+    strided = (
+        (tagCpuGpu, tag1D2D) == (0, 0)
+        and not ranges
+        and all(np.ndim(arg) <= 2 for arg in args)
+    )
+    return tuple(
+        arg
+        if strided
+        and isinstance(arg, np.ndarray)
+        and arg.flags.aligned
+        and all(s % arg.itemsize == 0 for s in arg.strides)
+        else np.ascontiguousarray(arg)
+        for arg in args
+    )
+
+
+class BoundGenred:
+    r"""
+    A :class:`numpy.Genred <pykeops.numpy.Genred>` routine, specialized for inputs of given shapes
+    and a given backend. Created by :meth:`Genred.bind`.
+    """
+
+    def __init__(
+        self, routine, args, backend="auto", device_id=-1, ranges=None, num_threads=None
+    ):
+        tagCpuGpu, tag1D2D, _ = get_tag_backend(backend, args)
+        num_threads, pin_threads = get_cpu_threads(num_threads)
+        if ranges is None:
+            ranges = ()  # To keep the same type
+        self.ranges = tuple(np.ascontiguousarray(r) for r in ranges)
+
+        self.nx, self.ny = get_sizes(routine.signature, *args)
+        self.nout, nred = (
+            (self.nx, self.ny) if routine.axis == 1 else (self.ny, self.nx)
+        )
+        check_arg_size(routine.reduction_op, nred, routine.dtype)
+
+        self.routine = routine
+        self.tags = (tagCpuGpu, tag1D2D, 0, device_id, num_threads, pin_threads)
+        self.postprocess = routine.reduction_op in postprocessed_reductions
+
+    def __call__(self, *args, out=None):
+        r"""
+        Apply the routine on NumPy arrays with the shapes given to :meth:`Genred.bind`.
+
+        The checks of :meth:`Genred.__call__` are skipped: the arrays should be C-contiguous
+        (or strided, with the dense ``"CPU"`` scheme), and an error is raised
+        by the KeOps binder if their shapes differ from the bound ones.
+
+        Keyword Args:
+            out (array, default=None): Pre-allocated output array, as in :meth:`Genred.__call__`.
+        """
+        if out is not None:
+            check_out(out, "numpy", self.routine.reduction_op, self.routine.dtype)
+
+        res = self.routine.myconv.genred_numpy(
+            *self.tags, out, self.ranges, self.nx, self.ny, *args
+        )
+
+        if not self.postprocess:
+            return res
+        return postprocess(
+            res,
+            "numpy",
+            self.routine.reduction_op,
+            self.nout,
+            self.routine.opt_arg,
+            self.routine.dtype,
+        )
+
+
 class Genred:
     r"""
     Creates a new generic operation.
@@ -78,7 +169,7 @@ class Genred:
                 that should be computed and reduced.
                 The correct syntax is described in the :doc:`documentation <../../Genred>`,
                 using appropriate :doc:`mathematical operations <../../../api/math-operations>`.
-            aliases (list of strings): A list of identifiers of the form ``"AL = TYPE(DIM)"``
+            aliases (list of strings or Alias objects): A list of identifiers of the form ``"AL = TYPE(DIM)"``
                 that specify the categories and dimensions of the input variables. Here:
 
                   - ``AL`` is an alphanumerical alias, used in the **formula**.
@@ -90,6 +181,9 @@ class Genred:
 
                   - ``DIM`` is an integer, the dimension of the current variable.
 
+                Aliases may also be given as parsed, immutable signature objects
+                such as ``Alias("AL", "TYPE", DIM)`` (see :class:`pykeops.numpy.Alias`).
+
                 As described below, :meth:`__call__` will expect as input Tensors whose
                 shape are compatible with **aliases**.
 
@@ -178,14 +272,23 @@ class Genred:
             + ")"
         )
         self.aliases = complete_aliases(self.formula, aliases)
+        self.signature = get_signature(self.aliases)
         self.dtype = dtype
-        self.myconv = LoadKeOps(
+        self.myconv = load_keops_module(
             self.formula, self.aliases, self.dtype, "numpy", self.optional_flags
-        ).import_module()
+        )
         self.axis = axis
         self.opt_arg = opt_arg
 
-    def __call__(self, *args, backend="auto", device_id=-1, ranges=None):
+    def __call__(
+        self,
+        *args,
+        backend="auto",
+        device_id=-1,
+        ranges=None,
+        num_threads=None,
+        out=None
+    ):
         r"""
         Apply the routine on arbitrary NumPy arrays.
 
@@ -213,6 +316,9 @@ class Genred:
 
                     - ``"auto"`` (default): let KeOps decide which backend is best suited to your data, based on the tensors' shapes. ``"GPU_1D"`` will be chosen in most cases.
                     - ``"CPU"``: use a simple C++ ``for`` loop on a single CPU core.
+                    - ``"CPU_tiled"``: on the CPU, process the output lines by blocks, with a `tiling <https://github.com/getkeops/keops/blob/master/keops/core/mapreduce/CpuConv_tiled.cpp>`_ of the reduction index that keeps the data in the CPU cache. This is usually faster for large problems.
+                    - ``"CPU_simd"``: as ``"CPU_tiled"``, but the formula is evaluated on `packs <https://github.com/getkeops/keops/blob/master/keops/core/mapreduce/CpuConv_simd.cpp>`_ of consecutive values of the reduction index with the vector instructions of the CPU (AVX2, AVX-512). This is usually faster for costly formulas in low dimension.
+                    - ``"CPU_2D"``: on the CPU, split the reduction index between the threads, as in the 2D scheme on the GPU. This is only useful when there are few output lines, and is then chosen automatically by ``"CPU"``.
                     - ``"GPU_1D"``: use a `simple multithreading scheme <https://github.com/getkeops/keops/blob/master/keops/core/GpuConv1D.cu>`_ on the GPU - basically, one thread per value of the output index.
                     - ``"GPU_2D"``: use a more sophisticated `2D parallelization scheme <https://github.com/getkeops/keops/blob/master/keops/core/GpuConv2D.cu>`_ on the GPU.
                     - ``"GPU"``: let KeOps decide which one of the ``"GPU_1D"`` or the ``"GPU_2D"`` scheme will run faster on the given input.
@@ -222,6 +328,20 @@ class Genred:
                 choose the default GPU. This parameter is only useful if your
                 system has access to several GPUs.
 
+            num_threads (int, default=None): Number of threads used by the CPU backends.
+                If **None**, we use ``pykeops.config.num_threads`` (environment variable
+                ``PYKEOPS_NUM_THREADS``) or, if it is not set either, the OpenMP default.
+                If ``pykeops.config.pin_threads`` is **True** (environment variable
+                ``PYKEOPS_PIN_THREADS=1``), the threads are bound to the cpus of the process.
+
+            out ((M,D) or (N,D) array, default=None): Pre-allocated output array.
+                If given, KeOps writes the result of the reduction directly in it
+                and returns it, instead of allocating a new array.
+                It should be a **C-contiguous**, writeable array with the
+                expected shape and the ``dtype`` of the routine.
+                This is not supported by the reductions whose output is post-processed
+                in Python (``SumSoftMaxWeight``, ``LogSumExp``, ``Min_ArgMin``, ``KMin``, ``ArgKMin``...).
+
             ranges (6-uple of integer arrays, None by default):
                 Ranges of integers that specify a
                 :doc:`block-sparse reduction scheme <../../sparsity>`
@@ -287,33 +407,71 @@ class Genred:
 
         # Get tags
         tagCpuGpu, tag1D2D, _ = get_tag_backend(backend, args)
+        num_threads, pin_threads = get_cpu_threads(num_threads)
         if ranges is None:
             ranges = ()  # To keep the same type
 
         # N.B.: KeOps C++ expects contiguous integer arrays as ranges
         ranges = tuple(np.ascontiguousarray(r) for r in ranges)
 
-        nx, ny = get_sizes(self.aliases, *args)
-        nout, nred = (nx, ny) if self.axis == 1 else (ny, nx)
-
-        if "Arg" in self.reduction_op:
-            # when using Arg type reductions,
-            # if nred is greater than 16 millions and dtype=float32, the result is not reliable
-            # because we encode indices as floats, so we raise an exception ;
-            # same with float16 type and nred>2048
-            if nred > 1.6e7 and self.dtype in ("float32", "float"):
+        if out is not None:
+            if not isinstance(out, np.ndarray) or not out.flags.writeable:
                 raise ValueError(
-                    "size of input array is too large for Arg type reduction with single precision. Use double precision."
-                )
-            elif nred > 2048 and self.dtype in ("float16", "half"):
-                raise ValueError(
-                    "size of input array is too large for Arg type reduction with float16 dtype.."
+                    "[pyKeOps] The 'out' argument should be a writeable NumPy array."
                 )
+            check_out(out, "numpy", self.reduction_op, self.dtype)
+
+        args = contiguous_args(args, tagCpuGpu, tag1D2D, ranges)
 
-        out = self.myconv.genred_numpy(
-            tagCpuGpu, tag1D2D, 0, device_id, ranges, nx, ny, *args
+        nx, ny = get_sizes(self.signature, *args)
+        nout, nred = (nx, ny) if self.axis == 1 else (ny, nx)
+
+        check_arg_size(self.reduction_op, nred, self.dtype)
+
+        res = self.myconv.genred_numpy(
+            tagCpuGpu,
+            tag1D2D,
+            0,
+            device_id,
+            num_threads,
+            pin_threads,
+            out,
+            ranges,
+            nx,
+            ny,
+            *args
         )
 
         return postprocess(
-            out, "numpy", self.reduction_op, nout, self.opt_arg, self.dtype
+            res, "numpy", self.reduction_op, nout, self.opt_arg, self.dtype
         )
+
+    def bind(self, *args, backend="auto", device_id=-1, ranges=None, num_threads=None):
+        r"""
+        Specialize the routine for repeated calls on arrays of fixed shapes.
+
+        The backend, the number of lines :math:`M` and :math:`N`, the ranges and the
+        post-processing of the output are computed once and for all, so that each call of the
+        returned function is a single call to the KeOps binary. This lowers the
+        overhead of :meth:`__call__` for small problems that are solved many times.
+
+        Args:
+            *args (arrays): Arrays with the shapes (and dtype) of the future inputs,
+                as in :meth:`__call__`. They are not stored.
+
+        Keyword Args:
+            backend (string), device_id (int), ranges (6-uple of integer arrays), num_threads (int):
+                Fixed options of the bound calls, as in :meth:`__call__`.
+
+        Returns:
+            A callable object ``f`` such that ``f(*args, out=None)`` is equivalent to
+            ``self(*args, backend=backend, device_id=device_id, ranges=ranges, num_threads=num_threads, out=out)``.
+
+        Example:
+            >>> fun = Genred("Exp(-SqDist(x,y))", ["x = Vi(3)", "y = Vj(3)"], axis=1)
+            >>> x, y = np.random.rand(100, 3), np.random.rand(200, 3)
+            >>> bound_fun = fun.bind(x, y, backend="CPU")
+            >>> for t in range(1000):
+            ...     a = bound_fun(x + t / 1000, y)
+        """
+        return BoundGenred(self, args, backend, device_id, ranges, num_threads)
@@ -1,10 +1,21 @@
 import numpy as np
 
-from pykeops.common.get_options import get_tag_backend
-from pykeops.common.keops_io import LoadKeOps
-from pykeops.common.operations import ConjugateGradientSolver
-from pykeops.common.parse_type import complete_aliases, get_optional_flags
+from pykeops.common.get_options import get_tag_backend, get_cpu_threads
+from pykeops.common.keops_io import load_keops_module
+from pykeops.common.operations import (
+    ConjugateGradientSolver,
+    ConjugateGradientInfo,
+    get_preconditioner,
+    fused_reduction,
+)
+from pykeops.common.parse_type import (
+    complete_aliases,
+    get_signature,
+    get_optional_flags,
+    get_sizes,
+)
 from pykeops.common.utils import axis2cat
+from pykeops.numpy.generic.generic_red import contiguous_args
 from pykeops.numpy import default_dtype
 
 
@@ -69,7 +80,7 @@ class KernelSolve:
                 that should be computed and reduced.
                 The correct syntax is described in the :doc:`documentation <../../Genred>`,
                 using appropriate :doc:`mathematical operations <../../../api/math-operations>`.
-            aliases (list of strings): A list of identifiers of the form ``"AL = TYPE(DIM)"``
+            aliases (list of strings or Alias objects): A list of identifiers of the form ``"AL = TYPE(DIM)"``
                 that specify the categories and dimensions of the input variables. Here:
 
                   - ``AL`` is an alphanumerical alias, used in the **formula**.
@@ -81,6 +92,9 @@ class KernelSolve:
 
                   - ``DIM`` is an integer, the dimension of the current variable.
 
+                Aliases may also be given as parsed, immutable signature objects
+                such as ``Alias("AL", "TYPE", DIM)`` (see :class:`pykeops.numpy.Alias`).
+
                 As described below, :meth:`__call__` will expect input arrays whose
                 shape are compatible with **aliases**.
             varinvalias (string): The alphanumerical **alias** of the variable with
@@ -148,29 +162,43 @@ class KernelSolve:
             reduction_op, dtype_acc, use_double_acc, sum_scheme, dtype, enable_chunks
         )
 
+        self.optional_flags = optional_flags.copy()  # without MULT_VAR_HIGHDIM
         if rec_multVar_highdim is not None:
             optional_flags += ["-DMULT_VAR_HIGHDIM=1"]
 
+        self.kernel_formula = formula
+        self.axis = axis
         self.aliases = complete_aliases(formula, aliases)
+        self.signature = get_signature(self.aliases)
         self.varinvalias = varinvalias
         self.dtype = dtype
-        self.myconv = LoadKeOps(
+        self.myconv = load_keops_module(
             self.formula, self.aliases, self.dtype, "numpy", optional_flags
-        ).import_module()
+        )
 
         if varinvalias[:4] == "Var(":
             # varinv is given directly as Var(*,*,*) so we just have to read the index
             varinvpos = int(varinvalias[4 : varinvalias.find(",")])
         else:
             # we need to recover index from alias
-            tmp = self.aliases.copy()
-            for (i, s) in enumerate(tmp):
-                tmp[i] = s[: s.find("=")].strip()
-            varinvpos = tmp.index(varinvalias)
+            varinvpos = [sig.name for sig in self.signature].index(varinvalias)
         self.varinvpos = varinvpos
 
     def __call__(
-        self, *args, backend="auto", device_id=-1, alpha=1e-10, eps=1e-6, ranges=None
+        self,
+        *args,
+        backend="auto",
+        device_id=-1,
+        alpha=1e-10,
+        eps=1e-6,
+        ranges=None,
+        num_threads=None,
+        method="vector",
+        x0=None,
+        max_iter=None,
+        rtol=0,
+        return_info=False,
+        precond=None,
     ):
         r"""
         To apply the routine on arbitrary NumPy arrays.
@@ -206,6 +234,10 @@ class KernelSolve:
                 choose the default GPU. This parameter is only useful if your
                 system has access to several GPUs.
 
+            num_threads (int, default=None): Number of threads used by the CPU backends,
+                as detailed in the documentation
+                of the :class:`numpy.Genred <pykeops.numpy.Genred>` module.
+
             ranges (6-uple of IntTensors, None by default):
                 Ranges of integers that specify a
                 :doc:`block-sparse reduction scheme <../../sparsity>`
@@ -217,6 +249,58 @@ class KernelSolve:
                 as we loop over all indices
                 :math:`i\in[0,M)` and :math:`j\in[0,N)`.
 
+            method (string, default = ``"vector"``): Specifies how a second member
+                with several columns is handled by the conjugate gradient solver:
+
+                  - **method** = ``"vector"``: the (M,D) or (N,D) second member is
+                    handled as a single vector, with a single step size per iteration.
+                  - **method** = ``"columns"``: the D linear systems follow independent
+                    conjugate gradient iterations, with their own step sizes and stopping
+                    criteria, but share the kernel reductions: each iteration performs a
+                    single reduction on all the columns that have not converged yet.
+                  - **method** = ``"block"``: block conjugate gradient, where the step of each
+                    column is computed in the span of the search directions of all the
+                    columns. This usually cuts the number of iterations when the columns
+                    are correlated, but requires them to be linearly independent.
+                  - **method** = ``"fused"``: same iterations as ``"vector"``, but each
+                    reduction also computes the scalar product :math:`\langle p, K_{xx} p\rangle`
+                    with the search direction :math:`p`, which saves a pass on the data per iteration.
+                    This compiles a second formula.
+
+            eps (float, default = 1e-6): Absolute tolerance: the iterations stop when the squared
+                norm of the residual is smaller than ``eps**2`` times its number of entries
+                (or, for the ``"columns"`` and ``"block"`` methods, when this holds for every column).
+
+            rtol (float, default = 0): Relative tolerance: the iterations also stop when the norm of
+                the residual (of each column) is smaller than **rtol** times the norm of the second member.
+
+            x0 ((M,D) or (N,D) array, default = None): Starting point of the iterations,
+                e.g. the solution of a similar system. If **None**, we start from zero.
+
+            max_iter (int, default = None): Maximum number of iterations.
+                If **None**, we iterate until convergence.
+
+            return_info (bool, default = False): If **True**, we also return a
+                :class:`ConjugateGradientInfo <pykeops.common.operations.ConjugateGradientInfo>`
+                object that reports the number of iterations and of kernel evaluations,
+                the history of the residuals and the convergence status of the solver.
+
+            precond (string, Preconditioner or function, default = None): Preconditioner
+                of the conjugate gradient iterations, which approximates the inverse of
+                :math:`\alpha \operatorname{Id} + K_{xx}`:
+
+                  - **precond** = ``"jacobi"``: inverse of the diagonal of the kernel matrix,
+                    which is extracted symbolically from the formula.
+                  - **precond** = ``"nystrom"``: low-rank (Nyström) approximation of the kernel matrix,
+                    built from a few of its columns with a randomly pivoted partial Cholesky decomposition.
+                    See :class:`NystromPreconditioner <pykeops.common.operations.NystromPreconditioner>`
+                    for its parameters.
+                  - a :class:`Preconditioner <pykeops.common.operations.Preconditioner>` object.
+                  - a function that takes as input an array with the shape of the second member
+                    and returns the product of the inverse of the preconditioner with it.
+
+                Preconditioners are built from the dense kernel matrix: they ignore the **ranges**.
+
         Returns:
             (M,D) or (N,D) array:
 
@@ -224,22 +308,100 @@ class KernelSolve:
             **2d-array** with :math:`M` or :math:`N` lines (if **axis** = 1
             or **axis** = 0, respectively) and a number of columns
             that is inferred from the **formula**.
+            If **return_info** is True, a ``(solution, info)`` pair is returned.
 
         """
         # Get tags
         tagCpuGpu, tag1D2D, _ = get_tag_backend(backend, args)
+        num_threads, pin_threads = get_cpu_threads(num_threads)
         varinv = args[self.varinvpos]
+        nx, ny = get_sizes(self.signature, *args)
 
         if ranges is None:
             ranges = ()  # ranges should be encoded as a tuple
 
+        args = contiguous_args(args, tagCpuGpu, tag1D2D, ranges)
+
         def linop(var):
             newargs = args[: self.varinvpos] + (var,) + args[self.varinvpos + 1 :]
             res = self.myconv.genred_numpy(
-                tagCpuGpu, tag1D2D, 0, device_id, ranges, *newargs
+                tagCpuGpu,
+                tag1D2D,
+                0,
+                device_id,
+                num_threads,
+                pin_threads,
+                None,
+                ranges,
+                nx,
+                ny,
+                *newargs,
             )
             if alpha:
                 res += alpha * var
             return res
 
-        return ConjugateGradientSolver("numpy", linop, varinv, eps=eps)
+        if method == "fused":
+            fusedconv = load_keops_module(
+                *fused_reduction(
+                    self.kernel_formula, self.aliases, self.varinvpos, self.axis
+                ),
+                self.dtype,
+                "numpy",
+                self.optional_flags,
+            )
+
+            # c = alpha / N, where N is the number of reduced indices (see fused_reduction).
+            # With ranges, N depends on the line and the ridge term is added afterwards.
+            ridge = 0 if ranges else alpha / (ny if self.axis == 1 else nx)
+            ridge = np.array([ridge], dtype=varinv.dtype)
+
+            def linop(var):
+                newargs = args[: self.varinvpos] + (var,) + args[self.varinvpos + 1 :]
+                res = fusedconv.genred_numpy(
+                    tagCpuGpu,
+                    tag1D2D,
+                    0,
+                    device_id,
+                    num_threads,
+                    pin_threads,
+                    None,
+                    ranges,
+                    nx,
+                    ny,
+                    *newargs,
+                    var,
+                    ridge,
+                )
+                # the last column holds the terms of the scalar product <var, K var>
+                res, vKv = np.ascontiguousarray(res[:, :-1]), res[:, -1].sum()
+                if alpha and ranges:
+                    res += alpha * var
+                    vKv += alpha * (var ** 2).sum()
+                return res, vKv
+
+        invprecondop = get_preconditioner(
+            "numpy",
+            precond,
+            self,
+            args,
+            alpha,
+            backend=backend,
+            device_id=device_id,
+            num_threads=num_threads or None,
+        )
+
+        info = ConjugateGradientInfo()
+        result = ConjugateGradientSolver(
+            "numpy",
+            linop,
+            varinv,
+            eps=eps,
+            precond=invprecondop,
+            method=method,
+            x0=None if x0 is None else np.ascontiguousarray(x0),
+            max_iter=max_iter,
+            rtol=rtol,
+            info=info,
+        )
+        return (result, info) if return_info else result
@@ -10,6 +10,15 @@ class numpytools:
     arraysum = np.sum
     exp = np.exp
     log = np.log
+    sqrt = np.sqrt
+    sin = np.sin
+    cos = np.cos
+    abs = np.abs
+    sign = np.sign
+    atan = np.arctan
+    asin = np.arcsin
+    acos = np.arccos
+    where = np.where
     Genred = Genred
     KernelSolve = KernelSolve
     swap_axes = np_swap_axes
@@ -34,6 +43,10 @@ class numpytools:
     def contiguous(x):
         return np.ascontiguousarray(x)
 
+    @staticmethod
+    def is_contiguous(x):
+        return x.flags.c_contiguous
+
     @staticmethod
     def numpy(x):
         return x
@@ -46,6 +59,18 @@ class numpytools:
     def solve(*args):
         return np.linalg.solve(*args)
 
+    @staticmethod
+    def diag(x):
+        return np.diag(x)
+
+    @staticmethod
+    def qr(x):
+        return np.linalg.qr(x)
+
+    @staticmethod
+    def eigh(x):
+        return np.linalg.eigh(x)
+
     @staticmethod
     def size(x):
         return x.size
@@ -90,6 +115,35 @@ class numpytools:
     def device(x):
         return "cpu"
 
+    @staticmethod
+    def ones_like(x):
+        return np.ones_like(x)
+
+    @staticmethod
+    def zeros_like(x):
+        return np.zeros_like(x)
+
+    @staticmethod
+    def concat(arrays, axis=-1):
+        return np.concatenate(arrays, axis=axis)
+
+    @staticmethod
+    def amax(x, axis):
+        return x.max(axis=axis)
+
+    @staticmethod
+    def amin(x, axis):
+        return x.min(axis=axis)
+
+    @staticmethod
+    def sort(x, axis):
+        ind = np.argsort(x, axis=axis, kind="stable")
+        return np.take_along_axis(x, ind, axis=axis), ind
+
+    @staticmethod
+    def astype(x, y):
+        return x.astype(y.dtype)
+
 
 def squared_distances(x, y):
     x_norm = (x ** 2).sum(1).reshape(-1, 1)
@@ -0,0 +1,388 @@
+r"""
+Ahead-of-time compilation of KeOps formulas.
+
+This module builds, once and for all, the shared objects needed by a list of
+reductions described in a json manifest, together with the gradient formulas
+that ``torch.Genred`` derives during back-propagation. It is meant to populate
+the :ref:`cache directory <part.cache>` when building a container image or a
+deployment bundle, so that no compilation is triggered at run time:
+
+.. code-block:: bash
+
+    python -m pykeops.precompile manifest.json -o pykeops.lock -j 4 --export kernels.tar.gz
+    python -m pykeops.precompile --check pykeops.lock
+
+Module names do not depend on the location of the cache directory, so that the bundle
+written with ``--export`` may be loaded on other machines (with the same python, pykeops
+and torch versions) with ``python -m pykeops.precompile --import kernels.tar.gz``.
+
+A manifest is a json file of the form:
+
+.. code-block:: json
+
+    {
+        "lang": "torch",
+        "formulas": [
+            {
+                "formula": "Exp(-SqDist(x,y)) * b",
+                "aliases": ["x = Vi(3)", "y = Vj(3)", "b = Vj(1)"],
+                "reduction_op": "Sum",
+                "axis": 1,
+                "dtypes": ["float32", "float64"],
+                "grad_order": 1
+            }
+        ]
+    }
+
+Each entry of ``"formulas"`` accepts the arguments of :class:`numpy.Genred <pykeops.numpy.Genred>`
+or :class:`torch.Genred <pykeops.torch.Genred>` (``reduction_op``, ``axis``, ``opt_arg``, ``formula2``,
+``dtype_acc``, ``use_double_acc``, ``sum_scheme``, ``enable_chunks``, ``optional_flags``,
+``rec_multVar_highdim``) together with a list of ``dtypes``, an optional ``lang`` that
+overrides the global one and a ``grad_order`` (torch only) giving the number of
+successive differentiations to prepare.
+
+The lockfile lists the shared objects that were built. Setting the environment variable
+``PYKEOPS_ALLOW_COMPILATION=0`` at run time turns any missing module into an error
+instead of a silent compilation.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import pykeops
+import pykeops.config
+from pykeops.common.compile_routines import get_pybind11_template_name
+from pykeops.common.keops_io import load_keops_modules
+from pykeops.common.operations import preprocess
+from pykeops.common.parse_type import complete_aliases, get_optional_flags, get_type
+from pykeops.common.set_path import create_name
+from pykeops.common.utils import axis2cat, module_exists
+
+lockfile_version = 1
+
+# reductions that torch.Genred cannot differentiate (see GenredAutograd.backward)
+not_differentiable = [
+    "Min_ArgMin_Reduction",
+    "Min_Reduction",
+    "Max_ArgMax_Reduction",
+    "Max_Reduction",
+    "KMin_ArgKMin_Reduction",
+    "KMin_Reduction",
+]
+
+
+def get_routines(entry, lang="numpy"):
+    r"""
+    Return the list of routines (one per dtype) that Genred compiles for a manifest entry.
+    Each routine is a dict holding the arguments of LoadKeOps.
+    """
+    lang = entry.get("lang", lang)
+    if lang not in ("numpy", "torch"):
+        raise ValueError(
+            "[pyKeOps] lang should be 'numpy' or 'torch' in precompile manifest, got "
+            + str(lang)
+        )
+    if "formula" not in entry or "aliases" not in entry:
+        raise ValueError(
+            "[pyKeOps] each entry of a precompile manifest needs a formula and a list of aliases."
+        )
+
+    include_dirs = []
+    if lang == "torch":
+        from pykeops.torch import default_dtype, include_dirs
+    else:
+        from pykeops.numpy import default_dtype
+
+    formula = entry["formula"]
+    reduction_op = entry.get("reduction_op", "Sum")
+    axis = entry.get("axis", 0)
+    opt_arg = entry.get("opt_arg", None)
+    rec_multVar_highdim = entry.get("rec_multVar_highdim", None)
+    grad_order = entry.get("grad_order", 0)
+    if grad_order and lang != "torch":
+        raise ValueError(
+            "[pyKeOps] gradient formulas can only be precompiled with lang='torch'."
+        )
+
+    reduction_op_internal, formula2 = preprocess(
+        reduction_op, entry.get("formula2", None)
+    )
+    str_opt_arg = "," + str(opt_arg) if opt_arg else ""
+    str_formula2 = "," + formula2 if formula2 else ""
+    formula = (
+        reduction_op_internal
+        + "_Reduction("
+        + formula
+        + str_opt_arg
+        + ","
+        + str(axis2cat(axis))
+        + str_formula2
+        + ")"
+    )
+    aliases = complete_aliases(formula, list(entry["aliases"]))
+
+    routines = []
+    for dtype in entry.get("dtypes", [default_dtype]):
+        # Mimic the order in which numpy.Genred and torch.GenredAutograd append their flags,
+        # as the flags are part of the name of the shared object.
+        optional_flags = list(entry.get("optional_flags", []))
+        if lang == "numpy" and rec_multVar_highdim is not None:
+            optional_flags += ["-DMULT_VAR_HIGHDIM=1"]
+        optional_flags += get_optional_flags(
+            reduction_op_internal,
+            entry.get("dtype_acc", "auto"),
+            entry.get("use_double_acc", False),
+            entry.get("sum_scheme", "auto"),
+            dtype,
+            entry.get("enable_chunks", True),
+        )
+        routines.append(
+            {
+                "formula": formula,
+                "aliases": aliases,
+                "dtype": dtype,
+                "lang": lang,
+                "optional_flags": optional_flags,
+                "include_dirs": include_dirs,
+                "rec_multVar_highdim": rec_multVar_highdim,
+                "grad_order": grad_order,
+            }
+        )
+    return routines
+
+
+def get_grad_routines(routine, myconv):
+    r"""
+    Return the gradient routines that torch.GenredAutograd.backward compiles for a routine,
+    given its compiled module myconv (which provides the dimension and category of the output).
+    """
+    if routine["grad_order"] <= 0 or any(
+        routine["formula"].startswith(red) for red in not_differentiable
+    ):
+        return []
+
+    formula, aliases = routine["formula"], routine["aliases"]
+    nargs = len(aliases)
+    eta = "Var(" + str(nargs) + "," + str(myconv.dimout) + "," + str(myconv.tagIJ) + ")"
+    resvar = (
+        "Var("
+        + str(nargs + 1)
+        + ","
+        + str(myconv.dimout)
+        + ","
+        + str(myconv.tagIJ)
+        + ")"
+    )
+
+    grad_routines = []
+    for (var_ind, sig) in enumerate(aliases):
+        _, cat, dim, pos = get_type(sig, position_in_list=var_ind)
+        var = "Var(" + str(pos) + "," + str(dim) + "," + str(cat) + ")"
+        formula_g = (
+            "Grad_WithSavedForward("
+            + formula
+            + ", "
+            + var
+            + ", "
+            + eta
+            + ", "
+            + resvar
+            + ")"
+        )
+        grad_routines.append(
+            dict(
+                routine,
+                formula=formula_g,
+                aliases=aliases + [eta, resvar],
+                rec_multVar_highdim=(
+                    nargs if pos == routine["rec_multVar_highdim"] else None
+                ),
+                grad_order=routine["grad_order"] - 1,
+            )
+        )
+    return grad_routines
+
+
+def get_load_args(routine):
+    r"""
+    Return the arguments of LoadKeOps for a routine, as a dict.
+    """
+    optional_flags = routine["optional_flags"]
+    if routine["lang"] == "torch" and routine["rec_multVar_highdim"] is not None:
+        # torch.GenredAutograd.forward adds this flag on the fly
+        optional_flags = optional_flags + ["-DMULT_VAR_HIGHDIM=1"]
+    return {
+        "formula": routine["formula"],
+        "aliases": routine["aliases"],
+        "dtype": routine["dtype"],
+        "lang": routine["lang"],
+        "optional_flags": optional_flags,
+        "include_dirs": routine["include_dirs"],
+    }
+
+
+def precompile(manifest, jobs=None):
+    r"""
+    Build all the shared objects required by a manifest (a dict, see the module documentation)
+    in pykeops.config.bin_folder and return the list of lockfile records.
+
+    Routines are compiled in batches with at most ``jobs`` parallel jobs. Gradient formulas
+    are compiled order after order, since their names depend on the output of the formula
+    they are derived from.
+    """
+    lang = manifest.get("lang", "numpy")
+    routines = [
+        routine
+        for entry in manifest.get("formulas", [])
+        for routine in get_routines(entry, lang)
+    ]
+
+    records, seen = [], set()
+    while routines:
+        specs = [get_load_args(routine) for routine in routines]
+        modules = load_keops_modules(specs, jobs)
+        next_routines = []
+        for (routine, spec, myconv) in zip(routines, specs, modules):
+            dll_name = create_name(
+                spec["formula"],
+                spec["aliases"],
+                spec["dtype"],
+                spec["lang"],
+                spec["optional_flags"],
+            )
+            if dll_name not in seen:
+                seen.add(dll_name)
+                records.append(
+                    dict(
+                        spec,
+                        dll_name=dll_name,
+                        template_name=get_pybind11_template_name(
+                            spec["dtype"], spec["lang"], spec["include_dirs"]
+                        ),
+                    )
+                )
+            next_routines += get_grad_routines(routine, myconv)
+        routines = next_routines
+    return records
+
+
+def write_lockfile(records, path):
+    lock = {
+        "version": lockfile_version,
+        "pykeops": pykeops.__version__,
+        "python": sys.implementation.cache_tag,
+        "bin_folder": os.path.realpath(pykeops.config.bin_folder),
+        "modules": records,
+    }
+    with open(path, "w") as f:
+        json.dump(lock, f, indent=2)
+
+
+def check_lockfile(path):
+    r"""
+    Return the list of records of a lockfile whose shared objects cannot be found in
+    pykeops.config.bin_folder.
+    """
+    with open(path, "r") as f:
+        lock = json.load(f)
+    if lock.get("version") != lockfile_version:
+        raise ValueError(
+            "[pyKeOps] Unsupported precompile lockfile version: "
+            + str(lock.get("version"))
+        )
+    return [
+        record
+        for record in lock["modules"]
+        if not module_exists(record["dll_name"], record["template_name"])
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m pykeops.precompile",
+        description="Ahead-of-time compilation of KeOps formulas.",
+    )
+    parser.add_argument("manifest", nargs="?", help="json manifest of formulas")
+    parser.add_argument(
+        "-o",
+        "--lockfile",
+        default="pykeops.lock",
+        help="path of the lockfile to write (default: pykeops.lock)",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None, help="number of parallel compilations"
+    )
+    parser.add_argument(
+        "--bin-folder", default=None, help="cache directory to populate"
+    )
+    parser.add_argument(
+        "--check",
+        metavar="LOCKFILE",
+        default=None,
+        help="check that all the modules listed in a lockfile are available",
+    )
+    parser.add_argument(
+        "--export",
+        metavar="BUNDLE",
+        default=None,
+        help="write the precompiled modules to a .tar.gz bundle",
+    )
+    parser.add_argument(
+        "--import",
+        dest="import_bundle",
+        metavar="BUNDLE",
+        default=None,
+        help="load the modules of a .tar.gz bundle in the cache directory",
+    )
+    args = parser.parse_args(argv)
+
+    if args.bin_folder is not None:
+        pykeops.set_bin_folder(args.bin_folder)
+
+    if args.import_bundle is not None:
+        dll_names = pykeops.import_cache(args.import_bundle)
+        print(
+            "[pyKeOps] Imported "
+            + str(len(dll_names))
+            + " modules in "
+            + os.path.realpath(pykeops.config.bin_folder)
+        )
+        if args.manifest is None and args.check is None:
+            return 0
+
+    if args.check is not None:
+        missing = check_lockfile(args.check)
+        for record in missing:
+            print(
+                "[pyKeOps] Missing module "
+                + record["dll_name"]
+                + ": "
+                + record["formula"]
+            )
+        return 1 if missing else 0
+
+    if args.manifest is None:
+        parser.error("a manifest, --check LOCKFILE or --import BUNDLE is required")
+
+    with open(args.manifest, "r") as f:
+        manifest = json.load(f)
+    records = precompile(manifest, jobs=args.jobs)
+    write_lockfile(records, args.lockfile)
+    print(
+        "[pyKeOps] Precompiled "
+        + str(len(records))
+        + " modules in "
+        + os.path.realpath(pykeops.config.bin_folder)
+        + ", lockfile written to "
+        + args.lockfile
+    )
+    if args.export is not None:
+        pykeops.export_cache(args.export, [record["dll_name"] for record in records])
+        print("[pyKeOps] Modules exported to " + args.export)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
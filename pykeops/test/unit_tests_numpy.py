@@ -437,6 +437,859 @@ class NumpyUnitTestCase(unittest.TestCase):
             self.assertTrue(res_keops.shape == res_numpy.shape)
             self.assertTrue(np.allclose(res_keops, res_numpy, atol=1e-3))
 
+    ############################################################
+    def test_module_cache(self):
+        ############################################################
+        from pykeops.numpy import Genred
+        from pykeops.common.keops_io import module_cache
+
+        formula = "SqDist(x,y)*b"
+        aliases = [
+            "x = Vi(" + str(self.D) + ")",
+            "y = Vj(" + str(self.D) + ")",
+            "b = Vj(" + str(self.E) + ")",
+        ]
+
+        module_cache.clear()
+        my_conv = Genred(formula, aliases, reduction_op="Sum", axis=1)
+        my_conv_bis = Genred(formula, aliases, reduction_op="Sum", axis=1)
+
+        # the second Genred reuses the module imported by the first one
+        self.assertTrue(my_conv.myconv is my_conv_bis.myconv)
+        info = module_cache.info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 1, 1))
+
+        module_cache.clear()
+        self.assertEqual(len(module_cache), 0)
+
+    ############################################################
+    def test_load_keops_modules(self):
+        ############################################################
+        from pykeops.common.keops_io import load_keops_modules
+
+        aliases = ["x = Vi(" + str(self.D) + ")", "y = Vj(" + str(self.D) + ")"]
+        specs = [
+            {
+                "formula": "Sum_Reduction(SqDist(x,y),0)",
+                "aliases": aliases,
+                "dtype": "float64",
+                "lang": "numpy",
+            },
+            {
+                "formula": "Sum_Reduction(Exp(-SqDist(x,y)),0)",
+                "aliases": aliases,
+                "dtype": "float64",
+                "lang": "numpy",
+            },
+        ]
+        # both formulas are compiled in the same batch
+        myconvs = load_keops_modules(specs, jobs=2)
+
+        for (myconv, fun) in zip(myconvs, [lambda d: d, lambda d: np.exp(-d)]):
+            gamma = myconv.genred_numpy(
+                0, 0, 0, -1, 0, 0, None, (), self.M, self.N, self.x, self.y
+            )
+            self.assertTrue(
+                np.allclose(
+                    gamma.ravel(),
+                    np.sum(fun(squared_distances(self.x, self.y)), axis=1),
+                    atol=1e-6,
+                )
+            )
+
+    ############################################################
+    def test_direct_compilation(self):
+        ############################################################
+        import tempfile
+        from pykeops.common.compile_routines import (
+            use_direct_compilation,
+            get_cxx_compiler_flags,
+            get_or_build_direct_template_object,
+        )
+        from pykeops.common.keops_io import LoadKeOps
+
+        direct_compilation = pykeops.config.direct_compilation
+        pykeops.config.direct_compilation = True
+        try:
+            if not use_direct_compilation("float64", "numpy"):
+                self.skipTest("direct compilation is not available")
+
+            aliases = ["x = Vi(" + str(self.D) + ")", "y = Vj(" + str(self.D) + ")"]
+            myconv = LoadKeOps(
+                "Sum_Reduction(Exp(-SqDist(x,y))*SqDist(x,y),0)",
+                aliases,
+                "float64",
+                "numpy",
+            ).import_module()
+            gamma = myconv.genred_numpy(
+                0, 0, 0, -1, 0, 0, None, (), self.M, self.N, self.x, self.y
+            )
+
+            sqd = squared_distances(self.x, self.y)
+            self.assertTrue(
+                np.allclose(
+                    gamma.ravel(), np.sum(np.exp(-sqd) * sqd, axis=1), atol=1e-6
+                )
+            )
+
+            cxx_compiler = pykeops.config.cxx_compiler
+            with tempfile.TemporaryDirectory() as tmp:
+                # a compiler without OpenMP support, as the clang of Apple: the formulas are
+                # compiled without OpenMP, as with cmake
+                no_openmp = os.path.join(tmp, "cxx_no_openmp.sh")
+                with open(no_openmp, "w") as f:
+                    f.write(
+                        "#!/bin/sh\n"
+                        'for arg in "$@"; do [ "$arg" = "-fopenmp" ] && exit 1; done\n'
+                        'exec {} "$@"\n'.format(cxx_compiler)
+                    )
+                os.chmod(no_openmp, 0o755)
+                self.assertEqual(get_cxx_compiler_flags(no_openmp)[0], [])
+                try:
+                    pykeops.config.cxx_compiler = no_openmp
+                    myconv = LoadKeOps(
+                        "Sum_Reduction(Exp(-SqDist(x,y))*SqDist(x,y)*SqDist(x,y),0)",
+                        aliases,
+                        "float64",
+                        "numpy",
+                    ).import_module()
+                    gamma = myconv.genred_numpy(
+                        0, 0, 0, -1, 0, 0, None, (), self.M, self.N, self.x, self.y
+                    )
+                    self.assertTrue(
+                        np.allclose(
+                            gamma.ravel(),
+                            np.sum(np.exp(-sqd) * sqd ** 2, axis=1),
+                            atol=1e-6,
+                        )
+                    )
+
+                    # a failing compiler is reported as such, and not by a missing file later on
+                    pykeops.config.cxx_compiler = "false"
+                    os.makedirs(os.path.join(tmp, "build"))
+                    with self.assertRaisesRegex(ImportError, "compilation of"):
+                        get_or_build_direct_template_object(
+                            "float64", "numpy", [], os.path.join(tmp, "build")
+                        )
+                finally:
+                    pykeops.config.cxx_compiler = cxx_compiler
+        finally:
+            pykeops.config.direct_compilation = direct_compilation
+
+    ############################################################
+    def test_async_compilation(self):
+        ############################################################
+        from pykeops.numpy import Genred
+        from pykeops.common.keops_io import AsyncKeOpsModule, module_cache
+
+        formula = "Exp(-SqDist(x,y)) * b + IntCst(2) * Elem(x,0) * b"
+        aliases = [
+            "x = Vi(" + str(self.D) + ")",
+            "y = Vj(" + str(self.D) + ")",
+            "b = Vj(" + str(self.E) + ")",
+        ]
+        expected = (
+            np.exp(-squared_distances(self.x, self.y)) + 2 * self.x[:, :1]
+        ) @ self.b
+
+        module_cache.clear()
+        pykeops.config.async_compilation = True
+        try:
+            my_conv = Genred(formula, aliases, reduction_op="Sum", axis=1)
+        finally:
+            pykeops.config.async_compilation = False
+
+        # computed by the fallback while the formula is compiled in the background
+        gamma = my_conv(self.x, self.y, self.b, backend="CPU")
+        self.assertTrue(np.allclose(gamma, expected, atol=1e-6))
+
+        if isinstance(my_conv.myconv, AsyncKeOpsModule):
+            my_conv.myconv.wait()
+            gamma = my_conv(self.x, self.y, self.b, backend="CPU")
+            self.assertTrue(np.allclose(gamma, expected, atol=1e-6))
+
+    ############################################################
+    def test_cache_bundle(self):
+        ############################################################
+        import io
+        import json
+        import shutil
+        import tarfile
+        import tempfile
+        from pykeops.numpy import Genred
+        from pykeops.common.compile_routines import get_pybind11_template_name
+        from pykeops.common.set_path import create_name
+        from pykeops.common.utils import module_exists
+
+        formula = "SqDist(x,y)"
+        aliases = ["x = Vi(" + str(self.D) + ")", "y = Vj(" + str(self.D) + ")"]
+
+        # module names do not depend on the cache directory
+        bin_folder = pykeops.config.bin_folder
+        name = create_name(formula, aliases, "float64", "numpy", [])
+        pykeops.config.bin_folder = tempfile.gettempdir()
+        try:
+            self.assertEqual(
+                name, create_name(formula, aliases, "float64", "numpy", [])
+            )
+        finally:
+            pykeops.config.bin_folder = bin_folder
+
+        my_conv = Genred(formula, aliases, axis=1)
+        dll_name = create_name(
+            my_conv.formula, my_conv.aliases, "float64", "numpy", my_conv.optional_flags
+        )
+        template_name = get_pybind11_template_name("float64", "numpy", [])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            bundle = os.path.join(tmp, "kernels.tar.gz")
+            self.assertEqual(pykeops.export_cache(bundle, [dll_name]), [dll_name])
+            shutil.rmtree(os.path.join(pykeops.config.bin_folder, dll_name))
+            self.assertFalse(module_exists(dll_name, template_name))
+            self.assertEqual(pykeops.import_cache(bundle), [dll_name])
+            self.assertTrue(module_exists(dll_name, template_name))
+
+            # the manifest records the binary interface of each language, and the modules
+            # built for another one are not imported
+            other_bundle = os.path.join(tmp, "other.tar.gz")
+            with tarfile.open(bundle, "r:gz") as tar, tarfile.open(
+                other_bundle, "w:gz"
+            ) as other:
+                for member in tar.getmembers():
+                    data = tar.extractfile(member) if member.isfile() else None
+                    if member.name == "keops_bundle.json":
+                        manifest = json.load(data)
+                        self.assertEqual(list(manifest["abi"]), ["numpy"])
+                        manifest["abi"]["numpy"] += ",other"
+                        data = json.dumps(manifest).encode("utf-8")
+                        member.size = len(data)
+                        data = io.BytesIO(data)
+                    other.addfile(member, data)
+            shutil.rmtree(os.path.join(pykeops.config.bin_folder, dll_name))
+            with self.assertWarns(UserWarning):
+                self.assertEqual(pykeops.import_cache(other_bundle), [])
+            self.assertFalse(module_exists(dll_name, template_name))
+            self.assertEqual(pykeops.import_cache(bundle), [dll_name])
+
+    ############################################################
+    def test_shared_cache_folders(self):
+        ############################################################
+        import importlib
+        import tempfile
+        from pykeops.common.compile_routines import get_pybind11_template_name
+        from pykeops.common.keops_io import load_keops_module, module_cache
+        from pykeops.common.set_path import create_name
+
+        # a formula that no other test compiles, whose module cannot have been imported yet
+        formula = "Sum_Reduction(SqDist(x,y)*Sqrt(SqDist(x,y)),0)"
+        aliases = ["x = Vi(7)", "y = Vj(7)"]
+        dll_name = create_name(formula, aliases, "float64", "numpy", [])
+        template_name = get_pybind11_template_name("float64", "numpy", [])
+        module_names = (dll_name + "." + template_name, dll_name)
+        imported = {name: sys.modules.pop(name, None) for name in module_names}
+        importlib.invalidate_caches()
+
+        with tempfile.TemporaryDirectory() as shared:
+            # a fake module in a read-only shared cache is found before trying to compile anything
+            os.makedirs(os.path.join(shared, dll_name))
+            with open(os.path.join(shared, dll_name, template_name + ".py"), "w") as f:
+                f.write("shared = True\n")
+
+            module_cache.clear()
+            pykeops.set_shared_cache_folders([shared])
+            try:
+                myconv = load_keops_module(formula, aliases, "float64", "numpy")
+                self.assertTrue(myconv.shared)
+            finally:
+                pykeops.set_shared_cache_folders([])
+                module_cache.clear()
+                for name in module_names:
+                    sys.modules.pop(name, None)
+                    if imported[name] is not None:
+                        sys.modules[name] = imported[name]
+
+    ############################################################
+    def test_cache_eviction(self):
+        ############################################################
+        import fcntl
+        import tempfile
+        from pykeops.common.set_path import open_module_lock
+        from pykeops.common.utils import FileLock
+
+        with tempfile.TemporaryDirectory() as path:
+            # three fake modules of 1000 bytes, used in the order 1, 0, 2
+            for (i, last_use) in enumerate([200, 100, 300]):
+                module_folder = os.path.join(path, "libKeOpsnumpy" + str(i))
+                os.makedirs(module_folder)
+                with open(os.path.join(module_folder, "module.so"), "wb") as f:
+                    f.write(b"\0" * 1000)
+                os.utime(module_folder, (last_use, last_use))
+            os.makedirs(os.path.join(path, "build-fake"))
+
+            stats = pykeops.cache_stats(path)
+            self.assertEqual((stats["modules"], stats["modules_size"]), (3, 3000))
+            self.assertEqual((stats["oldest_use"], stats["latest_use"]), (100, 300))
+
+            removed = pykeops.evict_cache(size_limit=1500, path=path)
+            self.assertEqual(removed, ["libKeOpsnumpy1", "libKeOpsnumpy0"])
+            self.assertEqual(pykeops.cache_stats(path)["modules_size"], 1000)
+            self.assertTrue(os.path.isdir(os.path.join(path, "build-fake")))
+
+            # a module that is being imported by another process is not removed
+            lock = open_module_lock("libKeOpsnumpy2", path)
+            with lock, FileLock(lock, fcntl.LOCK_SH):
+                self.assertEqual(pykeops.evict_cache(size_limit=0, path=path), [])
+            removed = pykeops.evict_cache(size_limit=0, path=path)
+            self.assertEqual(removed, ["libKeOpsnumpy2"])
+
+    ############################################################
+    def test_import_time(self):
+        ############################################################
+        import subprocess
+
+        # "import pykeops" must not probe the GPUs, nor the computation of a module name.
+        # The import time is only reported, as it depends on the load of the machine.
+        code = (
+            "import time; t = time.perf_counter(); import pykeops; t = time.perf_counter() - t; "
+            "from pykeops.common.set_path import create_name; "
+            "create_name('Sum_Reduction(x,0)', ['x=Vi(1)'], 'float64', 'numpy', []); "
+            "print(t, 'gpu_available' in vars(pykeops.config))"
+        )
+        env = dict(os.environ)
+        env.pop("PYKEOPS_GPU_AVAILABLE", None)
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."),
+            env=env,
+            stdout=subprocess.PIPE,
+            check=True,
+        )
+        import_time, gpu_probed = out.stdout.decode().split()[-2:]
+        self.assertEqual(gpu_probed, "False")
+        print("'import pykeops' took {:.3f}s.".format(float(import_time)))
+
+    ############################################################
+    def test_cpu_tiled(self):
+        ############################################################
+        from pykeops.numpy import Genred
+
+        # large enough to use several tiles of i and j indices
+        M, N = 1000, 3000
+        x, y, b = (
+            np.random.rand(M, self.D),
+            np.random.rand(N, self.D),
+            np.random.rand(N, 2),
+        )
+        variables = [
+            "x = Vi(" + str(self.D) + ")",
+            "y = Vj(" + str(self.D) + ")",
+            "b = Vj(2)",
+        ]
+
+        for t in self.type_to_test:
+            args = (x.astype(t), y.astype(t), b.astype(t))
+            for (reduction_op, formula) in [
+                ("Sum", "Exp(-SqDist(x,y)) * b"),
+                ("LogSumExp", "-SqDist(x,y) + Elem(b,0)"),
+                ("ArgMin", "SqDist(x,y)"),
+            ]:
+                my_routine = Genred(
+                    formula,
+                    variables,
+                    reduction_op=reduction_op,
+                    axis=1,
+                    dtype=t,
+                )
+                gamma_cpu = my_routine(*args, backend="CPU")
+                gamma_tiled = my_routine(*args, backend="CPU_tiled")
+                self.assertTrue(np.allclose(gamma_cpu, gamma_tiled, rtol=1e-4))
+
+    ############################################################
+    def test_cpu_simd(self):
+        ############################################################
+        from pykeops.numpy import Genred
+
+        # N is not a multiple of the size of the packs of j indices
+        M, N = 1000, 3001
+        x, y, b = (
+            np.random.rand(M, self.D),
+            np.random.rand(N, self.D),
+            np.random.rand(N, 2),
+        )
+        variables = [
+            "x = Vi(" + str(self.D) + ")",
+            "y = Vj(" + str(self.D) + ")",
+            "b = Vj(2)",
+        ]
+
+        for t in self.type_to_test:
+            args = (x.astype(t), y.astype(t), b.astype(t))
+            for (reduction_op, formula) in [
+                ("Sum", "Exp(-SqDist(x,y)) * b"),
+                ("LogSumExp", "-SqDist(x,y) + Elem(b,0)"),
+                ("ArgMin", "SqDist(x,y)"),
+            ]:
+                my_routine = Genred(
+                    formula,
+                    variables,
+                    reduction_op=reduction_op,
+                    axis=1,
+                    dtype=t,
+                )
+                gamma_cpu = my_routine(*args, backend="CPU")
+                gamma_simd = my_routine(*args, backend="CPU_simd")
+                self.assertTrue(np.allclose(gamma_cpu, gamma_simd, rtol=1e-4))
+
+    ############################################################
+    def test_cpu_2D(self):
+        ############################################################
+        from pykeops.numpy import Genred
+
+        # few output lines, several blocks of j indices
+        M, N = 3, 10000
+        x, y, b = (
+            np.random.rand(M, self.D),
+            np.random.rand(N, self.D),
+            np.random.rand(N, 2),
+        )
+        variables = [
+            "x = Vi(" + str(self.D) + ")",
+            "y = Vj(" + str(self.D) + ")",
+            "b = Vj(2)",
+        ]
+
+        for t in self.type_to_test:
+            args = (x.astype(t), y.astype(t), b.astype(t))
+            for (reduction_op, formula, opt_arg) in [
+                ("Sum", "Exp(-SqDist(x,y)) * b", None),
+                ("LogSumExp", "-SqDist(x,y) + Elem(b,0)", None),
+                ("ArgMin", "SqDist(x,y)", None),
+                ("ArgKMin", "SqDist(x,y)", 3),
+            ]:
+                my_routine = Genred(
+                    formula,
+                    variables,
+                    reduction_op=reduction_op,
+                    axis=1,
+                    dtype=t,
+                    opt_arg=opt_arg,
+                )
+                gamma_cpu = my_routine(*args, backend="CPU_tiled")
+                gamma_2D = my_routine(*args, backend="CPU_2D")
+                self.assertTrue(np.allclose(gamma_cpu, gamma_2D, rtol=1e-4))
+
+    ############################################################
+    def test_cpu_2D_double_acc(self):
+        ############################################################
+        from pykeops.numpy import Genred
+
+        # a single output line: the partial sums of the blocks of j indices are large
+        # and cancel out, so that rounding them to float32 would be noticeable
+        N = 100000
+        x = np.ones((1, 1), dtype="float32")
+        b = np.random.rand(N, 1).astype("float32")
+        b[: N // 2] += 1000.1
+        b[N // 2 :] -= 1000.1
+        gamma = b.astype("float64").sum(0)
+
+        my_routine = Genred(
+            "x * b",
+            ["x = Vi(1)", "b = Vj(1)"],
+            reduction_op="Sum",
+            axis=1,
+            dtype="float32",
+            dtype_acc="float64",
+            sum_scheme="direct_sum",
+        )
+        gamma_1D = my_routine(x, b, backend="CPU_1D")
+        gamma_2D = my_routine(x, b, backend="CPU_2D")
+        self.assertTrue(np.allclose(gamma_1D.ravel(), gamma, rtol=1e-6))
+        self.assertTrue(np.allclose(gamma_2D.ravel(), gamma_1D.ravel(), rtol=1e-6))
+
+    ############################################################
+    def test_cpu_ranges(self):
+        ############################################################
+        from pykeops.numpy import Genred
+        from pykeops.numpy.cluster import (
+            grid_cluster,
+            cluster_ranges_centroids,
+            sort_clusters,
+            from_matrix,
+        )
+
+        # many small clusters of various sizes
+        M, N = 2000, 3000
+        x, y = np.random.rand(M, 2), np.random.rand(N, 2) ** 2
+        b = np.random.rand(N, 1)
+        x_labels, y_labels = grid_cluster(x, 0.1), grid_cluster(y, 0.1)
+        x_ranges, x_centroids, _ = cluster_ranges_centroids(x, x_labels)
+        y_ranges, y_centroids, _ = cluster_ranges_centroids(y, y_labels)
+        x, x_labels = sort_clusters(x, x_labels)
+        (y, b), y_labels = sort_clusters((y, b), y_labels)
+        keep = ((x_centroids[:, None, :] - y_centroids[None, :, :]) ** 2).sum(2) < 0.1
+        ranges_ij = from_matrix(x_ranges, y_ranges, keep)
+
+        my_routine = Genred(
+            "Exp(-SqDist(x,y)) * b",
+            ["x = Vi(2)", "y = Vj(2)", "b = Vj(1)"],
+            reduction_op="Sum",
+            axis=1,
+        )
+        gamma = my_routine(x, y, b, backend="CPU", ranges=ranges_ij)
+
+        # dense computation, restricted to the pairs of clusters that are kept
+        mask = keep[x_labels[:, None], y_labels[None, :]]
+        K = np.exp(-((x[:, None, :] - y[None, :, :]) ** 2).sum(2)) * mask
+        self.assertTrue(np.allclose(gamma, K @ b, rtol=1e-4))
+
+    ############################################################
+    def test_num_threads(self):
+        ############################################################
+        import pykeops.config
+        from pykeops.numpy import Genred
+
+        my_routine = Genred(
+            "Exp(-SqDist(x,y))",
+            ["x = Vi(" + str(self.D) + ")", "y = Vj(" + str(self.D) + ")"],
+            reduction_op="Sum",
+            axis=1,
+        )
+        gamma = np.sum(np.exp(-squared_distances(self.x, self.y)), axis=1)
+
+        # per call, and globally with pinned threads
+        for num_threads in [1, 2, None]:
+            gamma_keops = my_routine(
+                self.x, self.y, backend="CPU", num_threads=num_threads
+            )
+            self.assertTrue(np.allclose(gamma, gamma_keops.ravel(), atol=1e-6))
+        num_threads, pin_threads = (
+            pykeops.config.num_threads,
+            pykeops.config.pin_threads,
+        )
+        try:
+            pykeops.config.num_threads, pykeops.config.pin_threads = 2, True
+            gamma_keops = my_routine(self.x, self.y, backend="CPU")
+        finally:
+            pykeops.config.num_threads = num_threads
+            pykeops.config.pin_threads = pin_threads
+        self.assertTrue(np.allclose(gamma, gamma_keops.ravel(), atol=1e-6))
+
+        with self.assertRaises(ValueError):
+            my_routine(self.x, self.y, backend="CPU", num_threads=0)
+
+    ############################################################
+    def test_out_buffer(self):
+        ############################################################
+        from pykeops.numpy import Genred, LazyTensor
+
+        my_routine = Genred(
+            "Exp(-SqDist(x,y))",
+            ["x = Vi(" + str(self.D) + ")", "y = Vj(" + str(self.D) + ")"],
+            reduction_op="Sum",
+            axis=1,
+        )
+        gamma = np.sum(np.exp(-squared_distances(self.x, self.y)), axis=1)
+
+        # the result is written in the pre-allocated buffer, which is returned
+        out = np.zeros((self.M, 1))
+        gamma_keops = my_routine(self.x, self.y, backend="CPU", out=out)
+        self.assertTrue(gamma_keops is out)
+        self.assertTrue(np.allclose(gamma, out.ravel(), atol=1e-6))
+
+        out = np.zeros((self.M, 1))
+        x_i, y_j = LazyTensor(self.x[:, None, :]), LazyTensor(self.y[None, :, :])
+        (-((x_i - y_j) ** 2).sum(2)).exp().sum(1, backend="CPU", out=out)
+        self.assertTrue(np.allclose(gamma, out.ravel(), atol=1e-6))
+
+        # wrong dtype, contiguity, shape or reduction
+        for bad_out in [
+            np.zeros((self.M, 1), dtype="float32"),
+            np.zeros((self.M, 2))[:, :1],
+        ]:
+            with self.assertRaises(ValueError):
+                my_routine(self.x, self.y, backend="CPU", out=bad_out)
+        with self.assertRaises(RuntimeError):
+            my_routine(self.x, self.y, backend="CPU", out=np.zeros((self.N, 1)))
+        with self.assertRaises(ValueError):
+            x_i.sqdist(y_j).argmin(1, out=np.zeros((self.M, 1)))
+
+    ############################################################
+    def test_strided_inputs(self):
+        ############################################################
+        from pykeops.numpy import Genred
+
+        # views of larger arrays: sliced columns, transposed lines, reversed parameter
+        x = np.random.rand(self.M, 2 * self.D)[:, : self.D]
+        y = np.random.rand(self.D, 5000).T
+        b = np.random.rand(5000, 3)[:, 1:2]
+        p = np.random.rand(4)[::-2]
+        self.assertFalse(any(a.flags.c_contiguous for a in [x, y, b, p]))
+
+        my_routine = Genred(
+            "Exp(-Elem(p,0)*SqDist(x,y)) * b * Elem(p,1)",
+            ["x = Vi(" + str(self.D) + ")", "y = Vj(" + str(self.D) + ")"]
+            + ["b = Vj(1)", "p = Pm(2)"],
+            reduction_op="Sum",
+            axis=1,
+        )
+        gamma = np.exp(-p[0] * squared_distances(x, y)) @ b * p[1]
+
+        for backend in ["CPU", "CPU_tiled"]:
+            gamma_keops = my_routine(x, y, b, p, backend=backend)
+            self.assertTrue(np.allclose(gamma, gamma_keops))
+
+        # with few output lines, the reduction is split between the threads
+        gamma_keops = my_routine(x[:2], y, b, p, backend="CPU")
+        self.assertTrue(np.allclose(gamma[:2], gamma_keops))
+
+    ############################################################
+    def test_bind(self):
+        ############################################################
+        from pykeops.numpy import Genred
+
+        aliases = ["x = Vi(" + str(self.D) + ")", "y = Vj(" + str(self.D) + ")"]
+        my_routine = Genred("Exp(-SqDist(x,y))", aliases, reduction_op="Sum", axis=1)
+        my_argmin = Genred("SqDist(x,y)", aliases, reduction_op="ArgMin", axis=1)
+        bound_routine = my_routine.bind(self.x, self.y, backend="CPU")
+        bound_argmin = my_argmin.bind(self.x, self.y, backend="CPU")
+
+        for t in range(3):
+            x = self.x + t
+            self.assertTrue(
+                np.allclose(bound_routine(x, self.y), my_routine(x, self.y))
+            )
+            self.assertTrue(
+                np.array_equal(bound_argmin(x, self.y), my_argmin(x, self.y))
+            )
+
+        out = np.zeros((self.M, 1))
+        self.assertTrue(bound_routine(self.x, self.y, out=out) is out)
+        self.assertTrue(np.allclose(out, my_routine(self.x, self.y)))
+
+        # the shapes are checked by the KeOps binder
+        with self.assertRaises(RuntimeError):
+            bound_routine(self.x[:2], self.y)
+
+    ############################################################
+    def test_alias_signature(self):
+        ############################################################
+        from pykeops.numpy import Genred, Alias
+        from pykeops.common.parse_type import get_signature
+
+        x_alias = Alias("x", "Vi", self.D)
+        self.assertEqual(str(x_alias), "x = Vi(" + str(self.D) + ")")
+        self.assertEqual(Alias.parse(str(x_alias)), x_alias)
+        self.assertEqual(str(Alias(None, 2, 1, 3)), "Var(3,1,2)")
+
+        aliases = [x_alias, "y = Vj(" + str(self.D) + ")"]
+        self.assertEqual(
+            get_signature(aliases),
+            (Alias("x", "Vi", self.D, 0), Alias("y", "Vj", self.D, 1)),
+        )
+
+        my_routine = Genred("Exp(-SqDist(x,y))", aliases, reduction_op="Sum", axis=1)
+        my_routine_str = Genred(
+            "Exp(-SqDist(x,y))", [str(a) for a in aliases], reduction_op="Sum", axis=1
+        )
+        self.assertTrue(
+            np.allclose(
+                my_routine(self.x, self.y, backend="CPU"),
+                my_routine_str(self.x, self.y, backend="CPU"),
+            )
+        )
+
+        with self.assertRaises(ValueError):
+            Alias("x", "Vk", self.D)
+
+    ############################################################
+    def test_LazyTensor_formula_tree(self):
+        ############################################################
+        from pykeops.numpy import LazyTensor
+
+        x_i, y_j = LazyTensor(self.x[:, None, :]), LazyTensor(self.y[None, :, :])
+        D_ij = ((x_i - y_j) ** 2).sum(-1)
+
+        # formulas are graphs of hashable nodes, compared structurally
+        self.assertEqual(D_ij.tree, ((x_i - y_j) ** 2).sum(-1).tree)
+        self.assertEqual(hash(D_ij.tree), hash(((x_i - y_j) ** 2).sum(-1).tree))
+        self.assertNotEqual(D_ij.tree, ((x_i + y_j) ** 2).sum(-1).tree)
+        self.assertEqual(D_ij.t().t().tree, D_ij.tree)
+        self.assertEqual(
+            str(D_ij.t().sum(1, call=False)).split("\n")[1],
+            "    formula: Sum(Square((Var(0,3,1) - Var(1,3,0))))",
+        )
+        self.assertTrue(
+            np.allclose(D_ij.t().sum(1, backend="CPU"), D_ij.sum(0, backend="CPU"))
+        )
+
+        # deep expressions are neither limited by the recursion depth of Python nor quadratic
+        b_j = [LazyTensor(np.random.rand(1, self.N, 1)) for _ in range(5000)]
+        S_ij = D_ij
+        for b in b_j:
+            S_ij = S_ij + b
+        self.assertEqual(str(S_ij).count("Var("), 5002)
+
+    ############################################################
+    def test_solve_multiple_rhs(self):
+        ############################################################
+        from pykeops.numpy import KernelSolve
+
+        formula = "Exp(-SqDist(x,y)) * a"
+        aliases = ["x = Vi(" + str(self.D) + ")", "y = Vj(" + str(self.D) + ")"]
+        aliases += ["a = Vj(3)"]
+        Kinv = KernelSolve(formula, aliases, "a", axis=1)
+
+        x = np.random.rand(200, self.D)
+        # second members of very different scales
+        b = np.random.rand(200, 3) * np.array([1.0, 1e-3, 1e3])
+        K = np.exp(-squared_distances(x, x)) + 0.1 * np.eye(200)
+        a = np.linalg.solve(K, b)
+
+        for method in ["vector", "columns", "block"]:
+            a_keops = Kinv(x, x, b, alpha=0.1, eps=1e-10, method=method)
+            self.assertTrue(np.allclose(a, a_keops, rtol=1e-6, atol=1e-8))
+
+        with self.assertRaises(ValueError):
+            Kinv(x, x, b, alpha=0.1, method="unknown")
+
+    ############################################################
+    def test_solve_warm_start(self):
+        ############################################################
+        from pykeops.numpy import LazyTensor
+
+        x = np.random.rand(200, self.D)
+        b = np.random.rand(200, 2)
+        x_i, x_j = LazyTensor(x[:, None, :]), LazyTensor(x[None, :, :])
+        K_xx = (-((x_i - x_j) ** 2).sum(-1)).exp()
+        a = np.linalg.solve(np.exp(-squared_distances(x, x)) + 0.1 * np.eye(200), b)
+
+        for method in ["vector", "columns"]:
+            a0, info0 = K_xx.solve(
+                b, alpha=0.1, eps=1e-10, method=method, return_info=True
+            )
+            self.assertTrue(np.allclose(a, a0))
+            self.assertTrue(info0.converged)
+            self.assertEqual(len(info0.residuals), info0.iterations + 1)
+            self.assertEqual(info0.kernel_evaluations, info0.iterations)
+
+            # warm start from the solution of a close system
+            a1, info1 = K_xx.solve(
+                b + 1e-6, alpha=0.1, eps=1e-10, x0=a0, method=method, return_info=True
+            )
+            self.assertTrue(info1.converged)
+            self.assertTrue(info1.iterations < info0.iterations)
+            self.assertEqual(info1.kernel_evaluations, info1.iterations + 1)
+
+            # capped and relative stopping criteria
+            _, info = K_xx.solve(
+                b, alpha=0.1, max_iter=2, method=method, return_info=True
+            )
+            self.assertFalse(info.converged)
+            self.assertEqual(info.iterations, 2)
+            _, info = K_xx.solve(
+                b, alpha=0.1, eps=0, rtol=1e-3, method=method, return_info=True
+            )
+            self.assertTrue(info.converged)
+            self.assertTrue(info.iterations < info0.iterations)
+
+    ############################################################
+    def test_solve_preconditioners(self):
+        ############################################################
+        from pykeops.numpy import KernelSolve
+        from pykeops.common.operations import KernelOperator, NystromPreconditioner
+
+        x = np.random.rand(300, 3)
+        b = np.random.rand(300, 2)
+        g = np.array([2.0])
+        K = np.exp(-2 * squared_distances(x, x))
+        a = np.linalg.solve(K + 1e-3 * np.eye(300), b)
+
+        Kinv = KernelSolve(
+            "Exp(-SqDist(x,y)*g) * a",
+            ["x = Vi(3)", "y = Vj(3)", "a = Vj(2)", "g = Pm(1)"],
+            "a",
+            axis=1,
+            dtype="float64",
+        )
+
+        # entries of the kernel matrix, extracted from the formula
+        op = KernelOperator("numpy", Kinv, (x, x, b, g), 0.5)
+        self.assertTrue(np.allclose(op.diagonal(), 1.5))
+        self.assertTrue(np.allclose(op.column(7)[:, 1], K[:, 3] + 0.5 * np.eye(300)[3]))
+        self.assertTrue(np.allclose(op.column(7)[:, 0], 0))
+
+        kwargs = dict(alpha=1e-3, eps=1e-8, return_info=True)
+        _, info0 = Kinv(x, x, b, g, **kwargs)
+        for precond in [
+            "jacobi",
+            "nystrom",
+            NystromPreconditioner(rank=50, pivoting="greedy"),
+            lambda r: r / 2,
+        ]:
+            res, info = Kinv(x, x, b, g, precond=precond, **kwargs)
+            self.assertTrue(np.allclose(res, a, atol=1e-4))
+            if (
+                isinstance(precond, (str, NystromPreconditioner))
+                and precond != "jacobi"
+            ):
+                self.assertTrue(info.iterations < info0.iterations / 2)
+
+        with self.assertRaises(ValueError):
+            Kinv(x, x, b, g, precond="unknown")
+
+    ############################################################
+    def test_solve_fused(self):
+        ############################################################
+        from pykeops.numpy import LazyTensor
+
+        x = np.random.rand(200, self.D)
+        b = np.random.rand(200, 2)
+        x_i, x_j = LazyTensor(x[:, None, :]), LazyTensor(x[None, :, :])
+        K_xx = (-((x_i - x_j) ** 2).sum(-1)).exp()
+        a = np.linalg.solve(np.exp(-squared_distances(x, x)) + 0.1 * np.eye(200), b)
+
+        a0, info0 = K_xx.solve(b, alpha=0.1, eps=1e-10, return_info=True)
+        a1, info1 = K_xx.solve(
+            b, alpha=0.1, eps=1e-10, method="fused", return_info=True
+        )
+        self.assertTrue(np.allclose(a, a1))
+        self.assertTrue(abs(info1.iterations - info0.iterations) <= 1)
+        self.assertEqual(info1.kernel_evaluations, info1.iterations)
+
+        # warm start and preconditioning
+        a2, info2 = K_xx.solve(
+            b,
+            alpha=0.1,
+            eps=1e-10,
+            method="fused",
+            x0=a0,
+            precond="nystrom",
+            return_info=True,
+        )
+        self.assertTrue(np.allclose(a, a2))
+        self.assertTrue(info2.converged)
+
+    ############################################################
+    def test_LazyTensor_eigsh(self):
+        ############################################################
+        from pykeops.numpy import LazyTensor
+
+        x = np.random.rand(500, self.D)
+        x_i, x_j = LazyTensor(x[:, None, :]), LazyTensor(x[None, :, :])
+        K_xx = (-((x_i - x_j) ** 2).sum(-1) / 0.1).exp()
+        w, V = np.linalg.eigh(np.exp(-squared_distances(x, x) / 0.1))
+        w, V = w[::-1][:4], V[:, ::-1][:, :4]
+
+        lam, X = K_xx.eigsh(k=4, seed=0)
+        self.assertTrue(np.allclose(lam, w))
+        self.assertTrue(np.allclose(np.abs((X * V).sum(0)), 1))
+
+        lam, X = (-K_xx).eigsh(k=4, which="SA", X0=np.random.rand(500, 4))
+        self.assertTrue(np.allclose(lam, -w))
+
+        with self.assertRaises(ValueError):
+            K_xx.eigsh(k=200)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -330,7 +330,17 @@ class PytorchUnitTestCase(unittest.TestCase):
         # check output
         self.assertFalse(yc_tmp.is_contiguous())
         with self.assertRaises(RuntimeError):
-            my_routine(self.pc, self.xc, yc_tmp, backend="auto")
+            my_routine(self.pc, self.xc, yc_tmp, backend="CPU_tiled")
+
+        # ... but the dense CPU scheme reads strided tensors in place
+        gamma_keops = my_routine(
+            self.pc.cpu(),
+            self.xc.cpu(),
+            self.yc.cpu().t().contiguous().t(),
+            backend="CPU",
+        )
+        gamma = my_routine(self.pc.cpu(), self.xc.cpu(), self.yc.cpu(), backend="CPU")
+        self.assertTrue(torch.allclose(gamma, gamma_keops))
 
     ############################################################
     def test_heterogeneous_var_aliases(self):
@@ -673,6 +683,123 @@ class PytorchUnitTestCase(unittest.TestCase):
             torch.allclose(grad_keops.flatten(), grad_torch.flatten(), rtol=1e-4)
         )
 
+    ############################################################
+    def test_precompile(self):
+        ############################################################
+        import torch
+        from pykeops.torch import Genred
+        from pykeops.common.keops_io import module_cache
+        from pykeops.precompile import precompile
+
+        formula = "Exp(-SqDist(x,y)) * b"
+        aliases = ["x = Vi(3)", "y = Vj(3)", "b = Vj(3)"]
+        manifest = {
+            "lang": "torch",
+            "formulas": [
+                {
+                    "formula": formula,
+                    "aliases": aliases,
+                    "axis": 1,
+                    "dtypes": ["float32"],
+                    "grad_order": 1,
+                }
+            ],
+        }
+        records = precompile(manifest, jobs=2)
+        # forward formula + one gradient per variable
+        self.assertEqual(len(records), 4)
+
+        module_cache.clear()
+        pykeops.config.allow_compilation = False
+        try:
+            res = Genred(formula, aliases, axis=1, dtype="float32")(
+                self.xc, self.yc, self.bc
+            )
+            (g,) = torch.autograd.grad(res.sum(), self.xc)
+        finally:
+            pykeops.config.allow_compilation = True
+        self.assertEqual(g.shape, self.xc.shape)
+
+    ############################################################
+    def test_out_buffer(self):
+        ############################################################
+        import torch
+        from pykeops.torch import Genred
+
+        my_routine = Genred(
+            "Exp(-SqDist(x,y))",
+            ["x = Vi(" + str(self.D) + ")", "y = Vj(" + str(self.D) + ")"],
+            reduction_op="Sum",
+            axis=1,
+        )
+        x, y = self.xc.detach(), self.yc
+        gamma = my_routine(x, y)
+
+        # the result is written in the pre-allocated buffer, which is returned and marked as modified
+        out = torch.zeros(self.M, 1, dtype=x.dtype, device=x.device)
+        version = out._version
+        gamma_keops = my_routine(x, y, out=out)
+        self.assertTrue(gamma_keops is out)
+        self.assertGreater(out._version, version)
+        self.assertTrue(torch.allclose(gamma, out))
+
+        # inputs that require grad
+        with self.assertRaises(ValueError):
+            my_routine(self.xc, y, out=out)
+        with torch.no_grad():
+            self.assertTrue(my_routine(self.xc, y, out=out) is out)
+
+        # wrong device, dtype or contiguity
+        for bad_out in [
+            torch.zeros(self.M, 1, dtype=x.dtype, device="meta"),
+            torch.zeros(self.M, 1, dtype=torch.float64, device=x.device),
+            torch.zeros(self.M, 2, dtype=x.dtype, device=x.device)[:, :1],
+        ]:
+            with self.assertRaises(ValueError):
+                my_routine(x, y, out=bad_out)
+
+    ############################################################
+    def test_bind(self):
+        ############################################################
+        import torch
+        from pykeops.torch import Genred
+
+        aliases = ["x = Vi(" + str(self.D) + ")", "y = Vj(" + str(self.D) + ")"]
+        my_routine = Genred("Exp(-SqDist(x,y))", aliases, reduction_op="Sum", axis=1)
+        my_argmin = Genred("SqDist(x,y)", aliases, reduction_op="ArgMin", axis=1)
+        backend = "GPU" if self.use_cuda else "CPU"
+        bound_routine = my_routine.bind(self.xc, self.yc, backend=backend)
+        bound_argmin = my_argmin.bind(self.xc, self.yc, backend=backend)
+
+        # the sizes and the backend are computed once and for all
+        self.assertEqual((bound_routine.nx, bound_routine.ny), (self.M, self.N))
+        self.assertEqual(bound_routine.tags[0], 1 if self.use_cuda else 0)
+
+        # inputs that require grad go through the autograd engine...
+        res = bound_routine(self.xc, self.yc)
+        self.assertTrue(res.requires_grad)
+        (g_bound,) = torch.autograd.grad(res.sum(), self.xc)
+        (g_routine,) = torch.autograd.grad(my_routine(self.xc, self.yc).sum(), self.xc)
+        self.assertTrue(torch.allclose(g_bound, g_routine))
+
+        # ... which is bypassed otherwise
+        for t in range(3):
+            x = (self.xc + t).detach()
+            res = bound_routine(x, self.yc)
+            self.assertFalse(res.requires_grad)
+            self.assertTrue(torch.allclose(res, my_routine(x, self.yc)))
+            self.assertTrue(
+                torch.equal(bound_argmin(x, self.yc), my_argmin(x, self.yc))
+            )
+        x = self.xc.detach().clone().requires_grad_(False)
+        self.assertFalse(bound_routine(x, self.yc).requires_grad)
+
+        out = torch.zeros(self.M, 1, dtype=x.dtype, device=x.device)
+        self.assertTrue(bound_routine(x, self.yc, out=out) is out)
+        self.assertTrue(torch.allclose(out, my_routine(x, self.yc)))
+        with self.assertRaises(ValueError):
+            bound_routine(self.xc, self.yc, out=out)
+
 
 if __name__ == "__main__":
     """
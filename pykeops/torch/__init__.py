@@ -21,7 +21,7 @@ include_dirs = [
 ##########################################################
 # Get GPU informations
 
-pykeops.config.gpu_available = torch.cuda.is_available()  # use torch to detect gpu
+pykeops.config.gpu_probe = torch.cuda.is_available  # use torch to detect gpu
 default_dtype = "float32"
 
 ##########################################################
@@ -36,6 +36,7 @@ from .generic.generic_ops import (
 )
 from .operations import KernelSolve
 from .lazytensor.LazyTensor import LazyTensor, Vi, Vj, Pm
+from pykeops.common.parse_type import Alias
 
 __all__ = sorted(
     [
@@ -49,5 +50,6 @@ __all__ = sorted(
         "Vi",
         "Vj",
         "Pm",
+        "Alias",
     ]
 )
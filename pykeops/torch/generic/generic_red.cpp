@@ -32,6 +32,11 @@ bool is_contiguous(at::Tensor obj_ptri) {
   return obj_ptri.is_contiguous();
 }
 
+template <>
+int get_stride(at::Tensor obj_ptri, int l) {
+  return obj_ptri.stride(l);
+}
+
 #if USE_DOUBLE
   #define AT_kTYPE at::kDouble
   #define AT_TYPE double
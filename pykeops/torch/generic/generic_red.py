@@ -1,11 +1,17 @@
 import torch
 
-from pykeops.common.get_options import get_tag_backend
-from pykeops.common.keops_io import LoadKeOps
-from pykeops.common.operations import preprocess, postprocess
+from pykeops.common.get_options import get_tag_backend, get_cpu_threads
+from pykeops.common.keops_io import load_keops_module
+from pykeops.common.operations import (
+    preprocess,
+    postprocess,
+    check_out,
+    check_arg_size,
+    postprocessed_reductions,
+)
 from pykeops.torch.half2_convert import preprocess_half2, postprocess_half2
 from pykeops.common.parse_type import (
-    get_type,
+    get_signature,
     get_sizes,
     complete_aliases,
     get_optional_flags,
@@ -24,9 +30,12 @@ class GenredAutograd(torch.autograd.Function):
         ctx,
         formula,
         aliases,
+        signature,
         backend,
         dtype,
         device_id,
+        num_threads,
+        out,
         ranges,
         optional_flags,
         rec_multVar_highdim,
@@ -44,16 +53,18 @@ class GenredAutograd(torch.autograd.Function):
         if rec_multVar_highdim is not None:
             optional_flags += ["-DMULT_VAR_HIGHDIM=1"]
 
-        myconv = LoadKeOps(
+        myconv = load_keops_module(
             formula, aliases, dtype, "torch", optional_flags, include_dirs
-        ).import_module()
+        )
 
         # Context variables: save everything to compute the gradient:
         ctx.formula = formula
         ctx.aliases = aliases
+        ctx.signature = signature
         ctx.backend = backend
         ctx.dtype = dtype
         ctx.device_id = device_id
+        ctx.num_threads = num_threads
         ctx.ranges = ranges
         ctx.rec_multVar_highdim = rec_multVar_highdim
         ctx.myconv = myconv
@@ -76,10 +87,26 @@ class GenredAutograd(torch.autograd.Function):
         # N.B.: KeOps C++ expects contiguous integer arrays as ranges
         ranges = tuple(r.contiguous() for r in ranges)
 
+        num_threads, pin_threads = get_cpu_threads(num_threads)
+
         result = myconv.genred_pytorch(
-            tagCPUGPU, tag1D2D, tagHostDevice, device_id, ranges, nx, ny, *args
+            tagCPUGPU,
+            tag1D2D,
+            tagHostDevice,
+            device_id,
+            num_threads,
+            pin_threads,
+            out,
+            ranges,
+            nx,
+            ny,
+            *args
         )
 
+        if out is not None:
+            # the result has been written in place, in the user-provided buffer
+            ctx.mark_dirty(out)
+
         # relying on the 'ctx.saved_variables' attribute is necessary  if you want to be able to differentiate the output
         #  of the backward once again. It helps pytorch to keep track of 'who is who'.
         ctx.save_for_backward(*args, result)
@@ -90,11 +117,13 @@ class GenredAutograd(torch.autograd.Function):
     def backward(ctx, G):
         formula = ctx.formula
         aliases = ctx.aliases
+        signature = ctx.signature
         backend = ctx.backend
         dtype = ctx.dtype
         ranges = ctx.ranges
         optional_flags = ctx.optional_flags
         device_id = ctx.device_id
+        num_threads = ctx.num_threads
         myconv = ctx.myconv
         nx = ctx.nx
         ny = ctx.ny
@@ -149,15 +178,18 @@ class GenredAutograd(torch.autograd.Function):
             + ")"
         )
 
+        # the signature of the gradient routines, without parsing the aliases again
+        signature_g = signature + get_signature([eta, resvar])
+
         grads = []  # list of gradients wrt. args;
 
         for (var_ind, (sig, arg_ind)) in enumerate(
-            zip(aliases, args)
+            zip(signature, args)
         ):  # Run through the arguments
             # If the current gradient is to be discarded immediatly...
             if not ctx.needs_input_grad[
-                var_ind + 10
-            ]:  # because of (formula, aliases, backend, dtype, device_id, ranges, optional_flags, rec_multVar_highdim, nx, ny)
+                var_ind + 13
+            ]:  # because of (formula, aliases, signature, backend, dtype, device_id, num_threads, out, ranges, optional_flags, rec_multVar_highdim, nx, ny)
                 grads.append(None)  # Don't waste time computing it.
 
             else:
@@ -166,7 +198,7 @@ class GenredAutograd(torch.autograd.Function):
                 # New here (Joan) : we still add the new variables to the list of "aliases" (without
                 # giving new aliases for them) these will not be used in the C++ code,
                 # but are useful to keep track of the actual variables used in the formula
-                _, cat, dim, pos = get_type(sig, position_in_list=var_ind)
+                _, cat, dim, pos = sig
                 var = "Var(" + str(pos) + "," + str(dim) + "," + str(cat) + ")"  # V
                 formula_g = (
                     "Grad_WithSavedForward("
@@ -205,9 +237,12 @@ class GenredAutograd(torch.autograd.Function):
                     grad = genconv(
                         formula_g,
                         aliases_g,
+                        signature_g,
                         backend,
                         dtype,
                         device_id,
+                        num_threads,
+                        None,
                         ranges,
                         optional_flags,
                         rec_multVar_highdim,
@@ -234,9 +269,12 @@ class GenredAutograd(torch.autograd.Function):
                     grad = genconv(
                         formula_g,
                         aliases_g,
+                        signature_g,
                         backend,
                         dtype,
                         device_id,
+                        num_threads,
+                        None,
                         ranges,
                         optional_flags,
                         rec_multVar_highdim,
@@ -265,8 +303,129 @@ class GenredAutograd(torch.autograd.Function):
                 )  # The gradient should have the same shape as the input!
                 grads.append(grad)
 
-        # Grads wrt. formula, aliases, backend, dtype, device_id, ranges, optional_flags, rec_multVar_highdim, nx, ny, *args
-        return (None, None, None, None, None, None, None, None, None, None, *grads)
+        # Grads wrt. formula, aliases, signature, backend, dtype, device_id, num_threads, out, ranges, optional_flags, rec_multVar_highdim, nx, ny, *args
+        return (
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            *grads,
+        )
+
+
+class BoundGenred:
+    r"""
+    A :class:`torch.Genred <pykeops.torch.Genred>` routine, specialized for inputs of given shapes
+    and a given backend. Created by :meth:`Genred.bind`.
+    """
+
+    def __init__(
+        self, routine, args, backend="auto", device_id=-1, ranges=None, num_threads=None
+    ):
+        if routine.dtype in ("float16", "half"):
+            raise ValueError(
+                "[pyKeOps] Genred.bind is not supported with float16 computations."
+            )
+
+        self.routine = routine
+        self.options = (backend, device_id, num_threads, ranges)
+
+        self.nx, self.ny = get_sizes(routine.signature, *args)
+        self.nout, nred = (
+            (self.nx, self.ny) if routine.axis == 1 else (self.ny, self.nx)
+        )
+        check_arg_size(routine.reduction_op, nred, routine.dtype)
+
+        tagCPUGPU, tag1D2D, tagHostDevice = get_tag_backend(backend, args)
+        if tagCPUGPU == 1 & tagHostDevice == 1:
+            device_id = args[0].device.index
+        num_threads, pin_threads = get_cpu_threads(num_threads)
+        self.tags = (
+            tagCPUGPU,
+            tag1D2D,
+            tagHostDevice,
+            device_id,
+            num_threads,
+            pin_threads,
+        )
+        self.ranges = () if ranges is None else tuple(r.contiguous() for r in ranges)
+
+        # same module as in GenredAutograd.forward
+        optional_flags = list(routine.optional_flags)
+        if routine.rec_multVar_highdim is not None:
+            optional_flags += ["-DMULT_VAR_HIGHDIM=1"]
+        self.myconv = load_keops_module(
+            routine.formula,
+            routine.aliases,
+            routine.dtype,
+            "torch",
+            optional_flags,
+            include_dirs,
+        )
+        self.postprocess = routine.reduction_op in postprocessed_reductions
+
+    def __call__(self, *args, out=None):
+        r"""
+        Apply the routine on torch Tensors with the shapes given to :meth:`Genred.bind`.
+
+        The checks of :meth:`Genred.__call__` are skipped, and an error is raised
+        by the KeOps binder if the shapes of the Tensors differ from the bound ones.
+        If no gradient has to be computed, the autograd engine is bypassed.
+
+        Keyword Args:
+            out (Tensor, default=None): Pre-allocated output Tensor, as in :meth:`Genred.__call__`.
+        """
+        if torch.is_grad_enabled() and any(arg.requires_grad for arg in args):
+            if out is not None:
+                raise ValueError(
+                    "[pyKeOps] The 'out' argument does not support automatic differentiation: "
+                    "the input Tensors should not require grad."
+                )
+            backend, device_id, num_threads, ranges = self.options
+            res = GenredAutograd.apply(
+                self.routine.formula,
+                self.routine.aliases,
+                self.routine.signature,
+                backend,
+                self.routine.dtype,
+                device_id,
+                num_threads,
+                None,
+                ranges,
+                self.routine.optional_flags,
+                self.routine.rec_multVar_highdim,
+                self.nx,
+                self.ny,
+                *args
+            )
+        else:
+            if out is not None:
+                check_out(out, "torch", self.routine.reduction_op, self.routine.dtype)
+            res = self.myconv.genred_pytorch(
+                *self.tags, out, self.ranges, self.nx, self.ny, *args
+            )
+            if out is None:
+                res.requires_grad_(False)
+
+        if not self.postprocess:
+            return res
+        return postprocess(
+            res,
+            "torch",
+            self.routine.reduction_op,
+            self.nout,
+            self.routine.opt_arg,
+            self.routine.dtype,
+        )
 
 
 class Genred:
@@ -334,7 +493,7 @@ class Genred:
                 that should be computed and reduced.
                 The correct syntax is described in the :doc:`documentation <../../Genred>`,
                 using appropriate :doc:`mathematical operations <../../../api/math-operations>`.
-            aliases (list of strings): A list of identifiers of the form ``"AL = TYPE(DIM)"``
+            aliases (list of strings or Alias objects): A list of identifiers of the form ``"AL = TYPE(DIM)"``
                 that specify the categories and dimensions of the input variables. Here:
 
                   - ``AL`` is an alphanumerical alias, used in the **formula**.
@@ -346,6 +505,9 @@ class Genred:
 
                   - ``DIM`` is an integer, the dimension of the current variable.
 
+                Aliases may also be given as parsed, immutable signature objects
+                such as ``Alias("AL", "TYPE", DIM)`` (see :class:`pykeops.torch.Alias`).
+
                 As described below, :meth:`__call__` will expect as input Tensors whose
                 shape are compatible with **aliases**.
 
@@ -429,13 +591,22 @@ class Genred:
         self.aliases = complete_aliases(
             self.formula, list(aliases)
         )  # just in case the user provided a tuple
+        self.signature = get_signature(self.aliases)
         self.dtype = dtype
         self.axis = axis
         self.opt_arg = opt_arg
 
         self.rec_multVar_highdim = rec_multVar_highdim
 
-    def __call__(self, *args, backend="auto", device_id=-1, ranges=None):
+    def __call__(
+        self,
+        *args,
+        backend="auto",
+        device_id=-1,
+        ranges=None,
+        num_threads=None,
+        out=None
+    ):
         r"""
         To apply the routine on arbitrary torch Tensors.
 
@@ -462,6 +633,9 @@ class Genred:
 
                     - ``"auto"`` (default): let KeOps decide which backend is best suited to your data, based on the tensors' shapes. ``"GPU_1D"`` will be chosen in most cases.
                     - ``"CPU"``: use a simple C++ ``for`` loop on a single CPU core.
+                    - ``"CPU_tiled"``: on the CPU, process the output lines by blocks, with a `tiling <https://github.com/getkeops/keops/blob/master/keops/core/mapreduce/CpuConv_tiled.cpp>`_ of the reduction index that keeps the data in the CPU cache. This is usually faster for large problems.
+                    - ``"CPU_simd"``: as ``"CPU_tiled"``, but the formula is evaluated on `packs <https://github.com/getkeops/keops/blob/master/keops/core/mapreduce/CpuConv_simd.cpp>`_ of consecutive values of the reduction index with the vector instructions of the CPU (AVX2, AVX-512). This is usually faster for costly formulas in low dimension.
+                    - ``"CPU_2D"``: on the CPU, split the reduction index between the threads, as in the 2D scheme on the GPU. This is only useful when there are few output lines, and is then chosen automatically by ``"CPU"``.
                     - ``"GPU_1D"``: use a `simple multithreading scheme <https://github.com/getkeops/keops/blob/master/keops/core/GpuConv1D.cu>`_ on the GPU - basically, one thread per value of the output index.
                     - ``"GPU_2D"``: use a more sophisticated `2D parallelization scheme <https://github.com/getkeops/keops/blob/master/keops/core/GpuConv2D.cu>`_ on the GPU.
                     - ``"GPU"``: let KeOps decide which one of the ``"GPU_1D"`` or the ``"GPU_2D"`` scheme will run faster on the given input.
@@ -471,6 +645,22 @@ class Genred:
                 choose the default GPU. This parameter is only useful if your
                 system has access to several GPUs.
 
+            num_threads (int, default=None): Number of threads used by the CPU backends.
+                If **None**, we use ``pykeops.config.num_threads`` (environment variable
+                ``PYKEOPS_NUM_THREADS``) or, if it is not set either, the OpenMP default.
+                If ``pykeops.config.pin_threads`` is **True** (environment variable
+                ``PYKEOPS_PIN_THREADS=1``), the threads are bound to the cpus of the process.
+
+            out ((M,D) or (N,D) Tensor, default=None): Pre-allocated output Tensor.
+                If given, KeOps writes the result of the reduction directly in it
+                and returns it, instead of allocating a new Tensor.
+                It should be a **contiguous** Tensor with the expected shape,
+                the ``dtype`` of the routine and stored on the same device as the inputs.
+                As with the ``out`` argument of PyTorch functions, this is not
+                supported when gradients have to be computed, nor by the reductions
+                whose output is post-processed in Python
+                (``SumSoftMaxWeight``, ``LogSumExp``, ``Min_ArgMin``, ``KMin``, ``ArgKMin``...).
+
             ranges (6-uple of IntTensors, None by default):
                 Ranges of integers that specify a
                 :doc:`block-sparse reduction scheme <../../sparsity>`
@@ -543,34 +733,46 @@ class Genred:
 
         """
 
-        nx, ny = get_sizes(self.aliases, *args)
-        nout, nred = (nx, ny) if self.axis == 1 else (ny, nx)
-
-        if "Arg" in self.reduction_op:
-            # when using Arg type reductions,
-            # if nred is greater than 16 millions and dtype=float32, the result is not reliable
-            # because we encode indices as floats, so we raise an exception ;
-            # same with float16 type and nred>2048
-            if nred > 1.6e7 and self.dtype in ("float32", "float"):
+        if out is not None:
+            if not isinstance(out, torch.Tensor):
+                raise ValueError(
+                    "[pyKeOps] The 'out' argument should be a torch Tensor."
+                )
+            if torch.is_grad_enabled() and any(
+                isinstance(arg, torch.Tensor) and arg.requires_grad for arg in args
+            ):
                 raise ValueError(
-                    "size of input array is too large for Arg type reduction with single precision. Use double precision."
+                    "[pyKeOps] The 'out' argument does not support automatic differentiation: "
+                    "the input Tensors should not require grad."
                 )
-            elif nred > 2048 and self.dtype in ("float16", "half"):
+            if any(
+                isinstance(arg, torch.Tensor) and arg.device != out.device
+                for arg in args
+            ):
                 raise ValueError(
-                    "size of input array is too large for Arg type reduction with float16 dtype.."
+                    "[pyKeOps] The 'out' argument should be stored on the same device as the input Tensors."
                 )
+            check_out(out, "torch", self.reduction_op, self.dtype)
+
+        nx, ny = get_sizes(self.signature, *args)
+        nout, nred = (nx, ny) if self.axis == 1 else (ny, nx)
+
+        check_arg_size(self.reduction_op, nred, self.dtype)
 
         if self.dtype in ("float16", "half"):
             args, ranges, tag_dummy, N = preprocess_half2(
                 args, self.aliases, self.axis, ranges, nx, ny
             )
 
-        out = GenredAutograd.apply(
+        res = GenredAutograd.apply(
             self.formula,
             self.aliases,
+            self.signature,
             backend,
             self.dtype,
             device_id,
+            num_threads,
+            out,
             ranges,
             self.optional_flags,
             self.rec_multVar_highdim,
@@ -580,8 +782,39 @@ class Genred:
         )
 
         if self.dtype in ("float16", "half"):
-            out = postprocess_half2(out, tag_dummy, self.reduction_op, N)
+            res = postprocess_half2(res, tag_dummy, self.reduction_op, N)
 
         return postprocess(
-            out, "torch", self.reduction_op, nout, self.opt_arg, self.dtype
+            res, "torch", self.reduction_op, nout, self.opt_arg, self.dtype
         )
+
+    def bind(self, *args, backend="auto", device_id=-1, ranges=None, num_threads=None):
+        r"""
+        Specialize the routine for repeated calls on Tensors of fixed shapes.
+
+        The backend, the number of lines :math:`M` and :math:`N`, the ranges, the KeOps binary
+        and the post-processing of the output are computed once and for all, so that each call of the
+        returned function is a single call to the KeOps binary when no gradient is required.
+        This lowers the overhead of :meth:`__call__` for small problems that are solved many times.
+
+        Args:
+            *args (Tensors): Tensors with the shapes, dtype and device of the future inputs,
+                as in :meth:`__call__`. They are not stored.
+
+        Keyword Args:
+            backend (string), device_id (int), ranges (6-uple of IntTensors), num_threads (int):
+                Fixed options of the bound calls, as in :meth:`__call__`.
+
+        Returns:
+            A callable object ``f`` such that ``f(*args, out=None)`` is equivalent to
+            ``self(*args, backend=backend, device_id=device_id, ranges=ranges, num_threads=num_threads, out=out)``.
+
+        Example:
+            >>> fun = Genred("Exp(-SqDist(x,y))", ["x = Vi(3)", "y = Vj(3)"], axis=1)
+            >>> x, y = torch.randn(100, 3), torch.randn(200, 3)
+            >>> bound_fun = fun.bind(x, y, backend="CPU")
+            >>> with torch.no_grad():
+            ...     for t in range(1000):
+            ...         a = bound_fun(x + t / 1000, y)
+        """
+        return BoundGenred(self, args, backend, device_id, ranges, num_threads)
@@ -1,10 +1,15 @@
 import torch
 
-from pykeops.common.get_options import get_tag_backend
-from pykeops.common.keops_io import LoadKeOps
-from pykeops.common.operations import ConjugateGradientSolver
+from pykeops.common.get_options import get_tag_backend, get_cpu_threads
+from pykeops.common.keops_io import load_keops_module
+from pykeops.common.operations import (
+    ConjugateGradientSolver,
+    ConjugateGradientInfo,
+    get_preconditioner,
+    fused_reduction,
+)
 from pykeops.common.parse_type import (
-    get_type,
+    get_signature,
     get_sizes,
     complete_aliases,
     get_optional_flags,
@@ -25,18 +30,27 @@ class KernelSolveAutograd(torch.autograd.Function):
         ctx,
         formula,
         aliases,
+        signature,
         varinvpos,
         alpha,
         backend,
         dtype,
         device_id,
+        num_threads,
         eps,
+        method,
+        x0,
+        max_iter,
+        rtol,
+        info,
+        precond,
+        fusedconv,
         ranges,
         optional_flags,
         rec_multVar_highdim,
         nx,
         ny,
-        *args
+        *args,
     ):
 
         # N.B. when rec_multVar_highdim option is set, it means that formula is of the form "sum(F*b)", where b is a variable
@@ -46,21 +60,28 @@ class KernelSolveAutograd(torch.autograd.Function):
         # before adding the MULT_VAR_HIGHDIM compiler option.
         ctx.optional_flags = optional_flags.copy()
         if rec_multVar_highdim is not None:
-            optional_flags += ["-DMULT_VAR_HIGHDIM=1"]
+            optional_flags = optional_flags + ["-DMULT_VAR_HIGHDIM=1"]
 
-        myconv = LoadKeOps(
+        myconv = load_keops_module(
             formula, aliases, dtype, "torch", optional_flags, include_dirs
-        ).import_module()
+        )
 
         # Context variables: save everything to compute the gradient:
         ctx.formula = formula
         ctx.aliases = aliases
+        ctx.signature = signature
         ctx.varinvpos = varinvpos
         ctx.alpha = alpha
         ctx.backend = backend
         ctx.dtype = dtype
         ctx.device_id = device_id
+        ctx.num_threads = num_threads
         ctx.eps = eps
+        ctx.method = method
+        ctx.max_iter = max_iter
+        ctx.rtol = rtol
+        ctx.precond = precond
+        ctx.fusedconv = fusedconv
         ctx.nx = nx
         ctx.ny = ny
         ctx.myconv = myconv
@@ -83,17 +104,71 @@ class KernelSolveAutograd(torch.autograd.Function):
                         "[KeOps] Input arrays must be all located on the same device."
                     )
 
+        num_threads, pin_threads = get_cpu_threads(num_threads)
+
         def linop(var):
             newargs = args[:varinvpos] + (var,) + args[varinvpos + 1 :]
             res = myconv.genred_pytorch(
-                tagCPUGPU, tag1D2D, tagHostDevice, device_id, ranges, nx, ny, *newargs
+                tagCPUGPU,
+                tag1D2D,
+                tagHostDevice,
+                device_id,
+                num_threads,
+                pin_threads,
+                None,
+                ranges,
+                nx,
+                ny,
+                *newargs,
             )
             if alpha:
                 res += alpha * var
             return res
 
+        if method == "fused":
+
+            # c = alpha / N, where N is the number of reduced indices (see fused_reduction).
+            # With ranges, N depends on the line and the ridge term is added afterwards.
+            ridge = 0 if ranges else alpha / (ny if myconv.tagIJ == 0 else nx)
+            ridge = torch.tensor([ridge], dtype=varinv.dtype, device=varinv.device)
+
+            def linop(var):
+                newargs = args[:varinvpos] + (var,) + args[varinvpos + 1 :]
+                res = fusedconv.genred_pytorch(
+                    tagCPUGPU,
+                    tag1D2D,
+                    tagHostDevice,
+                    device_id,
+                    num_threads,
+                    pin_threads,
+                    None,
+                    ranges,
+                    nx,
+                    ny,
+                    *newargs,
+                    var,
+                    ridge,
+                )
+                # the last column holds the terms of the scalar product <var, K var>
+                res, vKv = res[:, :-1].contiguous(), res[:, -1].sum()
+                if alpha and ranges:
+                    res += alpha * var
+                    vKv += alpha * (var ** 2).sum()
+                return res, vKv
+
         global copy
-        result = ConjugateGradientSolver("torch", linop, varinv.data, eps)
+        result = ConjugateGradientSolver(
+            "torch",
+            linop,
+            varinv.data,
+            eps=eps,
+            method=method,
+            x0=x0,
+            max_iter=max_iter,
+            rtol=rtol,
+            info=info,
+            precond=precond,
+        )
 
         # relying on the 'ctx.saved_variables' attribute is necessary  if you want to be able to differentiate the output
         #  of the backward once again. It helps pytorch to keep track of 'who is who'.
@@ -105,12 +180,19 @@ class KernelSolveAutograd(torch.autograd.Function):
     def backward(ctx, G):
         formula = ctx.formula
         aliases = ctx.aliases
+        signature = ctx.signature
         varinvpos = ctx.varinvpos
         backend = ctx.backend
         alpha = ctx.alpha
         dtype = ctx.dtype
         device_id = ctx.device_id
+        num_threads = ctx.num_threads
         eps = ctx.eps
+        method = ctx.method
+        max_iter = ctx.max_iter
+        rtol = ctx.rtol
+        precond = ctx.precond
+        fusedconv = ctx.fusedconv
         nx = ctx.nx
         ny = ctx.ny
         myconv = ctx.myconv
@@ -150,27 +232,39 @@ class KernelSolveAutograd(torch.autograd.Function):
         KinvG = KernelSolveAutograd.apply(
             formula,
             aliases,
+            signature,
             varinvpos,
             alpha,
             backend,
             dtype,
             device_id,
+            num_threads,
             eps,
+            method,
+            None,
+            max_iter,
+            rtol,
+            None,
+            precond,
+            fusedconv,
             ranges,
             optional_flags,
             rec_multVar_highdim,
             nx,
             ny,
-            *newargs
+            *newargs,
         )
 
+        # the signature of the gradient routines, without parsing the aliases again
+        signature_g = signature + get_signature([eta, resvar])
+
         grads = []  # list of gradients wrt. args;
 
-        for (var_ind, sig) in enumerate(aliases):  # Run through the arguments
+        for (var_ind, sig) in enumerate(signature):  # Run through the arguments
             # If the current gradient is to be discarded immediatly...
             if not ctx.needs_input_grad[
-                var_ind + 13
-            ]:  # because of (formula, aliases, varinvpos, alpha, backend, dtype, device_id, eps, ranges, optional_flags, rec_multVar_highdim, nx, ny)
+                var_ind + 22
+            ]:  # because of (formula, aliases, signature, varinvpos, alpha, backend, dtype, device_id, num_threads, eps, method, x0, max_iter, rtol, info, precond, fusedconv, ranges, optional_flags, rec_multVar_highdim, nx, ny)
                 grads.append(None)  # Don't waste time computing it.
 
             else:  # Otherwise, the current gradient is really needed by the user:
@@ -183,7 +277,7 @@ class KernelSolveAutograd(torch.autograd.Function):
                     # New here (Joan) : we still add the new variables to the list of "aliases" (without giving new aliases for them)
                     # these will not be used in the C++ code,
                     # but are useful to keep track of the actual variables used in the formula
-                    _, cat, dim, pos = get_type(sig, position_in_list=var_ind)
+                    _, cat, dim, pos = sig
                     var = "Var(" + str(pos) + "," + str(dim) + "," + str(cat) + ")"  # V
                     formula_g = (
                         "Grad_WithSavedForward("
@@ -216,15 +310,18 @@ class KernelSolveAutograd(torch.autograd.Function):
                         grad = genconv(
                             formula_g,
                             aliases_g,
+                            signature_g,
                             backend,
                             dtype,
                             device_id,
+                            num_threads,
+                            None,
                             ranges,
                             optional_flags,
                             None,
                             nx,
                             ny,
-                            *args_g
+                            *args_g,
                         )
                         # Then, sum 'grad' wrt 'i' :
                         # I think that '.sum''s backward introduces non-contiguous arrays,
@@ -236,19 +333,22 @@ class KernelSolveAutograd(torch.autograd.Function):
                         grad = genconv(
                             formula_g,
                             aliases_g,
+                            signature_g,
                             backend,
                             dtype,
                             device_id,
+                            num_threads,
+                            None,
                             ranges,
                             optional_flags,
                             None,
                             nx,
                             ny,
-                            *args_g
+                            *args_g,
                         )
                     grads.append(grad)
 
-        # Grads wrt. formula, aliases, varinvpos, alpha, backend, dtype, device_id, eps, ranges, optional_flags, rec_multVar_highdim, *args
+        # Grads wrt. formula, aliases, signature, varinvpos, alpha, backend, dtype, device_id, num_threads, eps, method, x0, max_iter, rtol, info, precond, fusedconv, ranges, optional_flags, rec_multVar_highdim, nx, ny, *args
         return (
             None,
             None,
@@ -263,6 +363,15 @@ class KernelSolveAutograd(torch.autograd.Function):
             None,
             None,
             None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
             *grads,
         )
 
@@ -337,7 +446,7 @@ class KernelSolve:
                 that should be computed and reduced.
                 The correct syntax is described in the :doc:`documentation <../../Genred>`,
                 using appropriate :doc:`mathematical operations <../../../api/math-operations>`.
-            aliases (list of strings): A list of identifiers of the form ``"AL = TYPE(DIM)"``
+            aliases (list of strings or Alias objects): A list of identifiers of the form ``"AL = TYPE(DIM)"``
                 that specify the categories and dimensions of the input variables. Here:
 
                   - ``AL`` is an alphanumerical alias, used in the **formula**.
@@ -349,6 +458,9 @@ class KernelSolve:
 
                   - ``DIM`` is an integer, the dimension of the current variable.
 
+                Aliases may also be given as parsed, immutable signature objects
+                such as ``Alias("AL", "TYPE", DIM)`` (see :class:`pykeops.torch.Alias`).
+
                 As described below, :meth:`__call__` will expect input Tensors whose
                 shape are compatible with **aliases**.
             varinvalias (string): The alphanumerical **alias** of the variable with
@@ -411,24 +523,37 @@ class KernelSolve:
         self.formula = (
             reduction_op + "_Reduction(" + formula + "," + str(axis2cat(axis)) + ")"
         )
+        self.kernel_formula = formula
+        self.axis = axis
         self.aliases = complete_aliases(
             formula, list(aliases)
         )  # just in case the user provided a tuple
+        self.signature = get_signature(self.aliases)
         if varinvalias[:4] == "Var(":
             # varinv is given directly as Var(*,*,*) so we just have to read the index
             varinvpos = int(varinvalias[4 : varinvalias.find(",")])
         else:
             # we need to recover index from alias
-            tmp = self.aliases.copy()
-            for (i, s) in enumerate(tmp):
-                tmp[i] = s[: s.find("=")].strip()
-            varinvpos = tmp.index(varinvalias)
+            varinvpos = [sig.name for sig in self.signature].index(varinvalias)
         self.varinvpos = varinvpos
         self.dtype = dtype
         self.rec_multVar_highdim = rec_multVar_highdim
 
     def __call__(
-        self, *args, backend="auto", device_id=-1, alpha=1e-10, eps=1e-6, ranges=None
+        self,
+        *args,
+        backend="auto",
+        device_id=-1,
+        alpha=1e-10,
+        eps=1e-6,
+        ranges=None,
+        num_threads=None,
+        method="vector",
+        x0=None,
+        max_iter=None,
+        rtol=0,
+        return_info=False,
+        precond=None,
     ):
         r"""
         Apply the routine on arbitrary torch Tensors.
@@ -460,6 +585,10 @@ class KernelSolve:
                 choose the default GPU. This parameter is only useful if your
                 system has access to several GPUs.
 
+            num_threads (int, default=None): Number of threads used by the CPU backends,
+                as detailed in the documentation
+                of the :class:`torch.Genred <pykeops.torch.Genred>` module.
+
             ranges (6-uple of IntTensors, None by default): Ranges of integers
                 that specify a :doc:`block-sparse reduction scheme <../../sparsity>`
                 with *Mc clusters along axis 0* and *Nc clusters along axis 1*,
@@ -469,6 +598,59 @@ class KernelSolve:
                 If **None** (default), we simply use a **dense Kernel matrix**
                 as we loop over all indices :math:`i\in[0,M)` and :math:`j\in[0,N)`.
 
+            method (string, default = ``"vector"``): Specifies how a second member
+                with several columns is handled by the conjugate gradient solver:
+
+                  - **method** = ``"vector"``: the (M,D) or (N,D) second member is
+                    handled as a single vector, with a single step size per iteration.
+                  - **method** = ``"columns"``: the D linear systems follow independent
+                    conjugate gradient iterations, with their own step sizes and stopping
+                    criteria, but share the kernel reductions: each iteration performs a
+                    single reduction on all the columns that have not converged yet.
+                  - **method** = ``"block"``: block conjugate gradient, where the step of each
+                    column is computed in the span of the search directions of all the
+                    columns. This usually cuts the number of iterations when the columns
+                    are correlated, but requires them to be linearly independent.
+                  - **method** = ``"fused"``: same iterations as ``"vector"``, but each
+                    reduction also computes the scalar product :math:`\langle p, K_{xx} p\rangle`
+                    with the search direction :math:`p`, which saves a pass on the data per iteration.
+                    This compiles a second formula.
+
+            eps (float, default = 1e-6): Absolute tolerance: the iterations stop when the squared
+                norm of the residual is smaller than ``eps**2`` times its number of entries
+                (or, for the ``"columns"`` and ``"block"`` methods, when this holds for every column).
+
+            rtol (float, default = 0): Relative tolerance: the iterations also stop when the norm of
+                the residual (of each column) is smaller than **rtol** times the norm of the second member.
+
+            x0 ((M,D) or (N,D) Tensor, default = None): Starting point of the iterations,
+                e.g. the solution of a similar system. If **None**, we start from zero.
+
+            max_iter (int, default = None): Maximum number of iterations.
+                If **None**, we iterate until convergence.
+
+            return_info (bool, default = False): If **True**, we also return a
+                :class:`ConjugateGradientInfo <pykeops.common.operations.ConjugateGradientInfo>`
+                object that reports the number of iterations and of kernel evaluations,
+                the history of the residuals and the convergence status of the solver.
+
+            precond (string, Preconditioner or function, default = None): Preconditioner
+                of the conjugate gradient iterations, which approximates the inverse of
+                :math:`\alpha \operatorname{Id} + K_{xx}`:
+
+                  - **precond** = ``"jacobi"``: inverse of the diagonal of the kernel matrix,
+                    which is extracted symbolically from the formula.
+                  - **precond** = ``"nystrom"``: low-rank (Nyström) approximation of the kernel matrix,
+                    built from a few of its columns with a randomly pivoted partial Cholesky decomposition.
+                    See :class:`NystromPreconditioner <pykeops.common.operations.NystromPreconditioner>`
+                    for its parameters.
+                  - a :class:`Preconditioner <pykeops.common.operations.Preconditioner>` object.
+                  - a function that takes as input a tensor with the shape of the second member
+                    and returns the product of the inverse of the preconditioner with it.
+
+                Preconditioners are built from the dense kernel matrix: they ignore the **ranges**.
+                They are not differentiated, and are reused to solve the linear system of the backward pass.
+
         Returns:
             (M,D) or (N,D) Tensor:
 
@@ -478,24 +660,60 @@ class KernelSolve:
             **2d-tensor** with :math:`M` or :math:`N` lines (if **axis** = 1
             or **axis** = 0, respectively) and a number of columns
             that is inferred from the **formula**.
+            If **return_info** is True, a ``(solution, info)`` pair is returned.
 
         """
 
-        nx, ny = get_sizes(self.aliases, *args)
+        nx, ny = get_sizes(self.signature, *args)
+        info = ConjugateGradientInfo() if return_info else None
+
+        fusedconv = None
+        if method == "fused":
+            fusedconv = load_keops_module(
+                *fused_reduction(
+                    self.kernel_formula, self.aliases, self.varinvpos, self.axis
+                ),
+                self.dtype,
+                "torch",
+                self.optional_flags,
+                include_dirs,
+            )
+
+        with torch.no_grad():
+            invprecondop = get_preconditioner(
+                "torch",
+                precond,
+                self,
+                tuple(arg.detach() for arg in args),
+                alpha,
+                backend=backend,
+                device_id=device_id,
+                num_threads=num_threads,
+            )
 
-        return KernelSolveAutograd.apply(
+        result = KernelSolveAutograd.apply(
             self.formula,
             self.aliases,
+            self.signature,
             self.varinvpos,
             alpha,
             backend,
             self.dtype,
             device_id,
+            num_threads,
             eps,
+            method,
+            None if x0 is None else x0.detach().contiguous(),
+            max_iter,
+            rtol,
+            info,
+            invprecondop,
+            fusedconv,
             ranges,
             self.optional_flags,
             self.rec_multVar_highdim,
             nx,
             ny,
-            *args
+            *args,
         )
+        return (result, info) if return_info else result
@@ -16,6 +16,17 @@ class torchtools:
     exp = torch.exp
     log = torch.log
     norm = torch.norm
+    sqrt = torch.sqrt
+    sin = torch.sin
+    cos = torch.cos
+    abs = torch.abs
+    sign = torch.sign
+    atan = torch.atan
+    asin = torch.asin
+    acos = torch.acos
+    where = torch.where
+    ones_like = torch.ones_like
+    zeros_like = torch.zeros_like
 
     swap_axes = torch_swap_axes
 
@@ -40,10 +51,32 @@ class torchtools:
     def contiguous(x):
         return x.contiguous()
 
+    @staticmethod
+    def is_contiguous(x):
+        return x.is_contiguous()
+
     @staticmethod
     def solve(A, b):
+        if hasattr(torch, "linalg") and hasattr(torch.linalg, "solve"):
+            return torch.linalg.solve(A, b).contiguous()
         return torch.solve(b, A)[0].contiguous()
 
+    @staticmethod
+    def diag(x):
+        return torch.diag(x)
+
+    @staticmethod
+    def qr(x):
+        if hasattr(torch, "linalg") and hasattr(torch.linalg, "qr"):
+            return torch.linalg.qr(x)
+        return torch.qr(x)
+
+    @staticmethod
+    def eigh(x):
+        if hasattr(torch, "linalg") and hasattr(torch.linalg, "eigh"):
+            return torch.linalg.eigh(x)
+        return torch.symeig(x, eigenvectors=True)
+
     @staticmethod
     def arraysum(x, axis=None):
         return x.sum() if axis is None else x.sum(dim=axis)
@@ -127,6 +160,26 @@ class torchtools:
         else:
             return None
 
+    @staticmethod
+    def concat(tensors, axis=-1):
+        return torch.cat(tensors, dim=axis)
+
+    @staticmethod
+    def amax(x, axis):
+        return x.max(dim=axis)[0]
+
+    @staticmethod
+    def amin(x, axis):
+        return x.min(dim=axis)[0]
+
+    @staticmethod
+    def sort(x, axis):
+        return torch.sort(x, dim=axis)
+
+    @staticmethod
+    def astype(x, y):
+        return x.to(y.dtype)
+
 
 def squared_distances(x, y):
     x_norm = (x ** 2).sum(1).reshape(-1, 1)